@@ -0,0 +1,17 @@
+# answer_cache.py
+
+import os
+
+from upload_cache import ContentCache, content_hash, MB
+
+# Entries that overflow the in-memory answer cache are kept here
+ANSWER_CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", ".answer_cache")
+ANSWER_CACHE_MEMORY_BYTES = int(float(os.getenv("ANSWER_CACHE_MEMORY_MB", "8")) * MB)
+ANSWER_CACHE_DISK_BYTES = int(float(os.getenv("ANSWER_CACHE_DISK_MB", "64")) * MB)
+
+def answer_key(version, question):
+    """Cache key for a question against one index version, ignoring case and spacing."""
+    return content_hash(f"{version}\n{' '.join(question.lower().split())}")
+
+# Recent model answers, keyed by index version and question; served while the model is unavailable
+answer_cache = ContentCache("answers", ANSWER_CACHE_MEMORY_BYTES, ANSWER_CACHE_DISK_BYTES, ANSWER_CACHE_DIR)
@@ -141,10 +141,13 @@
 import streamlit as st
 from scraper import scrape_website
 from rag_pipeline import prepare_rag_pipeline, retrieve_relevant_chunks
+from intent_router import router
+from llm_client import call_with_retry, Deadline, LLMUnavailableError
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 import time
+import uuid
 from datetime import datetime
 import re
 
@@ -360,26 +363,20 @@ header {visibility: hidden;}
 </style>
 """, unsafe_allow_html=True)
 
-# Function to determine if question is MoreYeahs-related
-def is_moreyeahs_related(question):
-    """Check if the question is related to MoreYeahs"""
-    moreyeahs_keywords = [
-        'moreyeahs', 'more yeahs', 'company', 'service', 'services', 'product', 'products',
-        'pricing', 'price', 'cost', 'contact', 'support', 'team', 'about us', 'location',
-        'office', 'business', 'client', 'customer', 'portfolio', 'work', 'project'
-    ]
-    
-    question_lower = question.lower()
-    return any(keyword in question_lower for keyword in moreyeahs_keywords)
+def send_with_retry(chat, content, deadline):
+    """Send a chat message, retrying transient errors; fails fast while the Gemini circuit is open"""
+    return call_with_retry(lambda timeout: chat.send_message(content, request_options={'timeout': timeout}), deadline)
 
 # Function to get hybrid response
-def get_hybrid_response(question):
+def get_hybrid_response(question, route):
     """Get response using hybrid approach - RAG for MoreYeahs, Gemini for general"""
+    deadline = Deadline()
     
-    if is_moreyeahs_related(question):
+    if route.is_company:
         # Use RAG for MoreYeahs-related questions
+        relevant_chunks = []
         try:
-            relevant_chunks = retrieve_relevant_chunks(question)
+            relevant_chunks = retrieve_relevant_chunks(question, query_embedding=route.embedding)
             if relevant_chunks:
                 context = "\n---\n".join(relevant_chunks)
                 
@@ -400,7 +397,7 @@ Instructions:
 Answer:
 """
                 
-                response = st.session_state.chat_history.send_message(prompt)
+                response = send_with_retry(st.session_state.chat_history, prompt, deadline)
                 return response.text, "rag"
             else:
                 # Fallback to general response if no relevant chunks found
@@ -411,16 +408,25 @@ I don't have specific information about MoreYeahs in my knowledge base. Please p
 
 Be professional and helpful in your response.
 """
-                response = st.session_state.general_chat.send_message(prompt)
+                response = send_with_retry(st.session_state.general_chat, prompt, deadline)
                 return response.text, "general"
+        except LLMUnavailableError:
+            if relevant_chunks:
+                # Retrieval-only answer while the model is unreachable
+                excerpts = "\n\n".join(f"- {chunk.strip()[:600]}" for chunk in relevant_chunks[:3])
+                return ("I can't reach the AI model right now, but here is what the MoreYeahs website says that looks relevant:\n\n"
+                        f"{excerpts}"), "rag"
+            return "I apologize, but the AI service is temporarily unavailable. Please try again in a minute.", "error"
         except:
             # Fallback to general response on error
             pass
     
     # Use general Gemini for non-MoreYeahs questions
     try:
-        response = st.session_state.general_chat.send_message(question)
+        response = send_with_retry(st.session_state.general_chat, question, deadline)
         return response.text, "general"
+    except LLMUnavailableError:
+        return "I apologize, but the AI service is temporarily unavailable. Please try again in a minute.", "error"
     except Exception as e:
         return f"I apologize, but I encountered an error processing your question: {str(e)}", "error"
 
@@ -445,6 +451,8 @@ if 'chat_history' not in st.session_state:
     st.session_state.chat_history = model.start_chat(history=[])
 if 'general_chat' not in st.session_state:
     st.session_state.general_chat = model.start_chat(history=[])
+if 'router_session' not in st.session_state:
+    st.session_state.router_session = uuid.uuid4().hex
 
 # Knowledge base preparation
 if not st.session_state.knowledge_ready:
@@ -526,13 +534,14 @@ if st.session_state.knowledge_ready:
         try:
             # Show thinking indicator
             thinking_placeholder = st.empty()
-            if is_moreyeahs_related(question):
+            route = router.route(st.session_state.router_session, question)
+            if route.is_company:
                 thinking_placeholder.markdown(" Searching ...")
             else:
                 thinking_placeholder.markdown(" Thinking ...")
             
             # Get hybrid response
-            response_text, response_type = get_hybrid_response(question)
+            response_text, response_type = get_hybrid_response(question, route)
             
             # Clear thinking indicator
             thinking_placeholder.empty()
@@ -562,6 +571,7 @@ with st.sidebar:
         st.session_state.messages = []
         st.session_state.chat_history = model.start_chat(history=[])
         st.session_state.general_chat = model.start_chat(history=[])
+        router.forget(st.session_state.router_session)
         st.rerun()
     
     if st.button("🔄 Refresh MoreYeahs Knowledge", use_container_width=True):
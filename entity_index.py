@@ -0,0 +1,382 @@
+# entity_index.py
+
+import os
+import re
+import threading
+import time
+
+# Answer who-is / role / service lookups from the entity table, skipping retrieval and the model
+ENTITY_ANSWERS = os.getenv("ENTITY_ANSWERS", "1") == "1"
+# Trigram similarity a name or service mentioned in a question needs to match a table entry
+ENTITY_MIN_SIMILARITY = float(os.getenv("ENTITY_MIN_SIMILARITY", "0.6"))
+# Longer questions usually want more than a lookup
+ENTITY_MAX_WORDS = int(os.getenv("ENTITY_MAX_WORDS", "14"))
+MAX_BIO_CHARS = 600
+MAX_LISTED = 12
+
+# Job titles, as they appear on team cards and team photos
+ROLE_WORDS = (r"(?:co-?)?founder|ceo|cto|coo|cfo|chief [a-z]+ officer|chairman|president|vice president|vp|"
+              r"director|head|manager|lead|partner|architect|engineer|developer|designer|consultant|analyst")
+ROLE_PATTERN = re.compile(rf"\b({ROLE_WORDS})\b", re.IGNORECASE)
+
+# Roles people ask about, and the words in a title that mean them
+ROLE_ALIASES = {
+    'founder': ('founder', 'co-founder', 'cofounder'),
+    'ceo': ('ceo', 'chief executive'),
+    'cto': ('cto', 'chief technology', 'chief technical'),
+    'coo': ('coo', 'chief operating'),
+    'cfo': ('cfo', 'chief financial'),
+    'chairman': ('chairman',),
+    'president': ('president',),
+    'director': ('director',),
+    'hr': ('hr', 'human resources'),
+}
+ROLE_QUESTION = {
+    'founder': re.compile(r"\b(found(ed|er|ers)|co-?founders?|started)\b", re.IGNORECASE),
+    'ceo': re.compile(r"\b(ceo|chief executive)\b", re.IGNORECASE),
+    'cto': re.compile(r"\b(cto|chief technology|chief technical)\b", re.IGNORECASE),
+    'coo': re.compile(r"\b(coo|chief operating)\b", re.IGNORECASE),
+    'cfo': re.compile(r"\b(cfo|chief financial)\b", re.IGNORECASE),
+    'chairman': re.compile(r"\bchairman\b", re.IGNORECASE),
+    'president': re.compile(r"\bpresident\b", re.IGNORECASE),
+    'director': re.compile(r"\bdirectors?\b", re.IGNORECASE),
+    'hr': re.compile(r"\b(hr|human resources)\b", re.IGNORECASE),
+}
+# Role lookups answer who holds the role, not what the role is or does
+ROLE_LOOKUP_QUESTION = re.compile(r"\b(who|whom|whose)\b|\bnames?\s+of\b", re.IGNORECASE)
+# "Hi, who is the CEO?" is the same lookup as "who is the CEO?"
+GREETING = re.compile(
+    r"^\s*(hi|hello|hey|dear|thanks|thank you|ok|okay|good (morning|afternoon|evening))\b(\s+there\b)?[\s,.!]*",
+    re.IGNORECASE
+)
+LOOKUP_QUESTION = re.compile(
+    r"^\s*(who|what|which|whose|where|tell me about|give me|share|show me|list|do you (have|offer|provide)|"
+    r"does moreyeahs (have|offer|provide))\b", re.IGNORECASE
+)
+LINK_QUESTION = re.compile(r"\b(linkedin|profile|link|url|page)\b", re.IGNORECASE)
+SERVICES_QUESTION = re.compile(r"\b(services|offerings|solutions|products)\b", re.IGNORECASE)
+TEAM_QUESTION = re.compile(r"\b(team|leadership|management|leaders|people behind)\b", re.IGNORECASE)
+# Capitalized words in a question ("Google's CEO", "who founded Microsoft"); any that is not
+# MoreYeahs, a role or someone in the table names another organization
+CAPITALIZED_WORD = re.compile(r"\b[A-Z][\w&-]*")
+NOT_ORGANIZATION_WORDS = {
+    "moreyeahs", "i", "who", "whom", "whose", "what", "which", "where", "when", "how", "tell", "give", "share", "show",
+    "list", "do", "does", "is", "are", "the", "a", "an", "can", "could", "please", "your", "you", "our", "ceo", "cto",
+    "coo", "cfo", "hr", "vp", "md", "chief", "executive", "officer", "founder", "co-founder", "director", "president",
+    "chairman", "head", "manager", "team", "linkedin",
+    # Greetings and other words that start a sentence rather than name anything
+    "hi", "hello", "hey", "dear", "thanks", "thank", "ok", "okay", "so", "and", "also", "then", "now", "btw", "sorry",
+    "good", "morning", "afternoon", "evening", "yes", "no", "just", "may", "would", "name", "names",
+}
+
+# How sel.py writes the structured cards it finds into the page text
+ENTITY_SECTION = "People and services on this page:"
+ENTITY_LINE = re.compile(r"^(Person|Service): (.+)$")
+PAGE_HEADER = re.compile(r"^Content from (.+?)\s*$", re.MULTILINE)
+IMAGE_SECTION = "Text from images on this page:"
+
+NAME = r"[A-Z][a-z]+(?:\s+[A-Z]\.)?(?:\s+[A-Z][a-z]+){1,2}"
+# "Jane Doe, CEO & Founder" in OCR text from team photos and banners
+OCR_PERSON = re.compile(
+    rf"\b({NAME})\s*(?:[,|:\-–]\s*|\s+)((?:[A-Z][\w&.-]*\s+){{0,2}}?(?i:{ROLE_WORDS})"
+    rf"(?:\s*(?:&|and|,|/)\s*(?i:{ROLE_WORDS}))*(?:\s+of\s+(?:the\s+)?[A-Z][\w&-]*(?:\s+[A-Z][\w&-]*)?)?)\b"
+)
+FOUNDED_BY = re.compile(rf"\b(?:co-?)?founded\s+(?:in\s+\d{{4}}\s+)?by\s+({NAME})")
+NOT_NAME_WORDS = {
+    "our", "the", "meet", "team", "about", "contact", "services", "service", "moreyeahs", "we", "us", "home", "read",
+    "more", "view", "profile", "career", "careers", "product", "products", "case", "study", "web", "mobile", "app",
+    "development", "software", "digital", "cloud", "data", "business", "senior", "junior", "project", "and", "of",
+}
+
+def _normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def _trigrams(text):
+    text = f"  {_normalize(text)} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _clean_field(text):
+    return " ".join(str(text or "").replace("|", "/").split())
+
+def format_entity_lines(people, services):
+    """Lines sel.py appends to a page's text for the entity cards found in its DOM."""
+    lines = []
+    for person in people:
+        fields = [f"Person: {_clean_field(person.get('name'))}", f"Title: {_clean_field(person.get('title'))}"]
+        if person.get('link'):
+            fields.append(f"Link: {_clean_field(person['link'])}")
+        if person.get('bio'):
+            fields.append(f"Bio: {_clean_field(person['bio'])[:MAX_BIO_CHARS]}")
+        lines.append(" | ".join(fields))
+    for service in services:
+        fields = [f"Service: {_clean_field(service.get('name'))}"]
+        if service.get('description'):
+            fields.append(f"Description: {_clean_field(service['description'])}")
+        if service.get('link'):
+            fields.append(f"Link: {_clean_field(service['link'])}")
+        lines.append(" | ".join(fields))
+    return "\n".join(lines)
+
+def _parse_line(kind, rest):
+    fields = {}
+    parts = rest.split(" | ")
+    fields['name'] = parts[0].strip()
+    for part in parts[1:]:
+        key, _, value = part.partition(": ")
+        fields[key.strip().lower()] = value.strip()
+    return kind.lower(), fields
+
+def _pages(site_text):
+    """(url, text) for each scraped page; text before the first header has no url."""
+    headers = list(PAGE_HEADER.finditer(site_text))
+    if not headers:
+        return [(None, site_text)]
+    pages = [(None, site_text[:headers[0].start()])]
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(site_text)
+        pages.append((header.group(1), site_text[header.end():end]))
+    return pages
+
+def _clean_title(title):
+    # OCR runs cards together: drop words after the title that belong to the next line
+    words = title.strip(" ,.-/&").split()
+    while len(words) > 1 and words[-1].lower() in NOT_NAME_WORDS | {"of", "the"}:
+        words.pop()
+    return " ".join(words)
+
+def _looks_like_name(name):
+    words = name.lower().replace(".", " ").split()
+    return 2 <= len(words) <= 4 and not any(word in NOT_NAME_WORDS for word in words) \
+        and not ROLE_PATTERN.search(name)
+
+class Entity:
+    def __init__(self, kind, name, source=None):
+        self.kind = kind
+        self.name = name
+        self.title = ""
+        self.bio = ""
+        self.description = ""
+        self.link = ""
+        self.source = source
+        self.trigrams = _trigrams(name)
+
+    def merge(self, fields, source):
+        """Fill in fields this entity does not have yet (structured cards come first, so they win)."""
+        for field in ('title', 'bio', 'description', 'link'):
+            value = fields.get(field)
+            if value and not getattr(self, field):
+                setattr(self, field, value)
+        self.source = self.source or source
+
+    def has_role(self, role):
+        title = self.title.lower()
+        return any(re.search(rf"\b{re.escape(alias)}\b", title) for alias in ROLE_ALIASES[role])
+
+    def as_dict(self):
+        data = {'name': self.name, 'source': self.source}
+        for field in ('title', 'bio', 'description', 'link'):
+            if getattr(self, field):
+                data[field] = getattr(self, field)
+        return data
+
+class EntityAnswer:
+    def __init__(self, text, entities, method, source=None, latency_ms=0.0):
+        self.text = text
+        self.entities = entities
+        self.method = method
+        self.source = source
+        self.latency_ms = latency_ms
+
+class EntityIndex:
+    """
+    People (name, title, bio, profile link) and services (name,
+    description, link) extracted from the scraped site when the index is
+    built. The cards sel.py finds in the page structure come first; OCR
+    text from team photos and "founded by" mentions fill the gaps. Role
+    questions are a dictionary lookup; names and services mentioned in a
+    question are matched by character trigrams, so small spelling
+    differences still hit.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.people = {}    # normalized name -> Entity
+        self.services = {}  # normalized name -> Entity
+        self.roles = {}     # role -> [normalized names]
+        self.trigrams = {}  # trigram -> {(kind, normalized name)}
+        self.hits = 0
+        self.built_ms = 0.0
+        self._lock = threading.Lock()
+
+    def ensure(self, site_text, version):
+        """Rebuild the table when the index version changes."""
+        if not site_text or version is None or version == self.version:
+            return
+        self.build(site_text, version)
+
+    def build(self, site_text, version=None):
+        start = time.perf_counter()
+        people, services = {}, {}
+
+        def add(table, kind, fields, source):
+            name = fields.get('name', '').strip()
+            key = _normalize(name)
+            if not key:
+                return
+            if key not in table:
+                table[key] = Entity(kind, name, source)
+            table[key].merge(fields, source)
+
+        for url, text in _pages(site_text):
+            # Cards found in the page structure
+            for line in text.splitlines():
+                match = ENTITY_LINE.match(line.strip())
+                if match:
+                    kind, fields = _parse_line(*match.groups())
+                    if kind == 'person':
+                        add(people, 'person', fields, url)
+                    else:
+                        add(services, 'service', fields, url)
+            # Names next to job titles in text read from images
+            _, _, image_text = text.partition(IMAGE_SECTION)
+            for line in image_text.splitlines():
+                for name, title in OCR_PERSON.findall(line):
+                    if _looks_like_name(name):
+                        add(people, 'person', {'name': name, 'title': _clean_title(title)}, url)
+            for name in FOUNDED_BY.findall(text):
+                if _looks_like_name(name):
+                    key = _normalize(name)
+                    if key in people and not people[key].has_role('founder'):
+                        people[key].title = f"{people[key].title} & Founder" if people[key].title else "Founder"
+                    add(people, 'person', {'name': name, 'title': "Founder"}, url)
+
+        roles = {role: [key for key, person in people.items() if person.has_role(role)] for role in ROLE_ALIASES}
+        trigrams = {}
+        for kind, table in (('person', people), ('service', services)):
+            for key, entity in table.items():
+                for trigram in entity.trigrams:
+                    trigrams.setdefault(trigram, set()).add((kind, key))
+
+        with self._lock:
+            self.version = version
+            self.people, self.services = people, services
+            self.roles = {role: keys for role, keys in roles.items() if keys}
+            self.trigrams = trigrams
+            self.built_ms = (time.perf_counter() - start) * 1000
+        print(f" Entity table: {len(people)} people, {len(services)} services ({self.built_ms:.1f}ms)")
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self.people, self.services, self.roles, self.trigrams = {}, {}, {}, {}
+
+    def _match(self, question):
+        """Best (similarity, kind, key) for a name or service mentioned in the question."""
+        words = _normalize(question).split()
+        candidates = set()
+        for trigram in _trigrams(question):
+            candidates |= self.trigrams.get(trigram, set())
+        best = (0.0, None, None)
+        for kind, key in candidates:
+            entity = (self.people if kind == 'person' else self.services)[key]
+            length = len(key.split())
+            # Compare against spans of the question as long as the name, or a word longer
+            for size in range(length, length + 2):
+                for i in range(len(words) - size + 1):
+                    similarity = _similarity(entity.trigrams, _trigrams(" ".join(words[i:i + size])))
+                    if similarity > best[0]:
+                        best = (similarity, kind, key)
+        return best
+
+    def _describe(self, person, question):
+        if LINK_QUESTION.search(question) and person.link:
+            return f"{person.name}'s profile: {person.link}"
+        text = f"{person.name} is the {person.title} of MoreYeahs." if person.title else f"{person.name} is part of the MoreYeahs team."
+        if person.bio:
+            text += f" {person.bio}"
+        if person.link:
+            text += f"\nProfile: {person.link}"
+        return text
+
+    def lookup(self, question, company=True):
+        """
+        Answer a people, role or service lookup from the table; None when it
+        is not one. Questions not routed as company ones are only answered
+        when they name someone in the table.
+        """
+        question = GREETING.sub("", question)
+        if not ENTITY_ANSWERS or len(question.split()) > ENTITY_MAX_WORDS or not LOOKUP_QUESTION.search(question):
+            return None
+        start = time.perf_counter()
+        with self._lock:
+            answer = self._lookup(question, company)
+        if answer is None:
+            return None
+        answer.latency_ms = (time.perf_counter() - start) * 1000
+        self.hits += 1
+        print(f" Entity answer via {answer.method} ({', '.join(e.name for e in answer.entities)}) in {answer.latency_ms:.2f}ms")
+        return answer
+
+    def _names_other_organization(self, question):
+        known = {word for table in (self.people, self.services) for key in table for word in key.split()}
+        for word in CAPITALIZED_WORD.findall(question):
+            word = word.lower()
+            if word not in NOT_ORGANIZATION_WORDS and word not in known:
+                return True
+        return False
+
+    def _lookup(self, question, company):
+        similarity, kind, key = self._match(question) if self.trigrams else (0.0, None, None)
+        if similarity >= ENTITY_MIN_SIMILARITY and kind == 'person':
+            person = self.people[key]
+            return EntityAnswer(self._describe(person, question), [person], 'name', person.source)
+        # Role and service lookups are about MoreYeahs only
+        if not company or self._names_other_organization(question):
+            return None
+        if similarity >= ENTITY_MIN_SIMILARITY:
+            service = self.services[key]
+            text = f"{service.name}: {service.description}" if service.description else f"MoreYeahs offers {service.name}."
+            if service.link:
+                text += f"\nMore: {service.link}"
+            return EntityAnswer(text, [service], 'service', service.source)
+
+        for role, pattern in ROLE_QUESTION.items():
+            if pattern.search(question) and role in self.roles and ROLE_LOOKUP_QUESTION.search(question):
+                people = [self.people[key] for key in self.roles[role]]
+                if len(people) == 1:
+                    return EntityAnswer(self._describe(people[0], question), people, 'role', people[0].source)
+                names = ", ".join(f"{person.name} ({person.title})" for person in people[:MAX_LISTED])
+                return EntityAnswer(f"MoreYeahs' {role}s: {names}.", people, 'role', people[0].source)
+
+        if TEAM_QUESTION.search(question) and self.people:
+            people = list(self.people.values())[:MAX_LISTED]
+            names = "\n".join(f"- {person.name}" + (f", {person.title}" if person.title else "") for person in people)
+            return EntityAnswer(f"The MoreYeahs team includes:\n{names}", people, 'team', people[0].source)
+        if SERVICES_QUESTION.search(question) and self.services:
+            services = list(self.services.values())[:MAX_LISTED]
+            names = "\n".join(f"- {service.name}" + (f": {service.description}" if service.description else "")
+                              for service in services)
+            return EntityAnswer(f"MoreYeahs offers:\n{names}", services, 'services', services[0].source)
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': ENTITY_ANSWERS,
+                'version': self.version,
+                'people': len(self.people),
+                'services': len(self.services),
+                'roles': {role: len(keys) for role, keys in self.roles.items()},
+                'hits': self.hits,
+                'built_ms': round(self.built_ms, 1),
+            }
+
+def format_entity_answer(answer):
+    """Answer text with the page it came from."""
+    source = answer.source or "the MoreYeahs website"
+    return f"{answer.text}\n\nSource: {source}"
+
+entity_index = EntityIndex()
@@ -0,0 +1,227 @@
+# extractive_qa.py
+
+import math
+import os
+import re
+import time
+
+# Answer simple factual company questions straight from the retrieved chunks, skipping the model
+EXTRACTIVE_ANSWERS = os.getenv("EXTRACTIVE_ANSWERS", "1") == "1"
+# Share of the question's (idf-weighted) terms a sentence must cover to be served as the answer
+EXTRACTIVE_MIN_SCORE = float(os.getenv("EXTRACTIVE_MIN_SCORE", "0.8"))
+# Longer questions usually want an explanation, not a fact
+EXTRACTIVE_MAX_WORDS = int(os.getenv("EXTRACTIVE_MAX_WORDS", "12"))
+MAX_ANSWER_CHARS = 400
+MAX_VALUES = 3
+
+EMAIL_PATTERN = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[a-z]{2,}\b", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"(?<![\w+])\+?\(?\d[\d\s().-]{7,}\d(?!\w)")
+# An address needs an address word next to a number (a bare 6-digit number is just as often a count)
+ADDRESS_PATTERN = re.compile(
+    r"\b(floor|road|rd\.|street|st\.|nagar|sector|plot|building|tower|avenue|lane|marg|colony|square|complex|"
+    r"suite|near|opp\.?|pin(code)?|zip)\b.*\d|\d.*\b(floor|road|street|nagar|sector|plot|building|tower|avenue|lane|"
+    r"marg|colony|square|complex|suite)\b|^\s*(office\s+)?address\s*[:-].*\d",
+    re.IGNORECASE
+)
+PAGE_HEADER = re.compile(r"Content from (\S+)")
+# What a sentence must contain to answer a question of this kind, when it shares only one term with it
+ANSWER_CUES = [
+    (re.compile(r"^\s*(who|whom|whose)\b", re.IGNORECASE),
+     re.compile(r"\b(?!MoreYeahs\b)[A-Z][a-z]+(?:\s+[A-Z]\.)?\s+[A-Z][a-z]+\b")),
+    (re.compile(r"^\s*(when|what year|since when)\b", re.IGNORECASE),
+     re.compile(r"\b(19|20)\d{2}\b|\b(january|february|march|april|may|june|july|august|september|october|"
+                r"november|december)\b", re.IGNORECASE)),
+    (re.compile(r"^\s*how (many|much|long|old)\b", re.IGNORECASE), re.compile(r"\d")),
+    (re.compile(r"^\s*where\b", re.IGNORECASE), ADDRESS_PATTERN),
+]
+# Content terms a sentence must share with the question when it has no answer cue
+MIN_MATCHED_TERMS = 2
+# "Openings: ...", "Services: ..." - a short label before a colon names what the sentence lists
+SENTENCE_LABEL = re.compile(r"^\s*([A-Za-z][\w &/-]{0,40}?)\s*:\s*\S")
+
+# Which pattern extractors answer which questions
+QUESTION_TYPES = [
+    ('email', re.compile(r"\be-?mail\b", re.IGNORECASE)),
+    ('phone', re.compile(r"\b(phone|telephone|mobile|call you|contact number|whatsapp)\b", re.IGNORECASE)),
+    ('address', re.compile(
+        r"\b(address|located|location|headquarters?|where\s+(is|are)\s+(the\s+|your\s+)?(office|company|you|moreyeahs))\b",
+        re.IGNORECASE
+    )),
+    ('contact', re.compile(r"\b(contact( details| info\w*)?|reach you|get in touch)\b", re.IGNORECASE)),
+]
+
+STOPWORDS = set("""
+a an the is are was were be been am do does did of to in on at for from by with about and or what who whom whose
+which where when how why can could would should will shall may might i me my we our you your it its they their them
+this that these those there here please tell give show list any some all much many has have had get know current
+moreyeahs company
+""".split())
+
+def _stem(word):
+    for suffix in ("ings", "ing", "ers", "er", "ies", "es", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def _terms(text):
+    return [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+def _sentences(chunk):
+    # Lines first (scraped pages are mostly short lines), then sentences within long lines
+    for line in chunk.splitlines():
+        line = line.strip()
+        if not line or PAGE_HEADER.match(line) or set(line) <= set("=-"):
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+(?=[A-Z])", line):
+            if sentence.strip():
+                yield sentence.strip()
+
+class ExtractiveAnswer:
+    """A direct answer lifted from one retrieved chunk."""
+
+    def __init__(self, text, confidence, method, chunk, evidence, latency_ms=0.0):
+        self.text = text
+        self.confidence = confidence
+        self.method = method
+        self.chunk = chunk
+        self.evidence = evidence
+        self.latency_ms = latency_ms
+
+def question_type(question):
+    for name, pattern in QUESTION_TYPES:
+        if pattern.search(question):
+            return name
+    return None
+
+def _unique(values):
+    seen = []
+    for value in values:
+        key = re.sub(r"\W", "", value.lower())
+        if key not in [re.sub(r"\W", "", s.lower()) for s in seen]:
+            seen.append(value)
+    return seen[:MAX_VALUES]
+
+def _phones(text):
+    return [match.strip() for match in PHONE_PATTERN.findall(text) if 10 <= len(re.sub(r"\D", "", match)) <= 15]
+
+def _extract_pattern(kind, chunks):
+    """Emails, phone numbers or an address line from the best-ranked chunk that has one."""
+    for chunk in chunks:
+        if kind == 'email':
+            values = _unique(EMAIL_PATTERN.findall(chunk))
+            if values:
+                return f"You can email MoreYeahs at {', '.join(values)}.", chunk, values[0]
+        elif kind == 'phone':
+            values = _unique(_phones(chunk))
+            if values:
+                return f"You can call MoreYeahs on {', '.join(values)}.", chunk, values[0]
+        elif kind == 'address':
+            for sentence in _sentences(chunk):
+                if ADDRESS_PATTERN.search(sentence) and len(sentence) <= MAX_ANSWER_CHARS \
+                        and not EMAIL_PATTERN.search(sentence) and not _phones(sentence):
+                    address = re.sub(r"^(office\s+)?address\s*[:-]\s*", "", sentence, flags=re.IGNORECASE)
+                    return f"The MoreYeahs office address is: {address}", chunk, sentence
+        elif kind == 'contact':
+            emails = _unique(EMAIL_PATTERN.findall(chunk))
+            phones = _unique(_phones(chunk))
+            if emails or phones:
+                parts = []
+                if emails:
+                    parts.append(f"email {', '.join(emails)}")
+                if phones:
+                    parts.append(f"phone {', '.join(phones)}")
+                return f"You can contact MoreYeahs by {' or '.join(parts)}.", chunk, (emails or phones)[0]
+    return None
+
+def _has_answer_cue(question, sentence):
+    """Whether the sentence holds the kind of value the question asks for (a name for who, a year for when...)."""
+    for asks, answer in ANSWER_CUES:
+        if asks.search(question):
+            return bool(answer.search(sentence))
+    return False
+
+def _labelled_by(sentence, matched):
+    """Whether the sentence is labelled with the matched terms, as "Openings: ..." is for "openings"."""
+    label = SENTENCE_LABEL.match(sentence)
+    terms = set(_terms(label.group(1))) if label else set()
+    return bool(terms) and terms <= matched
+
+def _score_sentences(question, chunks):
+    """
+    Best sentence by idf-weighted coverage of the question's terms; returns
+    (score, sentence, chunk). A sentence counts only if it shares at least
+    MIN_MATCHED_TERMS terms with the question, or one plus an answer cue or
+    a "Term:" label: "Our CEO believes..." mentions the CEO but does not say
+    who it is.
+    """
+    query = set(_terms(question))
+    if not query:
+        return 0.0, None, None
+    candidates = [(sentence, chunk) for chunk in chunks for sentence in _sentences(chunk)
+                  if len(sentence) <= MAX_ANSWER_CHARS]
+    if not candidates:
+        return 0.0, None, None
+    term_sets = [set(_terms(sentence)) for sentence, _ in candidates]
+    idf = {term: math.log(1 + len(term_sets) / (1 + sum(term in terms for terms in term_sets))) + 1 for term in query}
+    total = sum(idf.values())
+    best = (0.0, None, None)
+    for (sentence, chunk), terms in zip(candidates, term_sets):
+        matched = query & terms
+        covered = sum(idf[term] for term in matched)
+        # A sentence that only restates the question is not an answer
+        if not terms - query:
+            continue
+        if len(matched) < MIN_MATCHED_TERMS and not (
+            matched and (_has_answer_cue(question, sentence) or _labelled_by(sentence, matched))
+        ):
+            continue
+        score = covered / total
+        if score > best[0]:
+            best = (score, sentence, chunk)
+    return best
+
+def extract_answer(question, chunks):
+    """
+    Try to answer from the retrieved chunks (best first) without the model.
+    Returns an ExtractiveAnswer when confident, else None.
+    """
+    if not EXTRACTIVE_ANSWERS or not chunks or len(question.split()) > EXTRACTIVE_MAX_WORDS:
+        return None
+    start = time.perf_counter()
+    kind = question_type(question)
+    answer = None
+    if kind is not None:
+        found = _extract_pattern(kind, chunks)
+        if found is not None:
+            text, chunk, evidence = found
+            answer = ExtractiveAnswer(text, 0.9, kind, chunk, evidence)
+    else:
+        score, sentence, chunk = _score_sentences(question, chunks)
+        if sentence is not None and score >= EXTRACTIVE_MIN_SCORE:
+            answer = ExtractiveAnswer(sentence, score, 'lexical', chunk, sentence)
+    latency = (time.perf_counter() - start) * 1000
+    if answer is None:
+        print(f" Extractive answer: none confident enough ({kind or 'lexical'}, {latency:.2f}ms)")
+        return None
+    answer.latency_ms = latency
+    print(f" Extractive answer via {answer.method} (confidence {answer.confidence:.2f}) in {latency:.2f}ms")
+    return answer
+
+def chunk_source(chunk, site_text, evidence=""):
+    """URL of the scraped page the evidence (or chunk) came from, if the site text has page headers."""
+    position = site_text.find(chunk[:200]) if site_text else -1
+    if position < 0:
+        return None
+    # Chunks can span pages; the header that counts is the one before the evidence
+    position += max(0, chunk.find(evidence))
+    header = site_text.rfind("Content from ", 0, position + len("Content from "))
+    match = PAGE_HEADER.match(site_text, header) if header >= 0 else None
+    return match.group(1) if match else None
+
+def format_answer(answer, site_text=""):
+    """Answer text with a citation of the page (or passage) it was taken from."""
+    source = chunk_source(answer.chunk, site_text, answer.evidence) or "the MoreYeahs website"
+    evidence = " ".join(answer.evidence.split())
+    if len(evidence) > 200:
+        evidence = evidence[:200].rsplit(" ", 1)[0] + "..."
+    return f'{answer.text}\n\nSource: {source} ("{evidence}")'
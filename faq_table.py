@@ -0,0 +1,235 @@
+# faq_table.py
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Serve matching questions from answers generated when the index is built
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "1") == "1"
+# One question per line; defaults to DEFAULT_FAQ_QUESTIONS
+FAQ_QUESTIONS_FILE = os.getenv("FAQ_QUESTIONS_FILE")
+# Cosine similarity a question needs to an FAQ question to get its stored answer
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.85"))
+# Generated tables are saved here per index version, so other workers and restarts reuse them
+FAQ_TABLE_DIR = os.getenv("FAQ_TABLE_DIR", ".faq_cache")
+FAQ_KEEP_VERSIONS = 2
+# Workers that do not build the table look for the builder's copy at most this often (seconds)
+FAQ_RELOAD_INTERVAL = float(os.getenv("FAQ_RELOAD_INTERVAL", "30"))
+# A claim to build a version's table older than this (seconds) is from a worker that died mid-build
+FAQ_BUILD_TIMEOUT = float(os.getenv("FAQ_BUILD_TIMEOUT", "600"))
+
+DEFAULT_FAQ_QUESTIONS = [
+    "Who is the founder of MoreYeahs?",
+    "Who is the CEO of MoreYeahs?",
+    "What services does MoreYeahs offer?",
+    "What products does MoreYeahs have?",
+    "What does MoreYeahs do?",
+    "How can I contact MoreYeahs?",
+    "Where is the MoreYeahs office?",
+    "Is MoreYeahs hiring? What are the current job openings?",
+    "Which technologies does MoreYeahs work with?",
+    "Which industries does MoreYeahs serve?",
+]
+
+def load_faq_questions():
+    if FAQ_QUESTIONS_FILE:
+        try:
+            with open(FAQ_QUESTIONS_FILE, "r", encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+            if questions:
+                return questions
+        except OSError as e:
+            print(f" Could not read FAQ questions from {FAQ_QUESTIONS_FILE}: {e}")
+    return list(DEFAULT_FAQ_QUESTIONS)
+
+class FaqMatch:
+    def __init__(self, question, answer, similarity):
+        self.question = question
+        self.answer = answer
+        self.similarity = similarity
+
+class FaqTable:
+    """
+    Answers to a fixed list of common questions, generated once per index
+    version by a background job and matched against incoming questions by
+    embedding similarity. A new index version invalidates the table; until
+    the job has regenerated it, nothing is served from it.
+    """
+
+    def __init__(self, questions=None, table_dir=FAQ_TABLE_DIR):
+        self.questions = questions or load_faq_questions()
+        self.table_dir = table_dir
+        self.version = None
+        self.entries = []  # [(question, answer)]
+        self.embeddings = None
+        self.building = None
+        self.built_at = None
+        self.hits = 0
+        self._checked = (None, 0.0)
+        self._lock = threading.Lock()
+
+    def _path(self, version):
+        return os.path.join(self.table_dir, f"faq_{version}.json")
+
+    def ensure(self, version, answer_fn=None, embed_fn=None):
+        """
+        Make the table current for `version`: load it from disk if another
+        process already built it, else generate it in a background thread.
+        answer_fn(question) -> answer text; embed_fn(list) -> normalized embeddings.
+        Without them, only looks for a saved table (every FAQ_RELOAD_INTERVAL seconds).
+        """
+        if not FAQ_ENABLED or version is None:
+            return
+        with self._lock:
+            if self.version == version or self.building == version:
+                return
+            if answer_fn is None:
+                checked_version, checked_at = self._checked
+                if checked_version == version and time.time() - checked_at < FAQ_RELOAD_INTERVAL:
+                    return
+                self._checked = (version, time.time())
+            if self._load(version) or answer_fn is None:
+                return
+            if not self._claim(version):
+                print(f" FAQ table for index {version} is being built by another worker")
+                return
+            self.building = version
+        threading.Thread(target=self._build, args=(version, answer_fn, embed_fn), daemon=True).start()
+
+    def _claim_path(self, version):
+        return self._path(version) + ".building"
+
+    def _claim(self, version):
+        """Take the cross-process claim to build `version`, so workers sharing FAQ_TABLE_DIR build it once."""
+        path = self._claim_path(version)
+        try:
+            os.makedirs(self.table_dir, exist_ok=True)
+            for _ in range(2):
+                try:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    return True
+                except FileExistsError:
+                    if time.time() - os.path.getmtime(path) < FAQ_BUILD_TIMEOUT:
+                        return False
+                    os.remove(path)
+        except OSError as e:
+            print(f" Could not claim the FAQ build, building anyway: {e}")
+            return True
+        return False
+
+    def _release(self, version):
+        try:
+            os.remove(self._claim_path(version))
+        except OSError:
+            pass
+
+    def _load(self, version):
+        try:
+            with open(self._path(version), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != version or data.get("questions") != [q for q, _ in data.get("entries", [])]:
+            return False
+        self._install(version, [tuple(entry) for entry in data["entries"]], np.asarray(data["embeddings"], dtype=np.float32))
+        print(f" Loaded FAQ table for index {version} ({len(self.entries)} answers)")
+        return True
+
+    def _install(self, version, entries, embeddings):
+        self.version = version
+        self.entries = entries
+        self.embeddings = embeddings
+        self.built_at = time.time()
+
+    def _build(self, version, answer_fn, embed_fn):
+        try:
+            self._generate(version, answer_fn, embed_fn)
+        finally:
+            self._release(version)
+
+    def _generate(self, version, answer_fn, embed_fn):
+        start = time.perf_counter()
+        entries = []
+        for question in self.questions:
+            try:
+                answer = answer_fn(question)
+            except Exception as e:
+                print(f" FAQ answer failed for '{question}': {e}")
+                continue
+            if answer:
+                entries.append((question, answer))
+        try:
+            embeddings = np.asarray(embed_fn([q for q, _ in entries]), dtype=np.float32) if entries else None
+        except Exception as e:
+            print(f" FAQ table for index {version} not built: {e}")
+            entries = []
+        with self._lock:
+            if self.building != version:
+                return  # A newer version started meanwhile
+            self.building = None
+            if not entries:
+                return
+            self._install(version, entries, embeddings)
+        self._save(version)
+        print(f" Built FAQ table for index {version}: {len(entries)}/{len(self.questions)} answers "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def _save(self, version):
+        try:
+            os.makedirs(self.table_dir, exist_ok=True)
+            data = {
+                "version": version,
+                "questions": [q for q, _ in self.entries],
+                "entries": self.entries,
+                "embeddings": self.embeddings.tolist(),
+            }
+            tmp = self._path(version) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self._path(version))
+            old = sorted(
+                (name for name in os.listdir(self.table_dir) if name.startswith("faq_") and name.endswith(".json")),
+                key=lambda name: os.path.getmtime(os.path.join(self.table_dir, name))
+            )
+            for name in old[:-FAQ_KEEP_VERSIONS]:
+                os.remove(os.path.join(self.table_dir, name))
+        except OSError as e:
+            print(f" Could not save FAQ table: {e}")
+
+    def match(self, embedding, version):
+        """The stored answer for the closest FAQ question, if similar enough and built for `version`."""
+        with self._lock:
+            if not FAQ_ENABLED or self.version != version or self.embeddings is None:
+                return None
+            embeddings, entries = self.embeddings, self.entries
+        similarities = embeddings @ np.asarray(embedding, dtype=np.float32).reshape(-1)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < FAQ_MATCH_THRESHOLD:
+            return None
+        self.hits += 1
+        question, answer = entries[best]
+        print(f" FAQ match: '{question}' (similarity {similarity:.2f})")
+        return FaqMatch(question, answer, similarity)
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self.entries = []
+            self.embeddings = None
+            self.building = None
+
+    def stats(self):
+        return {
+            'enabled': FAQ_ENABLED,
+            'version': self.version,
+            'building': self.building,
+            'answers': len(self.entries),
+            'questions': len(self.questions),
+            'hits': self.hits,
+        }
+
+faq_table = FaqTable()
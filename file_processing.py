@@ -0,0 +1,676 @@
+# file_processing.py
+
+import codecs
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from xml.etree import ElementTree
+from flask import Request
+from PIL import Image, ImageOps
+import PyPDF2
+from ocr import OCR_AVAILABLE, OCR_TIMEOUT, ocr_image, ocr_images
+from upload_cache import content_hash, extraction_cache
+from timing import StageTimer
+
+try:
+    try:
+        import pymupdf as fitz  # PyMuPDF >= 1.24
+    except ImportError:
+        import fitz  # older PyMuPDF releases
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    print("Warning: PyMuPDF not available. Falling back to PyPDF2 for PDF extraction.")
+    PYMUPDF_AVAILABLE = False
+
+try:
+    import charset_normalizer
+    CHARSET_NORMALIZER_AVAILABLE = True
+except ImportError:
+    CHARSET_NORMALIZER_AVAILABLE = False
+
+try:
+    import chardet
+    CHARDET_AVAILABLE = True
+except ImportError:
+    CHARDET_AVAILABLE = False
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp'}
+DOCUMENT_EXTENSIONS = {'pdf', 'docx', 'txt'}
+ARCHIVE_EXTENSIONS = {'zip'}
+
+# Uploads stay in memory up to this size; larger ones spill to a temp file
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(4 * 1024 * 1024)))
+
+# PDFs with at least this many pages are split across the extraction pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Batch uploads: files per request, and limits on what a .zip may expand to
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+ARCHIVE_MAX_MEMBERS = int(os.getenv("ARCHIVE_MAX_MEMBERS", "50"))
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(100 * 1024 * 1024)))
+# Images sent to the vision model are bounded to this size; previews to THUMBNAIL_SIZE
+MODEL_IMAGE_MAX_DIMENSION = int(os.getenv("MODEL_IMAGE_MAX_DIMENSION", "1536"))
+THUMBNAIL_SIZE = (320, 320)
+# Scanned PDFs: how many pages to render and OCR, and at what resolution
+OCR_MAX_PDF_PAGES = int(os.getenv("OCR_MAX_PDF_PAGES", "30"))
+OCR_PDF_DPI = int(os.getenv("OCR_PDF_DPI", "150"))
+# An image sent with a chat message waits at most this long (seconds) for OCR; the vision model
+# still gets the image, and the OCR result is cached for later questions when it finishes
+OCR_INLINE_WAIT = float(os.getenv("OCR_INLINE_WAIT", "2"))
+# Text uploads: bytes sampled for encoding detection, then read size while decoding
+ENCODING_SAMPLE_BYTES = int(os.getenv("ENCODING_SAMPLE_BYTES", str(64 * 1024)))
+TEXT_READ_CHUNK_BYTES = 1024 * 1024
+
+_extraction_pool = None
+_in_extraction_worker = False
+
+def _mark_extraction_worker():
+    global _in_extraction_worker
+    _in_extraction_worker = True
+
+def get_extraction_pool():
+    """
+    Process pool shared by CPU-heavy extractors, created on first use.
+    Workers are spawned rather than forked: the web process has threads
+    (upload jobs, model calls) whose locks a fork could copy mid-use.
+    """
+    global _extraction_pool
+    if _extraction_pool is None:
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=EXTRACTION_WORKERS, initializer=_mark_extraction_worker,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _extraction_pool
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+class UploadRequest(Request):
+    """Request class that buffers uploaded files in a SpooledTemporaryFile."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode="w+b")
+
+def open_upload(file_storage):
+    """Return a seekable binary stream positioned at the start of the upload."""
+    stream = file_storage.stream
+    if not (hasattr(stream, "seekable") and stream.seekable()):
+        spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode="w+b")
+        file_storage.save(spooled)
+        stream = spooled
+    stream.seek(0)
+    return stream
+
+def _extract_pdf_pages(pdf_path, start, end):
+    """Extract text for pages [start, end) of the PDF at pdf_path with PyMuPDF (runs in a pool worker)."""
+    pages = []
+    with fitz.open(pdf_path, filetype="pdf") as doc:
+        for i in range(start, end):
+            try:
+                pages.append(doc[i].get_text())
+            except Exception as e:
+                print(f"Error extracting text from page {i + 1}: {e}")
+    return pages
+
+def _extract_text_with_pymupdf(data, max_chars=None):
+    pages = []
+    total = 0
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        page_count = doc.page_count
+        # Inside a pool worker the batch is already fanned out per file
+        if page_count < PDF_PARALLEL_MIN_PAGES or _in_extraction_worker:
+            for page in doc:
+                try:
+                    pages.append(page.get_text())
+                except Exception as e:
+                    print(f"Error extracting text from page: {e}")
+                    continue
+                total += len(pages[-1])
+                if max_chars and total >= max_chars:
+                    break
+            return pages
+
+    # Large document: keep EXTRACTION_WORKERS page ranges in flight and
+    # consume them in order so we can stop as soon as the budget is reached.
+    # Workers open the PDF from a temp file rather than each task pickling the whole document.
+    pool = get_extraction_pool()
+    pending = deque()
+    next_start = 0
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+        pdf_file.write(data)
+    try:
+        while pending or next_start < page_count:
+            while next_start < page_count and len(pending) < EXTRACTION_WORKERS:
+                end = min(next_start + PDF_PAGES_PER_TASK, page_count)
+                pending.append(pool.submit(_extract_pdf_pages, pdf_file.name, next_start, end))
+                next_start = end
+            batch = pending.popleft().result()
+            pages.extend(batch)
+            total += sum(len(page) for page in batch)
+            if max_chars and total >= max_chars:
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        # Ranges already running still have the file open
+        wait(pending)
+        os.remove(pdf_file.name)
+    return pages
+
+def _extract_text_with_pypdf2(stream, max_chars=None):
+    pages = []
+    total = 0
+    pdf_reader = PyPDF2.PdfReader(stream)
+    for page in pdf_reader.pages:
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception as e:
+            print(f"Error extracting text from page: {e}")
+            continue
+        total += len(pages[-1])
+        if max_chars and total >= max_chars:
+            break
+    return pages
+
+def _ocr_scanned_pdf(data, max_chars=None):
+    """Render pages of an image-only PDF and OCR them (inline when already in an extraction worker)."""
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        page_images = [
+            doc[i].get_pixmap(dpi=OCR_PDF_DPI).tobytes("png")
+            for i in range(min(doc.page_count, OCR_MAX_PDF_PAGES))
+        ]
+    pages = []
+    total = 0
+    for text in ocr_images(page_images, inline=_in_extraction_worker):
+        pages.append(text)
+        total += len(text)
+        if max_chars and total >= max_chars:
+            break
+    return pages
+
+def extract_text_from_pdf(stream, max_chars=None):
+    """
+    Extract text from a PDF stream.
+
+    Stops after the page that reaches `max_chars`, so callers that only use
+    the beginning of a document don't pay for parsing the rest of it.
+    """
+    try:
+        if PYMUPDF_AVAILABLE:
+            data = stream.read()
+            pages = _extract_text_with_pymupdf(data, max_chars)
+            if not "".join(pages).strip() and OCR_AVAILABLE:
+                print(" No text layer found in PDF, running OCR...")
+                pages = _ocr_scanned_pdf(data, max_chars)
+        else:
+            pages = _extract_text_with_pypdf2(stream, max_chars)
+        text = "\n".join(pages)
+        return text if text.strip() else "No text could be extracted from this PDF."
+    except Exception as e:
+        print(f"Error reading PDF: {str(e)}")
+        return f"Error reading PDF: {str(e)}"
+
+# Namespaces used by WordprocessingML parts
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_NS = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+# Run-level elements that contribute characters besides <w:t>
+_DOCX_RUN_CHARS = {W_NS + "tab": "\t", W_NS + "br": "\n", W_NS + "cr": "\n", W_NS + "noBreakHyphen": "-"}
+
+def _iter_docx_part(part):
+    """
+    Yield (kind, text) blocks from one WordprocessingML part (document, header
+    or footer) using iterparse, clearing finished blocks as it goes so memory
+    stays flat regardless of document size.
+
+    kind is one of 'paragraph', 'heading', 'textbox' or 'table_row'. Table
+    cells are joined with " | "; text boxes are emitted before the paragraph
+    that anchors them, since their own paragraphs close first.
+    """
+    paragraphs = []  # open <w:p> elements: {'parts': [...], 'heading': bool}
+    rows = []        # open <w:tr> elements: list of cell texts
+    cells = []       # open <w:tc> elements: list of paragraph texts
+    fallback_depth = 0
+    depth = 0
+    container, container_depth = None, 0
+
+    for event, elem in ElementTree.iterparse(part, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            depth += 1
+            if container is None or tag == W_NS + "body":
+                container, container_depth = elem, depth
+            if tag == MC_NS + "Fallback":
+                # Alternate renderings repeat the text of the preferred one
+                fallback_depth += 1
+            elif fallback_depth:
+                continue
+            elif tag == W_NS + "p":
+                paragraphs.append({'parts': [], 'heading': False})
+            elif tag == W_NS + "tr":
+                rows.append([])
+            elif tag == W_NS + "tc":
+                cells.append([])
+            continue
+
+        depth -= 1
+        if tag == MC_NS + "Fallback":
+            fallback_depth -= 1
+        elif fallback_depth:
+            continue
+        elif tag == W_NS + "t":
+            if paragraphs and elem.text:
+                paragraphs[-1]['parts'].append(elem.text)
+        elif tag in _DOCX_RUN_CHARS:
+            if paragraphs:
+                paragraphs[-1]['parts'].append(_DOCX_RUN_CHARS[tag])
+        elif tag == W_NS + "pStyle":
+            style = (elem.get(W_NS + "val") or "").lower()
+            if paragraphs and (style.startswith("heading") or style == "title"):
+                paragraphs[-1]['heading'] = True
+        elif tag == W_NS + "p":
+            paragraph = paragraphs.pop()
+            text = "".join(paragraph['parts']).strip()
+            if text:
+                if cells:
+                    cells[-1].append(text)
+                elif paragraphs:
+                    yield "textbox", text
+                else:
+                    yield ("heading" if paragraph['heading'] else "paragraph"), text
+        elif tag == W_NS + "tc":
+            rows[-1].append(" ".join(cells.pop()))
+        elif tag == W_NS + "tr":
+            row = rows.pop()
+            if any(row):
+                text = " | ".join(row)
+                if cells:
+                    # Nested table: keep its rows inside the enclosing cell
+                    cells[-1].append(text)
+                else:
+                    yield "table_row", text
+
+        if depth == container_depth + 1:
+            container.clear()
+
+def iter_docx_blocks(stream):
+    """
+    Stream structured text blocks out of a DOCX file without building the
+    python-docx object tree: headers first, then the body, then footers.
+    Header/footer blocks repeated across sections are emitted once.
+    """
+    with zipfile.ZipFile(stream) as archive:
+        names = set(archive.namelist())
+        headers = sorted(n for n in names if re.fullmatch(r"word/header\d*\.xml", n))
+        footers = sorted(n for n in names if re.fullmatch(r"word/footer\d*\.xml", n))
+        seen = set()
+        for name in headers + ["word/document.xml"] + footers:
+            if name not in names:
+                continue
+            is_body = name == "word/document.xml"
+            with archive.open(name) as part:
+                for kind, text in _iter_docx_part(part):
+                    if not is_body:
+                        if text in seen:
+                            continue
+                        seen.add(text)
+                    yield kind, text
+
+def join_docx_blocks(blocks, max_chars=None):
+    """
+    Join blocks into text for chunking. Headings and table boundaries get a
+    blank line before them, so the splitter prefers to break there.
+    """
+    pieces = []
+    total = 0
+    previous = None
+    for kind, text in blocks:
+        if previous is not None:
+            section_break = kind == "heading" or (kind == "table_row") != (previous == "table_row")
+            pieces.append("\n\n" if section_break else "\n")
+        pieces.append(text)
+        total += len(text)
+        previous = kind
+        if max_chars and total >= max_chars:
+            break
+    return "".join(pieces)
+
+def extract_text_from_docx(stream, max_chars=None):
+    """Extract text from a DOCX stream, including tables, headers, footers and text boxes"""
+    try:
+        text = join_docx_blocks(iter_docx_blocks(stream), max_chars)
+        return text if text.strip() else "No text found in this document."
+    except Exception as e:
+        print(f"Error reading DOCX: {str(e)}")
+        return f"Error reading DOCX: {str(e)}"
+
+# Byte-order marks, longest first so UTF-32 LE isn't mistaken for UTF-16 LE
+_TEXT_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Single-byte encodings preferred when charset_normalizer finds them as good as its first pick:
+# short Western-European samples fit dozens of code pages equally well
+PREFERRED_ENCODINGS = ("cp1252", "latin_1")
+ENCODING_TIE_MARGIN = 0.01
+
+def _normalizer_guess(sample):
+    """charset_normalizer's pick, preferring cp1252/latin-1 among equally good matches; (encoding, coherence)"""
+    matches = list(charset_normalizer.from_bytes(sample))
+    if not matches:
+        return None
+    best = matches[0]
+    tied = [match for match in matches if match.chaos <= best.chaos + ENCODING_TIE_MARGIN
+            and match.coherence >= best.coherence - ENCODING_TIE_MARGIN]
+    for preferred in PREFERRED_ENCODINGS:
+        for match in tied:
+            if preferred == match.encoding or preferred in match.could_be_from_charset:
+                return preferred, round(match.coherence, 2)
+    return best.encoding, round(best.coherence, 2)
+
+def detect_encoding(sample):
+    """
+    Guess the encoding of a text file from a prefix of its bytes.
+
+    Checks for a BOM, then whether the sample is valid UTF-8, then asks
+    charset_normalizer/chardet if available, falling back to cp1252.
+
+    Returns:
+        tuple: (encoding, confidence between 0 and 1; for charset_normalizer
+        this is its language coherence, low for short samples)
+    """
+    for bom, encoding in _TEXT_BOMS:
+        if sample.startswith(bom):
+            return encoding, 1.0
+    try:
+        # final=False tolerates a multi-byte character cut off by the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8", 0.99
+    except UnicodeDecodeError:
+        pass
+    if CHARSET_NORMALIZER_AVAILABLE:
+        guess = _normalizer_guess(sample)
+    elif CHARDET_AVAILABLE:
+        result = chardet.detect(sample)
+        guess = (result["encoding"].lower(), round(result.get("confidence") or 0.0, 2)) if result.get("encoding") else None
+    else:
+        guess = None
+    # Short samples without NUL bytes are sometimes misread as BOM-less UTF-16/32
+    if guess and not (guess[0].replace("_", "-").startswith("utf-") and b"\x00" not in sample):
+        return guess
+    return "cp1252", 0.5
+
+def extract_text_from_txt(stream, max_chars=None, metadata=None):
+    """
+    Extract text from a TXT stream in a single pass.
+
+    The encoding is detected from the first ENCODING_SAMPLE_BYTES and the rest
+    of the stream is decoded incrementally; undecodable bytes become U+FFFD.
+    If `metadata` is given, the detected encoding and confidence are recorded in it.
+    """
+    try:
+        sample = stream.read(ENCODING_SAMPLE_BYTES)
+        encoding, confidence = detect_encoding(sample)
+        if metadata is not None:
+            metadata['encoding'] = encoding
+            metadata['encoding_confidence'] = confidence
+
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        pieces = []
+        total = 0
+        chunk = sample
+        while chunk:
+            text = decoder.decode(chunk)
+            pieces.append(text)
+            total += len(text)
+            if max_chars and total >= max_chars:
+                break
+            chunk = stream.read(TEXT_READ_CHUNK_BYTES)
+        else:
+            pieces.append(decoder.decode(b"", final=True))
+        content = "".join(pieces)
+        return content if content.strip() else "The text file appears to be empty."
+    except Exception as e:
+        print(f"Error reading TXT: {str(e)}")
+        return f"Error reading TXT: {str(e)}"
+
+def _flatten_to_rgb(image):
+    # Convert to RGB if necessary (for JPEG compatibility)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        return background
+    elif image.mode not in ('RGB', 'L'):
+        return image.convert('RGB')
+    return image
+
+def prepare_image(data, max_dimension=MODEL_IMAGE_MAX_DIMENSION, thumbnail_size=THUMBNAIL_SIZE):
+    """
+    Decode an uploaded image once and derive everything later steps need.
+
+    JPEGs are decoded with `Image.draft`, letting libjpeg scale down by up to
+    8x while decoding instead of materializing the full-resolution bitmap.
+
+    Returns:
+        tuple: (model_image, thumbnail_jpeg_bytes, original_size, timings_ms)
+    """
+    timer = StageTimer("image")
+    with timer.stage("open"):
+        image = Image.open(io.BytesIO(data))
+        original_size = image.size
+    with timer.stage("decode"):
+        if image.format == "JPEG":
+            image.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    with timer.stage("normalize"):
+        image = _flatten_to_rgb(image)
+    with timer.stage("resize"):
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.BICUBIC, reducing_gap=2.0)
+    with timer.stage("thumbnail"):
+        thumbnail = image.copy()
+        thumbnail.thumbnail(thumbnail_size)
+        buffered = io.BytesIO()
+        thumbnail.save(buffered, format="JPEG", quality=80)
+    timer.log()
+    return image, buffered.getvalue(), original_size, timer.as_dict()
+
+def _extract_document(stream, file_ext, max_chars=None, metadata=None):
+    if file_ext == 'pdf':
+        return extract_text_from_pdf(stream, max_chars)
+    elif file_ext == 'docx':
+        return extract_text_from_docx(stream, max_chars)
+    return extract_text_from_txt(stream, max_chars, metadata)
+
+def _extract_document_job(data, file_ext, max_chars=None):
+    """Extract a document's text in an extraction pool worker."""
+    metadata = {}
+    text = _extract_document(io.BytesIO(data), file_ext, max_chars, metadata)
+    return text, metadata
+
+def process_uploaded_file(stream, filename, max_chars=None, offload=False, ocr_wait=None):
+    """
+    Process an uploaded file stream and extract content.
+
+    Document text is cached by content hash, so re-uploading the same file
+    costs a hash and a lookup instead of a full parse. With `offload`, document
+    parsing runs in the extraction process pool instead of the calling thread.
+    Images wait `ocr_wait` seconds for OCR: by default OCR_TIMEOUT when
+    offloaded, OCR_INLINE_WAIT otherwise.
+    """
+    if ocr_wait is None:
+        # Upload jobs (offload) run in the background and can wait for OCR; a chat request does not
+        ocr_wait = OCR_TIMEOUT if offload else OCR_INLINE_WAIT
+    if '.' not in filename:
+        return f"Unsupported file type: {filename}", None, "error", filename
+    file_ext = file_extension(filename)
+
+    if file_ext in IMAGE_EXTENSIONS:
+        try:
+            data = stream.read()
+            image, thumbnail, original_size, timings = prepare_image(data)
+            ocr_start = time.perf_counter()
+            ocr_text = ocr_image(data, ocr_wait) if OCR_AVAILABLE else ""
+            timings['ocr'] = round((time.perf_counter() - ocr_start) * 1000, 2)
+            metadata = {
+                'content_hash': content_hash(data),
+                'ocr_text': ocr_text,
+                'thumbnail': thumbnail,
+                'original_size': original_size,
+                'timings': timings,
+            }
+            return image, metadata, "image", filename
+        except Exception as e:
+            print(f"Error processing image: {str(e)}")
+            return f"Error processing image: {str(e)}", None, "error", filename
+
+    elif file_ext in DOCUMENT_EXTENSIONS:
+        data = stream.read()
+        digest = content_hash(data)
+        cache_key = f"{digest}-{file_ext}-{max_chars or 0}"
+        cached = extraction_cache.get(cache_key)
+        if cached is not None:
+            print(f" Upload cache hit for {filename}")
+            return cached['text'], cached['metadata'], file_ext, filename
+
+        metadata = {'content_hash': digest}
+        if offload:
+            text, extracted = get_extraction_pool().submit(_extract_document_job, data, file_ext, max_chars).result()
+            metadata.update(extracted)
+        else:
+            text = _extract_document(io.BytesIO(data), file_ext, max_chars, metadata)
+        if not text.startswith("Error"):
+            extraction_cache.put(cache_key, {'text': text, 'metadata': metadata})
+        return text, metadata, file_ext, filename
+
+    else:
+        return f"Unsupported file type: {file_ext}", None, "error", filename
+
+def expand_archive(stream, archive_name):
+    """
+    Read the supported files out of a .zip upload.
+
+    Members are bounded by ARCHIVE_MAX_MEMBERS and ARCHIVE_MAX_BYTES (measured
+    while decompressing, not trusted from the archive header).
+
+    Returns:
+        list: (name, data, None) for each member read, or (name, None, reason)
+        for each one skipped, in archive order.
+    """
+    entries = []
+    read = 0
+    total = 0
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            base = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or base.startswith("."):
+                continue
+            name = f"{archive_name}/{info.filename}"
+            if file_extension(base) not in IMAGE_EXTENSIONS | DOCUMENT_EXTENSIONS:
+                entries.append((name, None, "unsupported file type"))
+                continue
+            if read >= ARCHIVE_MAX_MEMBERS:
+                entries.append((name, None, "too many files in archive"))
+                continue
+            remaining = ARCHIVE_MAX_BYTES - total
+            with archive.open(info) as member:
+                data = member.read(remaining + 1)
+            if len(data) > remaining:
+                entries.append((name, None, "archive contents too large"))
+                continue
+            total += len(data)
+            read += 1
+            entries.append((name, data, None))
+    return entries
+
+def _report_progress(progress, name, status, detail=""):
+    print(f" Upload [{status}] {name}{f': {detail}' if detail else ''}")
+    if progress is not None:
+        try:
+            progress(name, status, detail)
+        except Exception as e:
+            print(f" Progress callback failed: {e}")
+
+def _batch_result(name, file_type=None, content=None, metadata=None, error=None):
+    return {
+        'name': name,
+        'file_type': file_type,
+        'content': content,
+        'metadata': metadata,
+        'status': 'error' if error else 'ready',
+        'error': error,
+    }
+
+def process_uploaded_files(uploads, max_chars=None, progress=None, background=False):
+    """
+    Process several uploads, and the members of any .zip archives, as one batch.
+
+    Files are handled concurrently and document parsing is fanned out to the
+    extraction process pool, which bounds CPU use across requests. `progress`,
+    if given, is called as progress(name, status, detail) as each file moves
+    through 'processing' to 'ready' or 'error'. Images wait for OCR only when
+    the batch runs in the `background` (an upload job); a chat request waits
+    OCR_INLINE_WAIT at most.
+
+    Args:
+        uploads: list of (filename, binary stream) pairs
+
+    Returns:
+        list: One dict per file (name, file_type, content, metadata, status, error), in upload order.
+    """
+    entries = []  # (name, stream or None, error)
+    for filename, stream in uploads:
+        if file_extension(filename) not in ARCHIVE_EXTENSIONS:
+            entries.append((filename, stream, None))
+            continue
+        try:
+            members = expand_archive(stream, filename)
+        except Exception as e:
+            entries.append((filename, None, f"Could not read archive: {e}"))
+            continue
+        entries.extend((name, io.BytesIO(data) if data is not None else None, reason) for name, data, reason in members)
+
+    results = [None] * len(entries)
+    jobs = []
+    for i, (name, stream, error) in enumerate(entries):
+        if error is None and i >= BATCH_MAX_FILES:
+            error = f"only the first {BATCH_MAX_FILES} files of a batch are processed"
+        if error is not None:
+            _report_progress(progress, name, 'error', error)
+            results[i] = _batch_result(name, error=error)
+        else:
+            jobs.append((i, name, stream))
+
+    def run(name, stream):
+        _report_progress(progress, name, 'processing')
+        try:
+            content, metadata, file_type, _ = process_uploaded_file(
+                stream, name, max_chars, offload=True, ocr_wait=OCR_TIMEOUT if background else OCR_INLINE_WAIT
+            )
+        except Exception as e:
+            content, metadata, file_type = f"Error processing file: {e}", None, "error"
+        if file_type == "error" or (isinstance(content, str) and content.startswith("Error")):
+            _report_progress(progress, name, 'error', content)
+            return _batch_result(name, error=content)
+        _report_progress(progress, name, 'ready', f"{len(content)} characters" if isinstance(content, str) else "")
+        return _batch_result(name, file_type, content, metadata)
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(EXTRACTION_WORKERS, len(jobs))) as executor:
+            futures = [(i, executor.submit(run, name, stream)) for i, name, stream in jobs]
+            for i, future in futures:
+                results[i] = future.result()
+    return results
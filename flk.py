@@ -1,15 +1,16 @@
-from flask import Flask, render_template, request, jsonify, session
-from werkzeug.utils import secure_filename
+from flask import Flask, render_template, request, jsonify, session, Response
 import os
-import time
-import base64
-import io
+import uuid
 from datetime import datetime
-from PIL import Image
-import PyPDF2
-import docx
 import google.generativeai as genai
 from dotenv import load_dotenv
+from file_processing import UploadRequest, open_upload, process_uploaded_file
+from rate_limit import rate_limited
+from intent_router import router
+from llm_client import call_with_retry, Deadline, LLMUnavailableError
+from message_store import (
+    save_image, get_image, image_url, append_messages, get_messages, clear_session, DEFAULT_PAGE_SIZE
+)
 
 # Try to import optional modules
 try:
@@ -32,19 +33,16 @@ if not os.getenv("GEMINI_API_KEY"):
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 app = Flask(__name__)
+app.request_class = UploadRequest  # Keep uploads in memory, spilling to a temp file only when large
 app.secret_key = os.getenv("SECRET_KEY", "your-secret-key-here")
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'docx'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+MAX_FILE_CHARS = 30000  # File content sent to the model per question
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 # Initialize Gemini models
 try:
     model = genai.GenerativeModel("gemini-2.0-flash")
@@ -63,115 +61,15 @@ except Exception as e:
 chat_sessions = {}
 knowledge_ready = False
 
+def get_session_id():
+    """Return the current session ID, creating one if needed"""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    text += page.extract_text() + "\n"
-                except Exception as e:
-                    print(f"Error extracting text from page: {e}")
-                    continue
-        return text if text.strip() else "No text could be extracted from this PDF."
-    except Exception as e:
-        print(f"Error reading PDF: {str(e)}")
-        return f"Error reading PDF: {str(e)}"
-
-def extract_text_from_docx(docx_path):
-    """Extract text from DOCX file"""
-    try:
-        doc = docx.Document(docx_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text if text.strip() else "No text found in this document."
-    except Exception as e:
-        print(f"Error reading DOCX: {str(e)}")
-        return f"Error reading DOCX: {str(e)}"
-
-def extract_text_from_txt(txt_path):
-    """Extract text from TXT file"""
-    try:
-        # Try UTF-8 first
-        with open(txt_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            return content if content.strip() else "The text file appears to be empty."
-    except UnicodeDecodeError:
-        # Try with different encodings
-        encodings = ['latin-1', 'cp1252', 'iso-8859-1']
-        for encoding in encodings:
-            try:
-                with open(txt_path, 'r', encoding=encoding) as file:
-                    content = file.read()
-                    return content if content.strip() else "The text file appears to be empty."
-            except Exception:
-                continue
-        return "Error: Could not decode the text file with any supported encoding."
-    except Exception as e:
-        print(f"Error reading TXT: {str(e)}")
-        return f"Error reading TXT: {str(e)}"
-
-def process_uploaded_file(file_path, filename):
-    """Process uploaded file and extract content"""
-    if not os.path.exists(file_path):
-        return f"Error: File not found at {file_path}", None, "error", filename
-        
-    file_ext = filename.rsplit('.', 1)[1].lower()
-    
-    if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-        try:
-            # Open and verify image
-            image = Image.open(file_path)
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode not in ('RGB', 'L'):
-                image = image.convert('RGB')
-            
-            return image, None, "image", filename
-        except Exception as e:
-            print(f"Error processing image: {str(e)}")
-            return f"Error processing image: {str(e)}", None, "error", filename
-    
-    elif file_ext == 'pdf':
-        text = extract_text_from_pdf(file_path)
-        return text, None, "pdf", filename
-    
-    elif file_ext == 'docx':
-        text = extract_text_from_docx(file_path)
-        return text, None, "docx", filename
-    
-    elif file_ext == 'txt':
-        text = extract_text_from_txt(file_path)
-        return text, None, "txt", filename
-    
-    else:
-        return f"Unsupported file type: {file_ext}", None, "error", filename
-
-def is_moreyeahs_related(question):
-    """Check if the question is related to MoreYeahs"""
-    if not RAG_AVAILABLE:
-        return False
-        
-    moreyeahs_keywords = [
-        'moreyeahs', 'more yeahs', 'company', 'service', 'services', 'product', 'products',
-        'pricing', 'price', 'cost', 'contact', 'support', 'team', 'about us', 'location',
-        'office', 'business', 'client', 'customer', 'portfolio', 'work', 'project'
-    ]
-    
-    question_lower = question.lower()
-    return any(keyword in question_lower for keyword in moreyeahs_keywords)
-
 def get_chat_session(session_id, chat_type='general'):
     """Get or create chat session"""
     if session_id not in chat_sessions:
@@ -181,8 +79,24 @@ def get_chat_session(session_id, chat_type='general'):
         }
     return chat_sessions[session_id][chat_type]
 
-def get_hybrid_response(question, file_content=None, file_type=None, file_name=None, session_id=None):
+def send_with_retry(chat, content, deadline):
+    """Send a chat message, retrying transient errors; fails fast while the Gemini circuit is open"""
+    return call_with_retry(lambda timeout: chat.send_message(content, request_options={'timeout': timeout}), deadline)
+
+def unavailable_response(passages=()):
+    if passages:
+        excerpts = "\n\n".join(f"- {passage.strip()[:600]}" for passage in passages[:3])
+        return ("I can't reach the AI model right now, but here is what the MoreYeahs website says that looks relevant:\n\n"
+                f"{excerpts}"), "rag"
+    return "I apologize, but the AI service is temporarily unavailable. Please try again in a minute.", "error"
+
+def get_hybrid_response(question, file_content=None, file_type=None, file_name=None, session_id=None,
+                        file_metadata=None):
     """Get response using hybrid approach"""
+    deadline = Deadline()
+    
+    # Route plain questions once; the decision carries the question embedding for retrieval
+    route = router.route(session_id, question) if RAG_AVAILABLE and file_content is None else None
     
     # Handle image files
     if file_type == "image" and file_content is not None:
@@ -198,8 +112,20 @@ Please analyze the image and provide a comprehensive response. You can:
 
 Be detailed and helpful in your response.
 """
-            response = vision_model.generate_content([prompt, file_content])
+            ocr_text = (file_metadata or {}).get('ocr_text')
+            if ocr_text:
+                prompt += f"""
+Text detected in the image by OCR:
+{ocr_text[:4000]}
+"""
+            response = call_with_retry(
+                lambda timeout: vision_model.generate_content([prompt, file_content], request_options={'timeout': timeout}),
+                deadline
+            )
             return response.text, "file"
+        except LLMUnavailableError as e:
+            print(f"Model unavailable for image: {e}")
+            return unavailable_response()
         except Exception as e:
             print(f"Error processing image with AI: {str(e)}")
             return f"Error processing image: {str(e)}", "error"
@@ -208,7 +134,7 @@ Be detailed and helpful in your response.
     elif file_content is not None and file_type in ["pdf", "docx", "txt"]:
         try:
             # Truncate content if too long (Gemini has token limits)
-            max_chars = 30000  # Conservative limit
+            max_chars = MAX_FILE_CHARS  # Conservative limit
             content_preview = file_content[:max_chars] if len(file_content) > max_chars else file_content
             
             if len(file_content) > max_chars:
@@ -226,17 +152,21 @@ Please provide a detailed and helpful response based on the file content.
 """
             
             chat = get_chat_session(session_id, 'general')
-            response = chat.send_message(prompt)
+            response = send_with_retry(chat, prompt, deadline)
             return response.text, "file"
+        except LLMUnavailableError as e:
+            print(f"Model unavailable for file: {e}")
+            return unavailable_response()
         except Exception as e:
             print(f"Error processing text file: {str(e)}")
             return f"Error processing file: {str(e)}", "error"
     
     # MoreYeahs-related questions
-    elif is_moreyeahs_related(question) and RAG_AVAILABLE:
+    elif route is not None and route.is_company:
+        relevant_chunks = []
         try:
             if knowledge_ready:
-                relevant_chunks = retrieve_relevant_chunks(question)
+                relevant_chunks = retrieve_relevant_chunks(question, query_embedding=route.embedding)
                 if relevant_chunks:
                     context = "\n---\n".join(relevant_chunks)
                     
@@ -258,7 +188,7 @@ Answer:
 """
                     
                     chat = get_chat_session(session_id, 'rag')
-                    response = chat.send_message(prompt)
+                    response = send_with_retry(chat, prompt, deadline)
                     return response.text, "rag"
             
             # Fallback to general response
@@ -270,8 +200,11 @@ I don't have specific information about MoreYeahs in my knowledge base. Please p
 Be professional and helpful in your response.
 """
             chat = get_chat_session(session_id, 'general')
-            response = chat.send_message(prompt)
+            response = send_with_retry(chat, prompt, deadline)
             return response.text, "general"
+        except LLMUnavailableError as e:
+            print(f"Model unavailable for MoreYeahs question: {e}")
+            return unavailable_response(relevant_chunks)
         except Exception as e:
             print(f"Error in MoreYeahs response: {str(e)}")
             return "I apologize, but I encountered an error. Please try again or contact MoreYeahs directly for assistance.", "error"
@@ -279,8 +212,11 @@ Be professional and helpful in your response.
     # General questions
     try:
         chat = get_chat_session(session_id, 'general')
-        response = chat.send_message(question)
+        response = send_with_retry(chat, question, deadline)
         return response.text, "general"
+    except LLMUnavailableError as e:
+        print(f"Model unavailable: {e}")
+        return unavailable_response()
     except Exception as e:
         print(f"Error in general response: {str(e)}")
         return f"I apologize, but I encountered an error processing your question: {str(e)}", "error"
@@ -288,14 +224,37 @@ Be professional and helpful in your response.
 @app.route('/')
 def index():
     # Initialize session
-    if 'messages' not in session:
-        session['messages'] = []
-    if 'session_id' not in session:
-        session['session_id'] = str(int(time.time())) + str(os.getpid())
-    
+    get_session_id()
     return render_template('index.html')
 
+@app.route('/history', methods=['GET'])
+def history():
+    """Paginated chat history for the current session"""
+    try:
+        before_id = request.args.get('before', type=int)
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        messages, has_more = get_messages(get_session_id(), before_id=before_id, limit=limit)
+        return jsonify({
+            'messages': messages,
+            'has_more': has_more,
+            'next_before': messages[0]['id'] if messages and has_more else None
+        })
+    except Exception as e:
+        print(f"Error fetching history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/image/<image_id>', methods=['GET'])
+def serve_image(image_id):
+    """Serve a stored image thumbnail"""
+    data, mime_type = get_image(image_id, get_session_id())
+    if data is None:
+        return jsonify({'error': 'Image not found'}), 404
+    response = Response(data, mimetype=mime_type)
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
+
 @app.route('/initialize', methods=['POST'])
+@rate_limited('expensive', free_when=lambda: knowledge_ready or not RAG_AVAILABLE)
 def initialize():
     global knowledge_ready
     try:
@@ -313,6 +272,7 @@ def initialize():
         return jsonify({'success': False, 'message': f'Error initializing: {str(e)}'})
 
 @app.route('/chat', methods=['POST'])
+@rate_limited('chat')
 def chat():
     try:
         question = request.form.get('message', '').strip()
@@ -324,54 +284,30 @@ def chat():
         file_type = None
         file_name = None
         file_data_url = None
+        file_metadata = None
+        image_id = None
+        session_id = get_session_id()
         
         if 'file' in request.files:
             file = request.files['file']
             if file and file.filename and allowed_file(file.filename):
                 try:
-                    filename = secure_filename(file.filename)
-                    # Add timestamp to avoid conflicts
-                    timestamp = str(int(time.time()))
-                    filename = f"{timestamp}_{filename}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    
-                    # Save file
-                    file.save(file_path)
-                    
-                    # Verify file was saved
-                    if not os.path.exists(file_path):
-                        return jsonify({'error': 'Failed to save uploaded file'}), 500
-                    
-                    # Process the file
-                    file_content, _, file_type, original_name = process_uploaded_file(file_path, file.filename)
+                    # Process the upload straight from the request stream
+                    file_content, file_metadata, file_type, original_name = process_uploaded_file(
+                        open_upload(file), file.filename, max_chars=MAX_FILE_CHARS
+                    )
                     file_name = original_name
                     
-                    # For images, create data URL for display
-                    if file_type == "image" and isinstance(file_content, Image.Image):
+                    # For images, store the preview thumbnail server-side and reference it by URL
+                    if file_type == "image" and file_metadata and file_metadata.get('thumbnail'):
                         try:
-                            buffered = io.BytesIO()
-                            # Save as JPEG for better compatibility
-                            file_content.save(buffered, format="JPEG", quality=85)
-                            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                            file_data_url = f"data:image/jpeg;base64,{img_base64}"
+                            image_id = save_image(session_id, file_metadata['thumbnail'], "image/jpeg")
+                            file_data_url = image_url(image_id)
                         except Exception as e:
-                            print(f"Error creating image data URL: {str(e)}")
-                            # Fallback to PNG
-                            try:
-                                buffered = io.BytesIO()
-                                file_content.save(buffered, format="PNG")
-                                img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                                file_data_url = f"data:image/png;base64,{img_base64}"
-                            except Exception as e2:
-                                print(f"Error creating PNG data URL: {str(e2)}")
-                                file_data_url = None
+                            print(f"Error storing image thumbnail: {str(e)}")
+                            image_id = None
+                            file_data_url = None
                     
-                    # Clean up uploaded file
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        print(f"Warning: Could not remove temporary file {file_path}: {str(e)}")
-                        
                 except Exception as e:
                     print(f"Error processing uploaded file: {str(e)}")
                     return jsonify({'error': f'Error processing uploaded file: {str(e)}'}), 500
@@ -379,18 +315,17 @@ def chat():
                 return jsonify({'error': 'File type not allowed. Please upload: txt, pdf, png, jpg, jpeg, gif, bmp, docx'}), 400
         
         # Get response
-        session_id = session.get('session_id')
         response_text, response_type = get_hybrid_response(
-            question, file_content, file_type, file_name, session_id
+            question, file_content, file_type, file_name, session_id, file_metadata
         )
         
-        # Save to session
         user_message = {
             'role': 'user',
             'content': question,
             'file_name': file_name,
             'file_type': file_type,
             'file_data_url': file_data_url,
+            'image_id': image_id,
             'timestamp': datetime.now().strftime('%H:%M')
         }
         
@@ -401,11 +336,9 @@ def chat():
             'timestamp': datetime.now().strftime('%H:%M')
         }
         
-        if 'messages' not in session:
-            session['messages'] = []
-        
-        session['messages'].extend([user_message, assistant_message])
-        session.modified = True
+        # Save to the server-side message store; the cookie only carries session_id
+        append_messages(session_id, [user_message, assistant_message])
+        user_message.pop('image_id', None)
         
         return jsonify({
             'user_message': user_message,
@@ -419,17 +352,18 @@ def chat():
 @app.route('/clear', methods=['POST'])
 def clear_chat():
     try:
-        session['messages'] = []
-        session_id = session.get('session_id')
+        session_id = get_session_id()
+        clear_session(session_id)
+        router.forget(session_id)
         if session_id in chat_sessions:
             del chat_sessions[session_id]
-        session.modified = True
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error clearing chat: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/refresh', methods=['POST'])
+@rate_limited('expensive')
 def refresh_knowledge():
     global knowledge_ready
     try:
@@ -450,7 +384,6 @@ def handle_exception(e):
 
 if __name__ == '__main__':
     print("Starting MoreYeahs AI Assistant...")
-    print(f"Upload folder: {UPLOAD_FOLDER}")
     print(f"Allowed file types: {', '.join(ALLOWED_EXTENSIONS)}")
     print(f"Max file size: {MAX_CONTENT_LENGTH // (1024*1024)}MB")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,106 @@
+# history_manager.py
+
+import os
+import re
+
+from prompt_builder import CONTEXT_BLOCK_MARKERS, estimate_tokens, truncate_to_tokens
+
+# Number of most recent turns sent to the model verbatim
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+# Token budget for the history portion of each turn (summary + recent turns)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Upper bound on the rolling summary of older turns
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "400"))
+
+def strip_context_blocks(text):
+    """Remove context blocks injected by the prompt templates (retrieved chunks, file dumps) from a user message."""
+    if not text:
+        return ""
+    cut = len(text)
+    for marker in CONTEXT_BLOCK_MARKERS:
+        pos = text.find(marker)
+        if pos != -1:
+            cut = min(cut, pos)
+    return text[:cut].strip()
+
+def _first_sentence(text, max_chars=160):
+    text = re.sub(r"\s+", " ", text or "").strip()
+    match = re.search(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rstrip() + "..."
+    return sentence
+
+class ConversationHistory:
+    """
+    Per-session conversation history with compaction.
+
+    The last `recent_turns` turns are kept verbatim; older turns are folded
+    into a rolling summary so the history sent with each turn stays within
+    `token_budget` tokens. A single turn over the budget on its own is cut
+    down to it.
+    """
+
+    def __init__(self, recent_turns=HISTORY_RECENT_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                 summary_tokens=HISTORY_SUMMARY_TOKENS):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.turns = []  # list of (user_text, model_text)
+        self.summary = ""
+
+    def add_turn(self, user_text, model_text):
+        """Record a finished turn and compact older turns into the summary."""
+        # Only user text can carry injected context; answers are kept as written
+        self.turns.append((strip_context_blocks(user_text), model_text or ""))
+        self._compact()
+
+    def _fold(self, turn):
+        user_text, model_text = turn
+        line = f"- User asked: {_first_sentence(user_text)} Assistant: {_first_sentence(model_text)}"
+        summary = f"{self.summary}\n{line}".strip()
+        # Keep the most recent part of the summary when it grows past its cap
+        max_chars = self.summary_tokens * 4
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+            summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+        self.summary = summary
+
+    def _compact(self):
+        while len(self.turns) > self.recent_turns:
+            self._fold(self.turns.pop(0))
+        while len(self.turns) > 1 and self.history_tokens() > self.token_budget:
+            self._fold(self.turns.pop(0))
+        if self.turns and self.history_tokens() > self.token_budget:
+            self._fit_last_turn()
+
+    def _fit_last_turn(self):
+        available = max(self.token_budget - estimate_tokens(self.summary), 0)
+        user_text, model_text = self.turns[-1]
+        # The question keeps at least half of the room; the answer gets the rest
+        user_text = truncate_to_tokens(user_text, max(available - estimate_tokens(model_text), available // 2))
+        model_room = max(available - estimate_tokens(user_text), 0)
+        if not model_room:
+            # The summary (or the cut question alone) fills the budget: nothing of this turn fits
+            self.turns.pop()
+            return
+        model_text = truncate_to_tokens(model_text, model_room)
+        self.turns[-1] = (user_text, model_text)
+
+    def history_tokens(self):
+        """Estimated token count of the history sent with the next turn."""
+        total = estimate_tokens(self.summary)
+        for user_text, model_text in self.turns:
+            total += estimate_tokens(user_text) + estimate_tokens(model_text)
+        return total
+
+    def as_chat_history(self):
+        """Build a Gemini `start_chat(history=...)` list from the summary and recent turns."""
+        history = []
+        if self.summary:
+            history.append({'role': 'user', 'parts': [f"Summary of our earlier conversation:\n{self.summary}"]})
+            history.append({'role': 'model', 'parts': ["Understood, I'll keep that context in mind."]})
+        for user_text, model_text in self.turns:
+            history.append({'role': 'user', 'parts': [user_text]})
+            history.append({'role': 'model', 'parts': [model_text]})
+        return history
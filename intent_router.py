@@ -0,0 +1,248 @@
+# intent_router.py
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Terms that on their own make a message about MoreYeahs, and weaker ones that only count together
+COMPANY_TERMS = [
+    'moreyeahs', 'more yeahs', 'about us', 'founder', 'co-founder', 'ceo', 'cto', 'founded', 'established',
+    'owner', 'headquarters', 'leadership', 'management team', 'director', 'executive', 'services',
+    'portfolio', 'pricing', 'careers', 'career', 'job opening', 'job openings', 'vacancy', 'vacancies',
+    'hiring', 'recruitment', 'contact', 'phone number', 'email address', 'office', 'address',
+]
+CONTEXT_TERMS = [
+    'company', 'your company', 'this company', 'the company', 'our company', 'your team', 'your services',
+    'your products', 'your clients', 'what do you do', 'how can you help', 'what services', 'who is behind',
+    'who founded', 'who owns', 'who started', 'work with you', 'hire you', 'you guys', 'client', 'clients',
+    'customer', 'customers', 'product', 'products', 'service', 'support', 'location', 'business', 'apply',
+]
+# Short messages with these words usually continue the previous topic
+FOLLOW_UP_TERMS = [
+    'it', 'its', 'they', 'them', 'their', 'that', 'those', 'this', 'he', 'she', 'his', 'her',
+    'more', 'also', 'else', 'what about', 'and', 'who else', 'anything else',
+]
+
+COMPANY_WEIGHT = 1.0
+CONTEXT_WEIGHT = 0.5
+# Topic score carried between turns is multiplied by this each message
+TOPIC_DECAY = float(os.getenv("ROUTER_TOPIC_DECAY", "0.5"))
+# Combined (message + carried) score needed to treat a message as a company question
+TOPIC_THRESHOLD = float(os.getenv("ROUTER_TOPIC_THRESHOLD", "0.9"))
+FOLLOW_UP_MAX_WORDS = 8
+ROUTER_MAX_SESSIONS = int(os.getenv("ROUTER_MAX_SESSIONS", "10000"))
+
+# Semantic routing: the question embedding is compared with the route prototypes below.
+# Set ROUTER_EMBEDDINGS=0 to route on keywords alone.
+ROUTER_EMBEDDINGS = os.getenv("ROUTER_EMBEDDINGS", "1") == "1"
+# Similarity to the closest company prototype at or above which a question is a company question...
+ROUTE_COMPANY_THRESHOLD = float(os.getenv("ROUTE_COMPANY_THRESHOLD", "0.55"))
+# ...and below which it is general unless keywords or the conversation say otherwise
+ROUTE_GENERAL_THRESHOLD = float(os.getenv("ROUTE_GENERAL_THRESHOLD", "0.30"))
+# How much closer one route's prototypes must be than the other's for a confident call
+ROUTE_MARGIN = float(os.getenv("ROUTE_MARGIN", "0.05"))
+ROUTE_PROTOTYPES = {
+    'company': [
+        "Who founded MoreYeahs?",
+        "Who is the CEO of the company?",
+        "Tell me about MoreYeahs.",
+        "What services does your company offer?",
+        "What technologies do you work with for clients?",
+        "Can you show me projects from your portfolio?",
+        "How much does it cost to build an app with you?",
+        "How can I contact you?",
+        "What is your phone number or email address?",
+        "Where is your office located?",
+        "Are you hiring right now?",
+        "What job openings do you have?",
+        "Tell me about your team and leadership.",
+        "Which industries and clients do you work with?",
+        "Do you offer support and maintenance after launch?",
+    ],
+    'general': [
+        "What is the capital of France?",
+        "Explain how photosynthesis works.",
+        "Write a Python function to reverse a string.",
+        "What's a good recipe for pasta?",
+        "Translate this sentence into Spanish.",
+        "How do I fix a null pointer exception?",
+        "Summarize the plot of Hamlet.",
+        "What is machine learning?",
+        "Give me tips for a job interview.",
+        "What's the difference between TCP and UDP?",
+        "How many days are there in a leap year?",
+        "Help me write an email to my landlord.",
+    ],
+}
+
+def _compile_terms(terms):
+    # One alternation, longest first so multi-word terms win over their prefixes
+    pattern = "|".join(re.escape(term).replace(r"\ ", r"\s+") for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE)
+
+class RouteDecision:
+    """
+    Outcome of routing one message. `embedding` is the normalized question
+    embedding (1 x dim float32) when semantic routing ran; pass it on to
+    retrieval so the question is only embedded once.
+    """
+
+    def __init__(self, intent, confidence, method, matches=(), latency_ms=0.0, similarities=None, embedding=None):
+        self.intent = intent
+        self.confidence = confidence
+        self.method = method
+        self.matches = list(matches)
+        self.latency_ms = latency_ms
+        self.similarities = similarities or {}
+        self.embedding = embedding
+
+    @property
+    def is_company(self):
+        return self.intent == 'company'
+
+    def as_dict(self):
+        return {
+            'intent': self.intent,
+            'confidence': round(self.confidence, 3),
+            'method': self.method,
+            'matches': self.matches,
+            'similarities': {route: round(value, 3) for route, value in self.similarities.items()},
+            'latency_ms': round(self.latency_ms, 3),
+        }
+
+class TopicState:
+    """Per-session topic memory, updated incrementally as messages arrive."""
+
+    def __init__(self):
+        self.score = 0.0
+        self.last_intent = None
+        self.turns = 0
+
+class IntentRouter:
+    """
+    Decides whether a message is about MoreYeahs, and so worth a retrieval
+    and a company prompt. Shared by all front ends (more.py, flk.py, app.py).
+
+    The question embedding is compared with precomputed route prototypes;
+    confident matches decide directly, except that a short follow-up to a
+    company turn stays on the company topic. In the uncertain band, or when no
+    embedder is available, compiled term patterns on the new message and a
+    decaying per-session topic score decide instead, so the conversation is
+    never re-scanned.
+    """
+
+    def __init__(self, use_embeddings=ROUTER_EMBEDDINGS):
+        self.company_pattern = _compile_terms(COMPANY_TERMS)
+        self.context_pattern = _compile_terms(CONTEXT_TERMS)
+        self.follow_up_pattern = _compile_terms(FOLLOW_UP_TERMS)
+        self.use_embeddings = use_embeddings
+        self._prototypes = None
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def score_message(self, message):
+        """Keyword score of a single message and the terms that matched."""
+        company = [m.group(0).lower() for m in self.company_pattern.finditer(message)]
+        context = [m.group(0).lower() for m in self.context_pattern.finditer(message)]
+        score = COMPANY_WEIGHT * len(set(company)) + CONTEXT_WEIGHT * len(set(context))
+        return score, company + context
+
+    def _state(self, session_id):
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                state = self._states[session_id] = TopicState()
+                while len(self._states) > ROUTER_MAX_SESSIONS:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(session_id)
+            return state
+
+    def forget(self, session_id):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def _route_prototypes(self):
+        if self._prototypes is None:
+            from rag_pipeline import embed_query
+            self._prototypes = {route: embed_query(examples) for route, examples in ROUTE_PROTOTYPES.items()}
+        return self._prototypes
+
+    def similarities(self, embedding):
+        """Cosine similarity of a normalized question embedding to each route's closest prototype."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        return {route: float(np.max(prototypes @ vector)) for route, prototypes in self._route_prototypes().items()}
+
+    def _embed(self, message, embed=None):
+        if not self.use_embeddings:
+            return None, {}
+        try:
+            if embed is not None:
+                embedding = embed()
+            else:
+                from rag_pipeline import embed_query
+                embedding = embed_query(message)
+            return embedding, self.similarities(embedding)
+        except Exception as e:
+            # Only this message falls back; the next one tries the embedder again
+            print(f" Semantic routing failed for this message, using keywords: {e}")
+            return None, {}
+
+    def route(self, session_id, message, embed=None):
+        """
+        Route a message. session_id may be None for front ends without
+        conversations; topic carry-over is then skipped. `embed` is an
+        optional callable returning the message embedding, e.g. from a
+        retrieval already running in the background.
+        """
+        start = time.perf_counter()
+        state = self._state(session_id) if session_id is not None else TopicState()
+        score, matches = self.score_message(message)
+        carried = state.score * TOPIC_DECAY
+        combined = carried + score
+        is_follow_up = (state.last_intent == 'company' and len(message.split()) <= FOLLOW_UP_MAX_WORDS
+                        and self.follow_up_pattern.search(message) is not None)
+
+        embedding, sims = self._embed(message, embed)
+        company_sim = sims.get('company', 0.0)
+        general_sim = sims.get('general', 0.0)
+
+        # A confident company verdict, then follow-ups to a company turn (short, so they look like
+        # nothing semantically), then a confident general verdict. A merely low company similarity
+        # yields to the topic carried over from earlier turns.
+        if sims and company_sim >= ROUTE_COMPANY_THRESHOLD and company_sim - general_sim >= ROUTE_MARGIN:
+            intent, method, confidence = 'company', 'semantic', company_sim
+        elif is_follow_up:
+            intent, method, confidence = 'company', 'follow-up', 0.5
+        elif sims and general_sim - company_sim >= ROUTE_MARGIN:
+            intent, method, confidence = 'general', 'semantic', general_sim
+        elif sims and company_sim < ROUTE_GENERAL_THRESHOLD and not (score > 0 and combined >= TOPIC_THRESHOLD):
+            intent, method, confidence = 'general', 'semantic', 1.0 - company_sim
+        elif score >= COMPANY_WEIGHT:
+            intent, method = 'company', 'keywords'
+            confidence = min(1.0, combined / (TOPIC_THRESHOLD * 2))
+        elif score > 0 and combined >= TOPIC_THRESHOLD:
+            intent, method = 'company', 'keywords'
+            confidence = min(1.0, combined / (TOPIC_THRESHOLD * 2))
+        else:
+            intent, method = 'general', 'keywords'
+            confidence = 1.0 - min(1.0, combined / TOPIC_THRESHOLD)
+
+        with self._lock:
+            state.score = combined if intent == 'company' else carried
+            state.last_intent = intent
+            state.turns += 1
+
+        decision = RouteDecision(
+            intent, confidence, method, matches, (time.perf_counter() - start) * 1000, sims, embedding
+        )
+        similarity = f", company similarity {company_sim:.2f}" if sims else ""
+        print(f" Route: {decision.intent} via {decision.method} (confidence {decision.confidence:.2f}{similarity}, "
+              f"matched {decision.matches or 'nothing'}) in {decision.latency_ms:.2f}ms")
+        return decision
+
+router = IntentRouter()
@@ -0,0 +1,315 @@
+# llm_client.py
+
+import datetime
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+
+from prompt_builder import estimate_tokens
+
+try:
+    import google.generativeai as genai
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
+
+# "gemini" talks to the Gemini API; "fake" answers locally so the app can run and be tested offline
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+# Register the system instruction as Gemini cached content (opt in: billed per cached hour)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+# Gemini refuses to cache less than this many tokens; smaller instructions are sent as a plain system instruction
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+# Lifetime of a cached context in seconds; it is recreated shortly before it expires
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# Context caching needs a pinned model version; defaults to "<model>-001"
+GEMINI_CACHE_MODEL = os.getenv("GEMINI_CACHE_MODEL")
+CACHE_RENEW_MARGIN = 60
+# Attempts per model call for rate limits, overload and timeouts, with jittered exponential backoff
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Time budget in seconds for all model calls made for one user request, retries and failover included
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "30"))
+# Consecutive upstream failures that open the circuit, and seconds it stays open before a trial call
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_MESSAGE = re.compile(
+    r"\b(408|429|500|502|503|504)\b|rate limit|quota|resource exhausted|unavailable|overloaded|timed? ?out|deadline",
+    re.IGNORECASE
+)
+
+def configure(api_key):
+    if GENAI_AVAILABLE:
+        genai.configure(api_key=api_key)
+
+class LLMUnavailableError(Exception):
+    """The model cannot answer right now: the circuit is open, the deadline passed or every attempt failed."""
+
+class CircuitOpenError(LLMUnavailableError):
+    """This model's circuit is open; another model may still answer."""
+
+class RetriesExhaustedError(LLMUnavailableError):
+    """Every attempt failed with a transient error (rate limit, overload, timeout); another model may still answer."""
+
+def is_retryable(error):
+    """Transient upstream errors (rate limits, overload, timeouts) worth retrying."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return bool(RETRYABLE_MESSAGE.search(str(error)))
+
+class Deadline:
+    """A point in time all model calls for one request must finish by."""
+
+    def __init__(self, seconds=LLM_REQUEST_DEADLINE):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive upstream failures so callers fail
+    fast instead of waiting out timeouts. After `reset_after` seconds one
+    trial call is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failures=LLM_BREAKER_FAILURES, reset_after=LLM_BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = 'closed'
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = 'half-open'
+                self._trial = False
+            if self.state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print(f" Circuit {self.name} closed")
+            self.state = 'closed'
+            self.consecutive = 0
+
+    def record_neutral(self):
+        """An answer that says nothing about health: leave the state alone, but free a half-open trial."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == 'half-open' or (self.state == 'closed' and self.consecutive >= self.failures):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                print(f" Circuit {self.name} open for {self.reset_after:.0f}s after {self.consecutive} failures")
+
+    def as_dict(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.consecutive}
+
+upstream = CircuitBreaker("gemini")
+
+def call_with_retry(call, deadline=None, breaker=upstream, label="model", record=None):
+    """
+    Run call(timeout) -> response, retrying transient errors with jittered
+    exponential backoff within the deadline. `record(latency_ms, ok)` is
+    called after every answer and every transient failure. Raises LLMUnavailableError when the
+    circuit is open, the deadline passes or attempts run out on transient
+    errors (chained to the last one); other errors are raised as they are.
+    """
+    deadline = deadline or Deadline()
+    for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit is open")
+        timeout = deadline.remaining()
+        if timeout <= 0:
+            raise LLMUnavailableError(f"Deadline passed before {label} answered")
+        start = time.perf_counter()
+        try:
+            response = call(timeout)
+            response.text  # Blocked or empty responses raise here
+        except Exception as e:
+            if not is_retryable(e):
+                # The upstream answered, just not usefully (bad request, blocked or empty answer):
+                # that says nothing about its health, so neither the breaker nor the stats count it
+                breaker.record_neutral()
+                raise
+            if record:
+                record((time.perf_counter() - start) * 1000, False)
+            breaker.record_failure()
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+            if attempt == LLM_MAX_ATTEMPTS or delay >= deadline.remaining():
+                raise RetriesExhaustedError(f"{label} failed after {attempt} attempts: {e}") from e
+            print(f" {label} attempt {attempt} failed ({e}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        if record:
+            record((time.perf_counter() - start) * 1000, True)
+        breaker.record_success()
+        return response
+
+def instruction_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, **kwargs):
+        response = self.model._respond(content, self.history)
+        self.history.append({'role': 'user', 'parts': [content]})
+        self.history.append({'role': 'model', 'parts': [response.text]})
+        return response
+
+class FakeModel:
+    """
+    Offline stand-in for genai.GenerativeModel. Records every call in
+    `calls` (system instruction, history length, prompt) and answers with
+    deterministic text derived from the prompt.
+    """
+
+    def __init__(self, model_name, system_instruction=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.calls = []
+
+    def _respond(self, content, history=()):
+        parts = content if isinstance(content, (list, tuple)) else [content]
+        prompt = "\n".join(part for part in parts if isinstance(part, str))
+        self.calls.append({
+            'system_instruction': self.system_instruction,
+            'history': len(history),
+            'prompt': prompt,
+            'attachments': len(parts) - sum(isinstance(part, str) for part in parts),
+        })
+        first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), "")
+        return FakeResponse(f"[{self.model_name}] {first_line[:200]}")
+
+    def generate_content(self, content, **kwargs):
+        return self._respond(content)
+
+    def start_chat(self, history=None):
+        return FakeChat(self, history)
+
+class _ModelEntry:
+    def __init__(self, key, model, cache=None):
+        self.key = key
+        self.model = model
+        self.cache = cache
+        self.created = time.time()
+
+class ModelClient:
+    """
+    Hands out models bound to a system instruction, one per model name.
+
+    The static instructions and knowledge-base summary go into the system
+    instruction once per index version instead of into every prompt. Each
+    model is rebuilt only when the instruction changes; with
+    GEMINI_CONTEXT_CACHE=1 a large enough instruction is registered as
+    Gemini cached content. Requests already using the previous cache may
+    still be running, so it is left to expire at the end of its TTL.
+    """
+
+    def __init__(self, backend=LLM_BACKEND):
+        self.backend = backend
+        self._entries = {}
+        self._bare = {}
+        self._building = {}  # name -> Event set when the entry being built is installed
+        self._lock = threading.Lock()
+        if backend != "fake" and not GENAI_AVAILABLE:
+            raise RuntimeError("google-generativeai is not installed (set LLM_BACKEND=fake to run offline)")
+
+    def _create(self, name, system_instruction=None):
+        if self.backend == "fake":
+            return FakeModel(name, system_instruction)
+        if system_instruction:
+            return genai.GenerativeModel(name, system_instruction=system_instruction)
+        return genai.GenerativeModel(name)
+
+    def model(self, name, system_instruction=None, version=None):
+        """The model called `name`, bound to the instruction (built or cached on first use)."""
+        if not system_instruction:
+            with self._lock:
+                if name not in self._bare:
+                    self._bare[name] = self._create(name)
+                return self._bare[name]
+        key = (name, instruction_key(system_instruction))
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry.key == key and not self._expiring(entry):
+                    return entry.model
+                building = self._building.get(name)
+                if building is None:
+                    building = self._building[name] = threading.Event()
+                    break
+            # Another request is building this model; the cache API call is not made twice
+            building.wait()
+        try:
+            # Built outside the lock: creating a cached context is a network call
+            new = self._build(key, name, system_instruction, version)
+            with self._lock:
+                self._entries[name] = new
+            return new.model
+        finally:
+            with self._lock:
+                del self._building[name]
+            building.set()
+
+    def _expiring(self, entry):
+        return entry.cache is not None and time.time() - entry.created > GEMINI_CACHE_TTL - CACHE_RENEW_MARGIN
+
+    def _build(self, key, name, system_instruction, version):
+        label = f"index {version}" if version else "no index"
+        if self.backend != "fake" and GEMINI_CONTEXT_CACHE:
+            tokens = estimate_tokens(system_instruction)
+            if tokens >= GEMINI_CACHE_MIN_TOKENS:
+                try:
+                    from google.generativeai import caching
+                    cache = caching.CachedContent.create(
+                        model=GEMINI_CACHE_MODEL or f"models/{name}-001",
+                        display_name=f"moreyeahs-{key[1]}",
+                        system_instruction=system_instruction,
+                        ttl=datetime.timedelta(seconds=GEMINI_CACHE_TTL),
+                    )
+                    print(f" Cached system context for {name} ({label}, ~{tokens} tokens): {cache.name}")
+                    return _ModelEntry(key, genai.GenerativeModel.from_cached_content(cached_content=cache), cache)
+                except Exception as e:
+                    print(f" Context caching failed for {name}, using a system instruction: {e}")
+            else:
+                print(f" System context too small to cache (~{tokens} < {GEMINI_CACHE_MIN_TOKENS} tokens)")
+        print(f" System instruction set for {name} ({label}, ~{estimate_tokens(system_instruction)} tokens)")
+        return _ModelEntry(key, self._create(name, system_instruction))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'models': {name: {'instruction': entry.key[1], 'cached': entry.cache is not None}
+                           for name, entry in self._entries.items()},
+            }
@@ -0,0 +1,143 @@
+# message_store.py
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# SQLite database holding chat messages and image thumbnails
+MESSAGE_DB_PATH = os.getenv("MESSAGE_DB_PATH", "chat_messages.db")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    type TEXT,
+    file_name TEXT,
+    file_type TEXT,
+    image_id TEXT,
+    timestamp TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_session ON images (session_id);
+"""
+
+def get_connection():
+    """Return this thread's connection, creating the schema on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(MESSAGE_DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def save_image(session_id, data, mime_type="image/jpeg"):
+    """Store an image blob (e.g. a thumbnail) and return its ID."""
+    image_id = uuid.uuid4().hex
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO images (id, session_id, mime_type, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (image_id, session_id, mime_type, sqlite3.Binary(data), time.time())
+        )
+    return image_id
+
+def get_image(image_id, session_id):
+    """Return (data, mime_type) for a session's image, or (None, None) if it doesn't exist."""
+    row = get_connection().execute(
+        "SELECT data, mime_type FROM images WHERE id = ? AND session_id = ?", (image_id, session_id)
+    ).fetchone()
+    if row is None:
+        return None, None
+    return bytes(row["data"]), row["mime_type"]
+
+def image_url(image_id):
+    return f"/image/{image_id}" if image_id else None
+
+def append_messages(session_id, messages):
+    """Append message dicts to a session's history and return their IDs."""
+    conn = get_connection()
+    ids = []
+    with conn:
+        for message in messages:
+            cursor = conn.execute(
+                "INSERT INTO messages (session_id, role, content, type, file_name, file_type, image_id, timestamp, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    message.get('role'),
+                    message.get('content'),
+                    message.get('type'),
+                    message.get('file_name'),
+                    message.get('file_type'),
+                    message.get('image_id'),
+                    message.get('timestamp'),
+                    time.time(),
+                )
+            )
+            ids.append(cursor.lastrowid)
+    return ids
+
+def _row_to_message(row):
+    message = {
+        'id': row["id"],
+        'role': row["role"],
+        'content': row["content"],
+        'timestamp': row["timestamp"],
+    }
+    if row["role"] == 'user':
+        message['file_name'] = row["file_name"]
+        message['file_type'] = row["file_type"]
+        message['file_data_url'] = image_url(row["image_id"])
+    else:
+        message['type'] = row["type"]
+    return message
+
+def get_messages(session_id, before_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Fetch a page of a session's messages in chronological order.
+
+    Pages go backwards in time: pass the smallest `id` of the previous page
+    as `before_id` to get older messages.
+
+    Returns:
+        tuple: (messages, has_more)
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = "SELECT * FROM messages WHERE session_id = ?"
+    params = [session_id]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(int(before_id))
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    rows = get_connection().execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return [_row_to_message(row) for row in reversed(rows)], has_more
+
+def clear_session(session_id):
+    """Delete all messages and images belonging to a session."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM images WHERE session_id = ?", (session_id,))
@@ -0,0 +1,230 @@
+# model_router.py
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from llm_client import (
+    call_with_retry, is_retryable, CircuitBreaker, CircuitOpenError, RetriesExhaustedError, Deadline, LLMUnavailableError
+)
+
+def _model_list(name, default):
+    return [model.strip() for model in os.getenv(name, default).split(",") if model.strip()]
+
+# Models per tier, preferred first; the rest of the list (then the other tiers) are fallbacks
+MODEL_TIERS = {
+    'fast': _model_list("GEMINI_FAST_MODELS", "gemini-2.0-flash-lite,gemini-2.0-flash"),
+    'strong': _model_list("GEMINI_STRONG_MODELS", "gemini-2.0-flash,gemini-1.5-flash"),
+    'vision': _model_list("GEMINI_VISION_MODELS", "gemini-2.0-flash,gemini-1.5-pro"),
+}
+# Company questions up to this many words, without files, go to the fast tier
+FAST_TIER_MAX_WORDS = int(os.getenv("FAST_TIER_MAX_WORDS", "20"))
+# Calls per model kept for the rolling latency percentiles and error rate
+MODEL_STATS_WINDOW = int(os.getenv("MODEL_STATS_WINDOW", "100"))
+# Calls needed before a model can be judged degraded
+MODEL_MIN_SAMPLES = int(os.getenv("MODEL_MIN_SAMPLES", "5"))
+# A model failing more often than this is tried after the healthy ones
+MODEL_MAX_ERROR_RATE = float(os.getenv("MODEL_MAX_ERROR_RATE", "0.3"))
+# ...until this many seconds after its last failure, when it gets another chance
+MODEL_RETRY_AFTER = float(os.getenv("MODEL_RETRY_AFTER", "30"))
+# A model whose p95 latency is above this (ms) is slow: requests to it are hedged
+MODEL_SLOW_P95_MS = float(os.getenv("MODEL_SLOW_P95_MS", "8000"))
+# Set MODEL_HEDGE=0 to only fail over, never send a second copy of a slow request
+MODEL_HEDGE = os.getenv("MODEL_HEDGE", "1") == "1"
+# Never hedge sooner than this (ms), however fast the slow model's median is
+MODEL_HEDGE_MIN_MS = float(os.getenv("MODEL_HEDGE_MIN_MS", "1000"))
+MODEL_CALL_WORKERS = int(os.getenv("MODEL_CALL_WORKERS", "16"))
+
+# Lookups and short factual asks, as opposed to requests to write, explain or compare
+FAQ_PATTERN = re.compile(
+    r"^\s*(who|what|where|when|which|how (many|much|can i|do i)|is|are|do|does|can)\b", re.IGNORECASE
+)
+COMPLEX_PATTERN = re.compile(
+    r"\b(explain|compare|analy[sz]e|summari[sz]e|write|draft|plan|design|step by step|in detail|why)\b", re.IGNORECASE
+)
+
+class ModelStats:
+    """Rolling latency and error window for one model."""
+
+    def __init__(self, window=MODEL_STATS_WINDOW):
+        self.calls = deque(maxlen=window)  # (latency_ms, ok)
+        self.last_failure = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms, ok):
+        with self.lock:
+            self.calls.append((latency_ms, ok))
+            if not ok:
+                self.last_failure = time.time()
+
+    def latency(self, percentile):
+        with self.lock:
+            latencies = [ms for ms, ok in self.calls if ok]
+        return float(np.percentile(latencies, percentile)) if latencies else None
+
+    def error_rate(self):
+        with self.lock:
+            if not self.calls:
+                return 0.0
+            return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    def judged(self):
+        return len(self.calls) >= MODEL_MIN_SAMPLES
+
+    def failing(self):
+        return (self.judged() and self.error_rate() > MODEL_MAX_ERROR_RATE
+                and time.time() - self.last_failure < MODEL_RETRY_AFTER)
+
+    def slow(self):
+        p95 = self.latency(95)
+        return self.judged() and p95 is not None and p95 > MODEL_SLOW_P95_MS
+
+    def as_dict(self):
+        p50, p95 = self.latency(50), self.latency(95)
+        return {
+            'calls': len(self.calls),
+            'p50_ms': round(p50, 1) if p50 is not None else None,
+            'p95_ms': round(p95, 1) if p95 is not None else None,
+            'error_rate': round(self.error_rate(), 3),
+            'failing': self.failing(),
+            'slow': self.slow(),
+        }
+
+class ModelRouter:
+    """
+    Picks a model tier per request and calls it with failover.
+
+    Short FAQ-style company questions go to the fast tier; long, complex
+    and file-based ones to the strong tier. Within the candidate list,
+    models with a high rolling error rate are moved to the back until
+    MODEL_RETRY_AFTER seconds pass without a failure. A request
+    to a model whose p95 is over MODEL_SLOW_P95_MS is hedged: if it has not
+    answered by that model's p50 (at least MODEL_HEDGE_MIN_MS), the next candidate gets the same request
+    and the first answer wins. Each call is retried on transient errors
+    (see llm_client.call_with_retry); a model that still fails, or whose
+    own circuit breaker is open, falls through to the next one, all within
+    the request's deadline. Other errors (bad requests, blocked prompts)
+    are raised at once, since every model would fail them the same way.
+    """
+
+    def __init__(self, client, tiers=None):
+        self.client = client
+        self.tiers = tiers or MODEL_TIERS
+        self.stats = {}
+        self.breakers = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=MODEL_CALL_WORKERS, thread_name_prefix="model-call")
+
+    def choose_tier(self, question, is_company=False, file_type=None):
+        if file_type == "image":
+            return 'vision'
+        if file_type is not None:
+            return 'strong'
+        words = len(question.split())
+        if is_company and words <= FAST_TIER_MAX_WORDS and FAQ_PATTERN.search(question) \
+                and not COMPLEX_PATTERN.search(question):
+            return 'fast'
+        return 'strong'
+
+    def _stats(self, name):
+        with self._lock:
+            if name not in self.stats:
+                self.stats[name] = ModelStats()
+            return self.stats[name]
+
+    def _breaker(self, name):
+        with self._lock:
+            if name not in self.breakers:
+                self.breakers[name] = CircuitBreaker(f"gemini:{name}")
+            return self.breakers[name]
+
+    def candidates(self, tier):
+        """Models to try for a tier: its own first, then the other text tiers; failing models last."""
+        names = list(self.tiers[tier])
+        if tier != 'vision':
+            for other in ('strong', 'fast'):
+                names.extend(name for name in self.tiers[other] if name not in names)
+        return [name for name in names if not self._stats(name).failing()] + \
+               [name for name in names if self._stats(name).failing()]
+
+    def hedge_delay(self, name):
+        """Seconds to wait for `name` before hedging, or None to wait as long as it takes."""
+        stats = self._stats(name)
+        if not MODEL_HEDGE or not stats.slow():
+            return None
+        return max(stats.latency(50), MODEL_HEDGE_MIN_MS) / 1000
+
+    def _call(self, name, call, system_instruction, version, deadline):
+        model = self.client.model(name, system_instruction, version)
+        return call_with_retry(
+            lambda timeout: call(model, timeout), deadline, self._breaker(name), label=f"Model {name}",
+            record=self._stats(name).record
+        )
+
+    @staticmethod
+    def _failover(name, error):
+        """Whether another model is worth trying after `name` raised `error`; raises it otherwise."""
+        if isinstance(error, (CircuitOpenError, RetriesExhaustedError)) or \
+                (not isinstance(error, LLMUnavailableError) and is_retryable(error)):
+            print(f" Model {name} failed, trying the next one: {error}")
+            return True
+        raise error
+
+    def generate(self, tier, call, system_instruction=None, version=None, deadline=None):
+        """
+        Run call(model, timeout) on the tier's models until one succeeds;
+        returns (response, model name). Raises LLMUnavailableError when the
+        every model is unavailable or out of time; non-retryable errors are
+        raised as they are.
+        """
+        deadline = deadline or Deadline()
+        names = self.candidates(tier)
+        last_error = None
+        i = 0
+        while i < len(names):
+            name = names[i]
+            backup = names[i + 1] if i + 1 < len(names) else None
+            delay = self.hedge_delay(name) if backup else None
+            if delay is None:
+                try:
+                    return self._call(name, call, system_instruction, version, deadline), name
+                except Exception as e:
+                    self._failover(name, e)
+                    last_error = e
+                    i += 1
+                    continue
+
+            futures = {self._pool.submit(self._call, name, call, system_instruction, version, deadline): name}
+            done, _ = wait(futures, timeout=min(delay, deadline.remaining()))
+            if not done:
+                print(f" Model {name} is slow (no answer after {delay * 1000:.0f}ms), hedging with {backup}")
+                futures[self._pool.submit(self._call, backup, call, system_instruction, version, deadline)] = backup
+                i += 1
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise LLMUnavailableError(f"Deadline passed waiting for {', '.join(futures.values())}")
+                for future in done:
+                    try:
+                        return future.result(), futures[future]
+                    except Exception as e:
+                        self._failover(futures[future], e)
+                        last_error = e
+            i += 1
+        if last_error is not None:
+            raise LLMUnavailableError(f"Every {tier} model failed: {last_error}") from last_error
+        raise RuntimeError(f"No models configured for tier {tier}")
+
+    def health(self):
+        with self._lock:
+            names = list(self.stats)
+        return {
+            'tiers': self.tiers,
+            'models': {name: dict(self._stats(name).as_dict(), circuit=self._breaker(name).as_dict()) for name in names},
+        }
@@ -1,307 +1,459 @@
-from flask import Flask, render_template, request, jsonify, session
-from werkzeug.utils import secure_filename
+from flask import Flask, render_template, request, jsonify, session, Response
+import io
+import json
 import os
 import time
-import base64
-import io
+import uuid
 from datetime import datetime
-from PIL import Image
-import PyPDF2
-import docx
-import google.generativeai as genai
 from dotenv import load_dotenv
+from file_processing import (
+    UploadRequest, open_upload, process_uploaded_file, process_uploaded_files, file_extension,
+    ARCHIVE_EXTENSIONS, UPLOAD_SPOOL_THRESHOLD
+)
+from rate_limit import rate_limited, lanes
+from upload_jobs import upload_jobs
+from upload_cache import extraction_cache, embedding_cache, ocr_cache
+from answer_cache import answer_cache, answer_key
+from message_store import (
+    save_image, get_image, image_url, append_messages, get_messages, clear_session, DEFAULT_PAGE_SIZE
+)
 from sel import scrape_website  # Import the Selenium scraper from sel.py
-from rag_pipeline import prepare_rag_pipeline, retrieve_relevant_chunks
+import rag_pipeline
+from rag_pipeline import (
+    prepare_rag_pipeline, retrieve_relevant_chunks, index_session_document, retrieve_document_chunks, document_key,
+    session_has_documents, clear_session_documents, DOCUMENT_MAX_DISTANCE, RAG_SHARED_INDEX_DIR,
+    shared_build_lock, shared_index_available, publish_shared_index, unpublish_shared_index, refresh_shared_index,
+    install_reload_signal
+)
+from history_manager import ConversationHistory
+from intent_router import router
+from prompt_builder import (
+    PromptBuilder, COMPANY_INFO_HEADER, FILE_CONTENT_HEADER, FILE_PASSAGES_HEADER, UPLOADED_DOCUMENTS_HEADER, OCR_TEXT_HEADER
+)
+from llm_client import ModelClient, configure, Deadline, LLMUnavailableError, LLM_BACKEND
+from model_router import ModelRouter
+from speculative_retrieval import SpeculativeRetrieval
+from timing import StageTimer
+from extractive_qa import extract_answer, format_answer
+from faq_table import faq_table
+from entity_index import entity_index, format_entity_answer
 
 # Load environment variables
 load_dotenv()
 
-# Check if API key is available
-if not os.getenv("GEMINI_API_KEY"):
-    print(" Error: GEMINI_API_KEY not found in environment variables")
-    print("Please create a .env file with your Gemini API key")
-    exit(1)
-
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
 app = Flask(__name__)
+app.request_class = UploadRequest  # Keep uploads in memory, spilling to a temp file only when large
 app.secret_key = os.getenv("SECRET_KEY", "your-secret-key-here")
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'docx'}
+ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'docx', 'zip'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+MAX_DOCUMENT_CHARS = 2000000  # Upper bound on text extracted from a single upload
+DOCUMENT_INLINE_CHARS = 8000  # Documents up to this size are sent whole; larger ones are retrieved from
+DOCUMENT_TOP_K = 6  # Passages retrieved per question from an uploaded document
+UPLOAD_EVENTS_TIMEOUT = 300  # Longest an /upload/<doc_id>/events stream stays open, in seconds
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Static instructions sent once per index version as the system instruction (see system_instruction())
+ASSISTANT_INSTRUCTIONS = """You are the MoreYeahs AI Assistant, a helpful and intelligent assistant for MoreYeahs company.
+
+Each message carries the user's question and may include retrieved company information, passages from files the user uploaded, and a note saying whether the question is about MoreYeahs.
+
+For questions about MoreYeahs:
+1. Use the company information provided to answer accurately and specifically
+2. If asked about founder/CEO/management/history, look for this information in the company data provided and in the knowledge base summary below
+3. Be specific and helpful - provide detailed information from the company data
+4. If the exact information isn't available in the company data, say so clearly but offer related information that is available
+5. Maintain a professional, helpful tone as a company representative
+6. Don't make up information - only use what's provided in the company data
+
+For general questions:
+1. If the question still touches on MoreYeahs, use any available company information
+2. Otherwise provide helpful general assistance
+3. Be conversational, professional, and helpful
+
+For uploaded images:
+1. Describe what you see in the image
+2. Extract any text visible in the image
+3. Answer specific questions about the image content
+4. Provide relevant information based on what's shown
+If the image contains company-related content, provide insights relevant to the MoreYeahs business context.
+
+For uploaded files, answer from the file content provided and, when the question concerns MoreYeahs, add insights relevant to the business context.
+
+Always maintain context from the ongoing conversation and provide detailed, helpful, accurate responses."""
+
+# Gemini models (LLM_BACKEND=fake swaps in a local stand-in for offline testing), set up by init_models().
+# The model router picks a tier per request and falls back to the next model at runtime.
+llm = None
+models = None
 
-# Initialize Gemini models
-try:
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    vision_model = genai.GenerativeModel("gemini-2.0-flash")
-    print("✅ Gemini 2.0 Flash models initialized")
-except Exception as e:
+def init_models():
+    """Configure the API key and build the model router; exits when the models can't be used"""
+    global llm, models
+    # Check if API key is available (not needed with the offline fake model)
+    if LLM_BACKEND != "fake" and not os.getenv("GEMINI_API_KEY"):
+        print(" Error: GEMINI_API_KEY not found in environment variables")
+        print("Please create a .env file with your Gemini API key")
+        exit(1)
+
+    configure(os.getenv("GEMINI_API_KEY"))
     try:
-        # Fallback to stable version
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        vision_model = genai.GenerativeModel("gemini-1.5-pro")
-        print(" Gemini 1.5 models initialized (fallback)")
-    except Exception as e2:
-        print(f" Error initializing Gemini models: {e2}")
+        llm = ModelClient()
+        models = ModelRouter(llm)
+        tiers = "; ".join(f"{tier}: {', '.join(names)}" for tier, names in models.tiers.items())
+        print(f"✅ Gemini models initialized ({llm.backend} backend) - {tiers}")
+    except Exception as e:
+        print(f" Error initializing Gemini models: {e}")
         print("Please check your API key and internet connection")
         exit(1)
 
-# Global variables for unified chat sessions
+# Global variables for unified chat sessions (session_id -> ConversationHistory)
 chat_sessions = {}
 knowledge_ready = False
 company_context = ""
 scraped_content = ""
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def sync_shared_knowledge():
+    """In multi-worker mode, attach to the index published by the builder process"""
+    global knowledge_ready, company_context, scraped_content
+    if not RAG_SHARED_INDEX_DIR or not shared_index_available():
+        return
+    if refresh_shared_index() and scraped_content is not rag_pipeline.shared_context:
+        scraped_content = rag_pipeline.shared_context
+        company_context = scraped_content[:5000]
+        knowledge_ready = True
+    # The worker that built the index also builds the FAQ table; the others pick up its saved copy
+    faq_table.ensure(rag_pipeline.index_version)
+    entity_index.ensure(scraped_content, rag_pipeline.index_version)
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    text += page.extract_text() + "\n"
-                except Exception as e:
-                    print(f"Error extracting text from page: {e}")
-                    continue
-        return text if text.strip() else "No text could be extracted from this PDF."
-    except Exception as e:
-        print(f"Error reading PDF: {str(e)}")
-        return f"Error reading PDF: {str(e)}"
+def get_session_id():
+    """Return the current session ID, creating one if needed"""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
 
-def extract_text_from_docx(docx_path):
-    """Extract text from DOCX file"""
-    try:
-        doc = docx.Document(docx_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text if text.strip() else "No text found in this document."
-    except Exception as e:
-        print(f"Error reading DOCX: {str(e)}")
-        return f"Error reading DOCX: {str(e)}"
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_txt(txt_path):
-    """Extract text from TXT file"""
+def _index_upload_text(session_id, name, text):
     try:
-        # Try UTF-8 first
-        with open(txt_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            return content if content.strip() else "The text file appears to be empty."
-    except UnicodeDecodeError:
-        # Try with different encodings
-        encodings = ['latin-1', 'cp1252', 'iso-8859-1']
-        for encoding in encodings:
-            try:
-                with open(txt_path, 'r', encoding=encoding) as file:
-                    content = file.read()
-                    return content if content.strip() else "The text file appears to be empty."
-            except Exception:
-                continue
-        return "Error: Could not decode the text file with any supported encoding."
+        index_session_document(session_id, name, text)
     except Exception as e:
-        print(f"Error reading TXT: {str(e)}")
-        return f"Error reading TXT: {str(e)}"
-
-def process_uploaded_file(file_path, filename):
-    """Process uploaded file and extract content"""
-    if not os.path.exists(file_path):
-        return f"Error: File not found at {file_path}", None, "error", filename
-        
-    file_ext = filename.rsplit('.', 1)[1].lower()
+        print(f"Error indexing uploaded document {name}: {str(e)}")
+
+def prepare_single_upload(session_id, filename, stream, offload=False):
+    """
+    Extract one upload, index documents for retrieval and store the
+    image thumbnail.
+
+    Returns:
+        dict: file_content, file_metadata, file_type, file_name, image_id and files
+    """
+    file_content, file_metadata, file_type, file_name = process_uploaded_file(
+        stream, filename, max_chars=MAX_DOCUMENT_CHARS, offload=offload
+    )
+    image_id = None
+    
+    # Chunk and embed documents so each question (and later follow-ups) only sends the relevant passages
+    if file_type in ["pdf", "docx", "txt"] and file_content and not file_content.startswith("Error"):
+        _index_upload_text(session_id, file_name, file_content)
     
-    if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+    # For images, store the preview thumbnail server-side and reference it by URL
+    if file_type == "image" and file_metadata and file_metadata.get('thumbnail'):
         try:
-            # Open and verify image
-            image = Image.open(file_path)
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode not in ('RGB', 'L'):
-                image = image.convert('RGB')
-            
-            return image, None, "image", filename
+            image_id = save_image(session_id, file_metadata['thumbnail'], "image/jpeg")
         except Exception as e:
-            print(f"Error processing image: {str(e)}")
-            return f"Error processing image: {str(e)}", None, "error", filename
-    
-    elif file_ext == 'pdf':
-        text = extract_text_from_pdf(file_path)
-        return text, None, "pdf", filename
-    
-    elif file_ext == 'docx':
-        text = extract_text_from_docx(file_path)
-        return text, None, "docx", filename
-    
-    elif file_ext == 'txt':
-        text = extract_text_from_txt(file_path)
-        return text, None, "txt", filename
-    
-    else:
-        return f"Unsupported file type: {file_ext}", None, "error", filename
-
-def analyze_conversation_context(session_id, current_question):
-    """Enhanced context analysis for better company detection"""
-    if session_id not in chat_sessions:
-        return False, []
-    
-    chat_session = chat_sessions[session_id]
-    
-    # Enhanced MoreYeahs indicators
-    moreyeahs_indicators = [
-        'moreyeahs', 'more yeahs', 'company', 'service', 'services', 'product', 'products',
-        'pricing', 'price', 'cost', 'contact', 'support', 'team', 'about us', 'location',
-        'office', 'business', 'client', 'customer', 'portfolio', 'work', 'project',
-        'website', 'site', 'link', 'url', 'address', 'phone', 'email', 'job', 'career',
-        'opening', 'position', 'hire', 'recruitment', 'apply', 'application',
-        'founder', 'ceo', 'established', 'started', 'founded', 'owner', 'management',
-        'director', 'executive', 'leadership', 'history', 'background'
-    ]
+            print(f"Error storing image thumbnail: {str(e)}")
     
-    # Get recent messages from history
-    recent_context = []
-    try:
-        for part in chat_session.history[-10:]:
-            if hasattr(part, 'text'):
-                recent_context.append(part.text.lower())
-            elif hasattr(part, 'parts'):
-                for sub_part in part.parts:
-                    if hasattr(sub_part, 'text'):
-                        recent_context.append(sub_part.text.lower())
-    except Exception as e:
-        print(f"Error analyzing context: {e}")
-    
-    # Check current question
-    current_lower = current_question.lower()
-    recent_text = " ".join(recent_context) + " " + current_lower
-    
-    # Check for company-related content
-    is_company_related = any(indicator in recent_text for indicator in moreyeahs_indicators)
-    
-    # Additional context clues
-    contextual_phrases = [
-        'your', 'our', 'this company', 'the company', 'your company',
-        'who founded', 'who is the founder', 'who started', 'who owns',
-        'tell me about', 'what do you do', 'how can you help', 'what services',
-        'who is behind', 'company history', 'about the company'
-    ]
-    
-    has_contextual_clues = any(phrase in current_lower for phrase in contextual_phrases)
-    
-    # Debug logging
-    print(f" Context analysis: company_related={is_company_related}, contextual_clues={has_contextual_clues}")
-    print(f" Current question: {current_question}")
-    
-    return is_company_related or has_contextual_clues, recent_context
-
-def get_unified_chat_session(session_id):
-    """Get or create unified chat session"""
+    return {
+        'file_content': file_content,
+        'file_metadata': file_metadata,
+        'file_type': file_type,
+        'file_name': file_name,
+        'image_id': image_id,
+        'files': None,
+    }
+
+def _documents_upload(sections, progress, image_id):
+    return {
+        'file_content': "\n\n".join(sections),
+        'file_metadata': None,
+        'file_type': "documents",
+        'file_name': ", ".join(item['name'] for item in progress if item['status'] == 'ready'),
+        'image_id': image_id,
+        'files': progress,
+    }
+
+def prepare_upload_batch(session_id, uploads, offload=False):
+    """
+    Extract a multi-file or .zip upload and merge every readable file into
+    the session's document index (images contribute their OCR text).
+    """
+    results = process_uploaded_files(uploads, max_chars=MAX_DOCUMENT_CHARS, background=offload)
+    sections = []
+    progress = []
+    image_id = None
+    for result in results:
+        name, metadata = result['name'], result['metadata'] or {}
+        if result['status'] == 'ready':
+            if result['file_type'] == "image":
+                text = metadata.get('ocr_text', '')
+                if image_id is None and metadata.get('thumbnail'):
+                    try:
+                        image_id = save_image(session_id, metadata['thumbnail'], "image/jpeg")
+                    except Exception as e:
+                        print(f"Error storing image thumbnail: {str(e)}")
+            else:
+                text = result['content']
+            if text and text.strip():
+                _index_upload_text(session_id, name, text)
+                sections.append(f"[{name}]\n{text}")
+        progress.append({
+            'name': name, 'status': result['status'], 'file_type': result['file_type'], 'error': result['error']
+        })
+    return _documents_upload(sections, progress, image_id)
+
+def prepare_uploads(session_id, uploads, offload=False):
+    """Extract (filename, stream) uploads: one plain file directly, several files or archives as a batch."""
+    if len(uploads) == 1 and file_extension(uploads[0][0]) not in ARCHIVE_EXTENSIONS:
+        filename, stream = uploads[0]
+        return prepare_single_upload(session_id, filename, stream, offload)
+    return prepare_upload_batch(session_id, uploads, offload)
+
+def merge_uploads(session_id, prepared):
+    """Combine uploads extracted separately (referenced by document ID) into one batch."""
+    if len(prepared) == 1:
+        return prepared[0]
+    sections = []
+    progress = []
+    image_id = None
+    for upload in prepared:
+        image_id = image_id or upload['image_id']
+        if upload['file_type'] == "documents":
+            # Batches are already indexed file by file
+            text = upload['file_content']
+            progress.extend(upload['files'])
+        else:
+            name = upload['file_name']
+            if upload['file_type'] == "image":
+                text = (upload['file_metadata'] or {}).get('ocr_text', '')
+            else:
+                text = upload['file_content']
+            if text and text.strip():
+                _index_upload_text(session_id, name, text)
+                text = f"[{name}]\n{text}"
+            progress.append({'name': name, 'status': 'ready', 'file_type': upload['file_type'], 'error': None})
+        if text and text.strip():
+            sections.append(text)
+    return _documents_upload(sections, progress, image_id)
+
+def run_upload_job(session_id, filename, data):
+    """Background extraction for /upload; a failed extraction fails the job."""
+    upload = prepare_uploads(session_id, [(filename, io.BytesIO(data))], offload=True)
+    content = upload['file_content']
+    if upload['file_type'] == "error" or (isinstance(content, str) and content.startswith("Error")):
+        raise ValueError(content)
+    if upload['file_type'] == "documents" and not content:
+        raise ValueError("None of the uploaded files could be read.")
+    return upload
+
+def analyze_conversation_context(session_id, current_question, embed=None):
+    """Route the new message; topic carried over from earlier turns is tracked by the router"""
+    decision = router.route(session_id, current_question, embed)
+    return decision.is_company, decision
+
+def get_conversation_history(session_id):
+    """Get or create the compacted conversation history for a session"""
     if session_id not in chat_sessions:
-        chat_sessions[session_id] = model.start_chat(history=[])
+        chat_sessions[session_id] = ConversationHistory()
     return chat_sessions[session_id]
 
-def get_intelligent_response(question, file_content=None, file_type=None, file_name=None, session_id=None):
+def system_instruction():
+    """Static instructions plus the knowledge base summary; only changes when the index is rebuilt"""
+    if knowledge_ready and company_context:
+        return f"{ASSISTANT_INSTRUCTIONS}\n\nMOREYEAHS KNOWLEDGE BASE SUMMARY:\n{company_context}"
+    return ASSISTANT_INSTRUCTIONS
+
+def get_unified_chat_session(session_id):
+    """The session's compacted history, to seed this turn's chat with"""
+    history = get_conversation_history(session_id)
+    print(f" History for this turn: {len(history.turns)} recent turns, ~{history.history_tokens()} tokens")
+    return history.as_chat_history()
+
+def send_to_model(tier, content, chat_history=None, deadline=None):
+    """Send a chat message (or, without history, a one-off request) to the tier's models, failing over as needed"""
+    if chat_history is None:
+        call = lambda model, timeout: model.generate_content(content, request_options={'timeout': timeout})
+    else:
+        call = lambda model, timeout: model.start_chat(history=chat_history).send_message(
+            content, request_options={'timeout': timeout}
+        )
+    response, model_name = models.generate(tier, call, system_instruction(), rag_pipeline.index_version, deadline)
+    print(f" Answered by {model_name} ({tier} tier)")
+    return response
+
+def unavailable_answer(question, passages=(), source="the MoreYeahs knowledge base"):
+    """Answer while the model is unreachable: an earlier answer to the same question, else the retrieved passages"""
+    cached = answer_cache.get(answer_key(rag_pipeline.index_version, question))
+    if cached is not None:
+        print(" Model unavailable, serving a cached answer")
+        return cached, "cached"
+    if passages:
+        print(f" Model unavailable, serving {min(len(passages), 3)} retrieved passages")
+        excerpts = "\n\n".join(f"- {passage.strip()[:600]}" for passage in passages[:3])
+        return (f"I can't reach the AI model right now, but here is what {source} says that looks relevant:\n\n"
+                f"{excerpts}"), "retrieval"
+    return "I apologize, but the AI service is temporarily unavailable. Please try again in a minute.", "error"
+
+def faq_answer(question):
+    """Answer one FAQ question from the current index, as a history-free chat turn would"""
+    chunks = retrieve_relevant_chunks(question, top_k=5)
+    extracted = extract_answer(question, chunks)
+    if extracted is not None:
+        return format_answer(extracted, scraped_content)
+    prompt = PromptBuilder("faq", system_instruction=system_instruction())
+    prompt.add("request", f"User Question: {question}", required=True)
+    if chunks:
+        prompt.add_passages(
+            "company_info", COMPANY_INFO_HEADER,
+            chunks, priority=3
+        )
+    prompt.add("instructions", "Note: this question is about MoreYeahs company; follow the rules for company questions.",
+               required=True)
+    return send_to_model('strong', prompt.build(), deadline=Deadline()).text
+
+def build_faq_table():
+    """Generate answers to the FAQ list for the current index version in the background"""
+    faq_table.ensure(rag_pipeline.index_version, faq_answer, rag_pipeline.embed_query)
+
+def start_retrieval(question, session_id, with_upload=False):
+    """Start embedding and retrieving for a question before routing decides whether retrieval is needed"""
+    # Turns with an uploaded file only use the question embedding, so only that is computed early
+    return SpeculativeRetrieval(
+        question, session_id, company=knowledge_ready and not with_upload, documents=not with_upload,
+        company_top_k=5, document_top_k=4, max_distance=DOCUMENT_MAX_DISTANCE
+    ).start()
+
+def get_intelligent_response(question, file_content=None, file_type=None, file_name=None, session_id=None,
+                             file_metadata=None, retrieval=None):
     """Enhanced response generation with better company integration"""
+    if retrieval is None:
+        retrieval = start_retrieval(question, session_id, with_upload=file_content is not None)
+    timer = StageTimer("response")
+    deadline = Deadline()
+    try:
+        return answer_question(
+            question, file_content, file_type, file_name, session_id, file_metadata, retrieval, timer, deadline
+        )
+    finally:
+        retrieval.discard()
+        timer.log()
+        retrieval.log()
+
+def answer_question(question, file_content, file_type, file_name, session_id, file_metadata, retrieval, timer,
+                    deadline):
+    """Route the question and answer it with the prompt for its kind (image, file or chat)"""
     
     # Get unified chat session
-    chat = get_unified_chat_session(session_id)
+    with timer.stage("session"):
+        chat_history = get_unified_chat_session(session_id)
     
     # Analyze conversation context
-    is_company_context, recent_context = analyze_conversation_context(session_id, question)
+    with timer.stage("route"):
+        is_company_context, route = analyze_conversation_context(session_id, question, retrieval.embedding)
+    
+    tier = models.choose_tier(question, is_company_context, file_type if file_content is not None else None)
     
     print(f" Processing question: {question}")
     print(f" Company context detected: {is_company_context}")
     print(f" Knowledge ready: {knowledge_ready}")
+    print(f" Model tier: {tier}")
     
     # Handle image files
     if file_type == "image" and file_content is not None:
         try:
             # Enhanced image prompt with context awareness
-            base_prompt = f"""
-You are the MoreYeahs AI Assistant, a helpful and intelligent assistant for MoreYeahs company. 
-
-The user has uploaded an image named "{file_name}" and asked: "{question}"
-
-Please analyze the image and provide a comprehensive response. You can:
-1. Describe what you see in the image
-2. Extract any text visible in the image
-3. Answer specific questions about the image content
-4. Provide relevant information based on what's shown
-
-"""
+            prompt = PromptBuilder("image", system_instruction=system_instruction())
+            prompt.add("request", f'The user has uploaded an image named "{file_name}" and asked: "{question}"', required=True)
             
             if is_company_context:
-                base_prompt += """
-IMPORTANT: Based on the conversation context, this seems to be related to MoreYeahs company. 
-If the image contains company-related content, provide insights that would be relevant to MoreYeahs business context.
-"""
+                prompt.add("company_note", "Note: based on the conversation, this is about MoreYeahs.", required=True)
             
-            if knowledge_ready and company_context:
-                base_prompt += f"""
-Company Context for Reference:
-{company_context[:2000]}...
-
-"""
+            ocr_text = (file_metadata or {}).get('ocr_text')
+            if ocr_text:
+                prompt.add("ocr_text", f"{OCR_TEXT_HEADER}\n{ocr_text}", priority=3, truncate=True)
             
-            base_prompt += "Be detailed and helpful in your response, maintaining context from our ongoing conversation."
-            
-            response = vision_model.generate_content([base_prompt, file_content])
+            with timer.stage("llm"):
+                response = send_to_model(tier, [prompt.build(), file_content], deadline=deadline)
+            get_conversation_history(session_id).add_turn(
+                f"[Uploaded image: {file_name}] {question}", response.text
+            )
             return response.text, "image"
+        except LLMUnavailableError as e:
+            print(f" Model unavailable for image: {e}")
+            return unavailable_answer(question)
         except Exception as e:
             print(f"Error processing image with AI: {str(e)}")
             return f"Error processing image: {str(e)}", "error"
     
     # Handle text-based files
-    elif file_content is not None and file_type in ["pdf", "docx", "txt"]:
+    elif file_content is not None and file_type in ["pdf", "docx", "txt", "documents"]:
         try:
-            # Truncate content if too long
-            max_chars = 25000
-            content_preview = file_content[:max_chars] if len(file_content) > max_chars else file_content
+            if file_type == "documents":
+                uploaded = f"several files ({file_name})"
+            else:
+                uploaded = f'a {file_type.upper()} file named "{file_name}"'
             
-            if len(file_content) > max_chars:
-                content_preview += "\n\n[Content truncated due to length...]"
+            prompt = PromptBuilder("file", system_instruction=system_instruction())
+            prompt.add("request", f'The user has uploaded {uploaded} and asked: "{question}"', required=True)
             
-            prompt = f"""
-You are the MoreYeahs AI Assistant. The user has uploaded a {file_type.upper()} file named "{file_name}" and asked: "{question}"
-
-File Content:
-{content_preview}
-
-Based on the file content above, please provide a comprehensive response to: "{question}"
-
-"""
+            # Small documents go in whole; for larger ones send only the passages relevant to this question
+            passages = []
+            if len(file_content) > DOCUMENT_INLINE_CHARS:
+                try:
+                    # A single file only gets its own passages, not those of earlier uploads in the session
+                    doc_keys = None if file_type == "documents" else {document_key(file_content)}
+                    with timer.stage("retrieval"):
+                        passages = retrieve_document_chunks(
+                            session_id, question, top_k=DOCUMENT_TOP_K, query_embedding=retrieval.embedding(),
+                            doc_keys=doc_keys
+                        )
+                except Exception as e:
+                    print(f" Error retrieving document passages: {e}")
             
-            if is_company_context:
-                prompt += """
-IMPORTANT: This question seems to be in the context of MoreYeahs company. Please provide insights that would be relevant to the business context.
-"""
+            if passages:
+                print(f" Using {len(passages)} retrieved passages from {file_name}")
+                if file_type == "documents":
+                    passages = [f"[{name}] {passage}" for name, passage in passages]
+                else:
+                    passages = [passage for _, passage in passages]
+                prompt.add_passages(
+                    "file_passages", FILE_PASSAGES_HEADER, passages, priority=3
+                )
+            else:
+                content_preview = file_content[:DOCUMENT_INLINE_CHARS]
+                if len(file_content) > DOCUMENT_INLINE_CHARS:
+                    content_preview += "\n\n[Content truncated due to length...]"
+                prompt.add("file_content", f"{FILE_CONTENT_HEADER}\n{content_preview}", priority=3, truncate=True)
             
-            if knowledge_ready and company_context:
-                prompt += f"""
-For additional context, here's information about MoreYeahs:
-{company_context[:1500]}...
-
-"""
+            prompt.add("file_instructions", f'Based on the file content above, please provide a comprehensive response to: "{question}"',
+                       required=True)
             
-            prompt += "Maintain context from our ongoing conversation and provide a detailed, helpful response."
+            if is_company_context:
+                prompt.add("company_note", "Note: this question is about MoreYeahs.", required=True)
             
-            response = chat.send_message(prompt)
+            with timer.stage("llm"):
+                response = send_to_model(tier, prompt.build(), chat_history, deadline)
+            label = "files" if file_type == "documents" else f"{file_type.upper()} file"
+            get_conversation_history(session_id).add_turn(
+                f"[Uploaded {label}: {file_name}] {question}", response.text
+            )
             return response.text, "file"
+        except LLMUnavailableError as e:
+            print(f" Model unavailable for file: {e}")
+            return unavailable_answer(question, passages or [file_content[:DOCUMENT_INLINE_CHARS]], "your file")
         except Exception as e:
             print(f"Error processing text file: {str(e)}")
             return f"Error processing file: {str(e)}", "error"
@@ -309,83 +461,93 @@ For additional context, here's information about MoreYeahs:
     # Handle regular questions with enhanced company integration
     try:
         # Build context-aware prompt
-        prompt = f"""
-You are the MoreYeahs AI Assistant, a helpful and intelligent assistant for MoreYeahs company.
-
-User Question: {question}
-
-"""
+        prompt = PromptBuilder("chat", system_instruction=system_instruction())
+        prompt.add("request", f"User Question: {question}", required=True)
+        
+        # People, role and service lookups are answered from the entity table extracted at index time;
+        # with documents uploaded in the session, "who is the CEO?" may be about one of them
+        if knowledge_ready and not session_has_documents(session_id):
+            with timer.stage("entities"):
+                entity_answer = entity_index.lookup(question, company=is_company_context)
+            if entity_answer is not None:
+                retrieval.discard('company', 'documents')
+                answer = format_entity_answer(entity_answer)
+                get_conversation_history(session_id).add_turn(question, answer)
+                return answer, "company"
+        
+        # Common questions are answered from the table generated when the index was built
+        if is_company_context and knowledge_ready:
+            with timer.stage("faq"):
+                match = faq_table.match(retrieval.embedding(), rag_pipeline.index_version)
+            if match is not None:
+                retrieval.discard('company', 'documents')
+                get_conversation_history(session_id).add_turn(question, match.answer)
+                return match.answer, "company"
         
         # Add company context with enhanced retrieval
+        relevant_chunks = []
         if is_company_context and knowledge_ready:
             try:
                 print(" Retrieving relevant company information...")
-                relevant_chunks = retrieve_relevant_chunks(question, top_k=5)
+                with timer.stage("retrieval"):
+                    relevant_chunks = retrieval.company_chunks()
                 
                 if relevant_chunks:
                     print(f" Found {len(relevant_chunks)} relevant chunks")
                     for i, chunk in enumerate(relevant_chunks):
                         print(f"Chunk {i+1}: {chunk[:150]}...")
-                    
-                    company_info = "\n---\n".join(relevant_chunks)
-                    prompt += f"""
-MOREYEAHS COMPANY INFORMATION (Use this to answer questions about MoreYeahs):
-{company_info}
-
-"""
                 else:
                     print(" No relevant chunks found, using fallback context")
-                    if company_context:
-                        prompt += f"""
-MOREYEAHS COMPANY INFORMATION:
-{company_context[:3000]}...
-
-"""
-                    
             except Exception as e:
                 print(f" Error retrieving company info: {e}")
-                if company_context:
-                    prompt += f"""
-MOREYEAHS COMPANY INFORMATION:
-{company_context[:3000]}...
-
-"""
-        elif is_company_context and company_context:
-            prompt += f"""
-MOREYEAHS COMPANY INFORMATION:
-{company_context[:3000]}...
-
-"""
+        else:
+            retrieval.discard('company')
+        
+        # Simple factual questions (email, phone, address, openings...) are answered from the chunk itself
+        if relevant_chunks:
+            with timer.stage("extractive"):
+                extracted = extract_answer(question, relevant_chunks)
+            if extracted is not None:
+                answer = format_answer(extracted, scraped_content)
+                get_conversation_history(session_id).add_turn(question, answer)
+                return answer, "company"
+        
+        if relevant_chunks:
+            prompt.add_passages(
+                "company_info", COMPANY_INFO_HEADER,
+                relevant_chunks, priority=3
+            )
+        
+        # Follow-up questions about previously uploaded files reuse the session's document index
+        passages = []
+        if session_has_documents(session_id):
+            try:
+                with timer.stage("retrieval"):
+                    passages = retrieval.document_passages()
+                if passages:
+                    print(f" Found {len(passages)} relevant passages in uploaded documents")
+                    prompt.add_passages(
+                        "uploaded_documents", UPLOADED_DOCUMENTS_HEADER,
+                        [f"[{name}] {passage}" for name, passage in passages], priority=2
+                    )
+            except Exception as e:
+                print(f" Error retrieving document passages: {e}")
         
-        # Enhanced instructions based on context
+        # The rules themselves live in the system instruction; the turn only says which ones apply
         if is_company_context:
-            prompt += """
-CONTEXT: This question is about MoreYeahs company. Use the company information provided above to give accurate, detailed responses.
-
-IMPORTANT INSTRUCTIONS:
-1. Use the company information provided to answer accurately and specifically
-2. If asked about founder/CEO/management/history, look for this information in the company data above
-3. Be specific and helpful - provide detailed information from the company data
-4. If the exact information isn't available in the company data, say so clearly but offer related information that is available
-5. Maintain a professional, helpful tone as a company representative
-6. Don't make up information - only use what's provided in the company data
-
-"""
+            prompt.add("instructions", "Note: this question is about MoreYeahs company; follow the rules for company questions.",
+                       required=True)
         else:
-            prompt += """
-INSTRUCTIONS:
-1. If this seems to be about MoreYeahs company, use any available company information
-2. If this is a general question, provide helpful general assistance
-3. Maintain context from our ongoing conversation
-4. Be conversational, professional, and helpful
-
-"""
-        
-        prompt += "Provide a helpful, accurate response based on the information available:"
+            prompt.add("instructions", "Note: this looks like a general question; follow the rules for general questions.",
+                       required=True)
+        prompt = prompt.build()
         
         print(f" Sending prompt to AI (length: {len(prompt)})")
         
-        response = chat.send_message(prompt)
+        with timer.stage("llm"):
+            response = send_to_model(tier, prompt, chat_history, deadline)
+        get_conversation_history(session_id).add_turn(question, response.text)
+        answer_cache.put(answer_key(rag_pipeline.index_version, question), response.text)
         
         # Determine response type for UI
         response_type = "company" if is_company_context else "general"
@@ -394,90 +556,134 @@ INSTRUCTIONS:
         
         return response.text, response_type
         
+    except LLMUnavailableError as e:
+        print(f" Model unavailable: {e}")
+        return unavailable_answer(question, relevant_chunks or [passage for _, passage in passages])
     except Exception as e:
         print(f" Error in intelligent response: {str(e)}")
         import traceback
         traceback.print_exc()
         return f"I apologize, but I encountered an error processing your question: {str(e)}", "error"
 
+def scrape_company_text():
+    """Scrape the company website, falling back to static content on failure"""
+    # Scrape website using Selenium scraper from sel.py
+    try:
+        print(" Starting website scraping...")
+        site_text = scrape_website()
+        print(f" Scraped {len(site_text)} characters from website")
+        
+        # Debug: Check if we got meaningful content
+        if len(site_text) < 1000:
+            print(" Warning: Very little content scraped from website")
+            print(f"Sample content: {site_text[:500]}")
+        else:
+            print("Good amount of content scraped")
+        
+        # Save scraped content for debugging
+        with open("debug_scraped_content.txt", "w", encoding="utf-8") as f:
+            f.write(site_text)
+        print(" Scraped content saved to debug_scraped_content.txt")
+        
+    except Exception as scrape_error:
+        print(f" Error scraping website: {scrape_error}")
+        import traceback
+        traceback.print_exc()
+        # Use fallback content if scraping fails
+        site_text = """
+        MoreYeahs Company Information:
+        MoreYeahs is a technology company that provides various services including web development, 
+        software solutions, and digital marketing services.
+        
+        We are committed to delivering high-quality solutions to our clients.
+        
+        For more information, please visit our website at https://www.moreyeahs.com or contact us directly.
+        """
+    return site_text
+
+@app.before_request
+def attach_shared_knowledge():
+    sync_shared_knowledge()
+
 @app.route('/')
 def index():
     # Initialize session
-    if 'messages' not in session:
-        session['messages'] = []
-    if 'session_id' not in session:
-        session['session_id'] = str(int(time.time())) + str(os.getpid())
-    
+    get_session_id()
     return render_template('index.html')
 
+@app.route('/history', methods=['GET'])
+def history():
+    """Paginated chat history for the current session"""
+    try:
+        before_id = request.args.get('before', type=int)
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        messages, has_more = get_messages(get_session_id(), before_id=before_id, limit=limit)
+        return jsonify({
+            'messages': messages,
+            'has_more': has_more,
+            'next_before': messages[0]['id'] if messages and has_more else None
+        })
+    except Exception as e:
+        print(f"Error fetching history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/image/<image_id>', methods=['GET'])
+def serve_image(image_id):
+    """Serve a stored image thumbnail"""
+    data, mime_type = get_image(image_id, get_session_id())
+    if data is None:
+        return jsonify({'error': 'Image not found'}), 404
+    response = Response(data, mimetype=mime_type)
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
+
+def knowledge_loaded():
+    return knowledge_ready and rag_pipeline.index_version is not None
+
 @app.route('/initialize', methods=['POST'])
+@rate_limited('expensive', free_when=knowledge_loaded)
 def initialize():
     global knowledge_ready, company_context, scraped_content
     try:
+        # The page calls this on every load; once the index is built there is nothing to do until /refresh
+        if knowledge_loaded():
+            return jsonify({
+                'success': True,
+                'message': f'MoreYeahs AI Assistant fully ready! Loaded {len(scraped_content)} characters of company data.'
+            })
+        
         print(" Initializing MoreYeahs knowledge base...")
         
-        # Scrape website using Selenium scraper from sel.py
-        try:
-            print(" Starting website scraping...")
-            site_text = scrape_website()
-            print(f" Scraped {len(site_text)} characters from website")
-            
-            # Debug: Check if we got meaningful content
-            if len(site_text) < 1000:
-                print(" Warning: Very little content scraped from website")
-                print(f"Sample content: {site_text[:500]}")
-            else:
-                print("Good amount of content scraped")
-            
-            # Save scraped content for debugging
-            with open("debug_scraped_content.txt", "w", encoding="utf-8") as f:
-                f.write(site_text)
-            print(" Scraped content saved to debug_scraped_content.txt")
-            
-            # Store the scraped content globally
+        if RAG_SHARED_INDEX_DIR:
+            # Multi-worker mode: one worker builds and publishes, every worker maps the result
+            with shared_build_lock():
+                if not shared_index_available():
+                    publish_shared_index(scrape_company_text())
+            refresh_shared_index(force=True)
+            sync_shared_knowledge()
+            site_text = scraped_content
+        else:
+            site_text = scrape_company_text()
             scraped_content = site_text
             
-        except Exception as scrape_error:
-            print(f" Error scraping website: {scrape_error}")
-            import traceback
-            traceback.print_exc()
-            # Use fallback content if scraping fails
-            site_text = """
-            MoreYeahs Company Information:
-            MoreYeahs is a technology company that provides various services including web development, 
-            software solutions, and digital marketing services.
-            
-            We are committed to delivering high-quality solutions to our clients.
-            
-            For more information, please visit our website at https://www.moreyeahs.com or contact us directly.
-            """
-            scraped_content = site_text
-        
-        # Prepare RAG pipeline
-        try:
-            print("🔧 Preparing RAG pipeline...")
-            prepare_rag_pipeline(site_text)
-            print(" RAG pipeline prepared successfully")
-        except Exception as rag_error:
-            print(f" Error preparing RAG pipeline: {rag_error}")
-            import traceback
-            traceback.print_exc()
-            raise rag_error
-        
-        # Store company context
-        company_context = site_text[:5000]  # Store first 5000 chars for context
-        knowledge_ready = True
-        
-        # Test RAG retrieval with multiple queries
-        test_queries = ["founder CEO MoreYeahs", "services products", "about company"]
-        for query in test_queries:
+            # Prepare RAG pipeline
             try:
-                test_chunks = retrieve_relevant_chunks(query, top_k=3)
-                print(f" Test query '{query}' returned {len(test_chunks)} chunks")
-                for i, chunk in enumerate(test_chunks):
-                    print(f"  Chunk {i+1}: {chunk[:100]}...")
-            except Exception as test_error:
-                print(f" Warning: RAG test failed for '{query}': {test_error}")
+                print("🔧 Preparing RAG pipeline...")
+                prepare_rag_pipeline(site_text)
+                print(" RAG pipeline prepared successfully")
+            except Exception as rag_error:
+                print(f" Error preparing RAG pipeline: {rag_error}")
+                import traceback
+                traceback.print_exc()
+                raise rag_error
+        
+            # Store company context
+            company_context = site_text[:5000]  # Store first 5000 chars for context
+            knowledge_ready = True
+        
+        # Extract people and services, and answer the FAQ list, once for this index version
+        entity_index.ensure(site_text, rag_pipeline.index_version)
+        build_faq_table()
         
         return jsonify({
             'success': True, 
@@ -491,7 +697,9 @@ def initialize():
         return jsonify({'success': False, 'message': f'Error initializing: {str(e)}'})
 
 @app.route('/chat', methods=['POST'])
+@rate_limited('chat')
 def chat():
+    retrieval = None
     try:
         question = request.form.get('message', '').strip()
         if not question:
@@ -502,73 +710,70 @@ def chat():
         file_type = None
         file_name = None
         file_data_url = None
-        
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename and allowed_file(file.filename):
-                try:
-                    filename = secure_filename(file.filename)
-                    # Add timestamp to avoid conflicts
-                    timestamp = str(int(time.time()))
-                    filename = f"{timestamp}_{filename}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    
-                    # Save file
-                    file.save(file_path)
-                    
-                    # Verify file was saved
-                    if not os.path.exists(file_path):
-                        return jsonify({'error': 'Failed to save uploaded file'}), 500
-                    
-                    # Process the file
-                    file_content, _, file_type, original_name = process_uploaded_file(file_path, file.filename)
-                    file_name = original_name
-                    
-                    # For images, create data URL for display
-                    if file_type == "image" and isinstance(file_content, Image.Image):
-                        try:
-                            buffered = io.BytesIO()
-                            # Save as JPEG for better compatibility
-                            file_content.save(buffered, format="JPEG", quality=85)
-                            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                            file_data_url = f"data:image/jpeg;base64,{img_base64}"
-                        except Exception as e:
-                            print(f"Error creating image data URL: {str(e)}")
-                            # Fallback to PNG
-                            try:
-                                buffered = io.BytesIO()
-                                file_content.save(buffered, format="PNG")
-                                img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                                file_data_url = f"data:image/png;base64,{img_base64}"
-                            except Exception as e2:
-                                print(f"Error creating PNG data URL: {str(e2)}")
-                                file_data_url = None
-                    
-                    # Clean up uploaded file
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        print(f"Warning: Could not remove temporary file {file_path}: {str(e)}")
-                        
-                except Exception as e:
-                    print(f"Error processing uploaded file: {str(e)}")
-                    return jsonify({'error': f'Error processing uploaded file: {str(e)}'}), 500
-            elif file and file.filename and not allowed_file(file.filename):
-                return jsonify({'error': 'File type not allowed. Please upload: txt, pdf, png, jpg, jpeg, gif, bmp, docx'}), 400
+        file_metadata = None
+        image_id = None
+        session_id = get_session_id()
+        
+        uploads = [file for file in request.files.getlist('file') if file and file.filename]
+        for file in uploads:
+            if not allowed_file(file.filename):
+                return jsonify({'error': 'File type not allowed. Please upload: txt, pdf, png, jpg, jpeg, gif, bmp, docx, zip'}), 400
+        doc_ids = [doc_id for doc_id in request.form.getlist('doc_id') if doc_id]
+        
+        # Embedding and retrieval run while uploads are collected and the message is routed
+        retrieval = start_retrieval(question, session_id, with_upload=bool(uploads or doc_ids))
+        
+        upload = None
+        if doc_ids:
+            # Files sent earlier to /upload and extracted in the background
+            prepared = []
+            for doc_id in doc_ids:
+                job = upload_jobs.get(doc_id, session_id)
+                if job is None and not upload_jobs.is_local(doc_id):
+                    # Upload jobs live in one worker's memory; multi-worker deployments need sticky sessions
+                    print(f" Document {doc_id[:12]} was uploaded to another worker")
+                    return jsonify({'error': 'This document was uploaded to another server. Please upload the file again.'}), 404
+                if job is None:
+                    return jsonify({'error': 'Unknown document ID. Please upload the file again.'}), 404
+                if job.status == 'error':
+                    return jsonify({'error': f'Error processing uploaded file: {job.error}', 'document': job.as_dict()}), 400
+                if not job.finished:
+                    return jsonify({'error': 'The file is still being processed.', 'document': job.as_dict()}), 409
+                prepared.append(job.result)
+            upload = merge_uploads(session_id, prepared)
+        elif uploads:
+            try:
+                # Process the upload straight from the request stream
+                upload = prepare_uploads(session_id, [(file.filename, open_upload(file)) for file in uploads])
+            except Exception as e:
+                print(f"Error processing uploaded file: {str(e)}")
+                return jsonify({'error': f'Error processing uploaded file: {str(e)}'}), 500
+        
+        file_progress = None
+        if upload:
+            if upload['file_type'] == "documents" and not upload['file_content']:
+                return jsonify({'error': 'None of the uploaded files could be read.', 'files': upload['files']}), 400
+            file_content = upload['file_content']
+            file_metadata = upload['file_metadata']
+            file_type = upload['file_type']
+            file_name = upload['file_name']
+            file_progress = upload['files']
+            image_id = upload['image_id']
+            if image_id:
+                file_data_url = image_url(image_id)
         
         # Get intelligent response
-        session_id = session.get('session_id')
         response_text, response_type = get_intelligent_response(
-            question, file_content, file_type, file_name, session_id
+            question, file_content, file_type, file_name, session_id, file_metadata, retrieval
         )
         
-        # Save to session
         user_message = {
             'role': 'user',
             'content': question,
             'file_name': file_name,
             'file_type': file_type,
             'file_data_url': file_data_url,
+            'image_id': image_id,
             'timestamp': datetime.now().strftime('%H:%M')
         }
         
@@ -579,15 +784,14 @@ def chat():
             'timestamp': datetime.now().strftime('%H:%M')
         }
         
-        if 'messages' not in session:
-            session['messages'] = []
-        
-        session['messages'].extend([user_message, assistant_message])
-        session.modified = True
+        # Save to the server-side message store; the cookie only carries session_id
+        append_messages(session_id, [user_message, assistant_message])
+        user_message.pop('image_id', None)
         
         return jsonify({
             'user_message': user_message,
-            'assistant_message': assistant_message
+            'assistant_message': assistant_message,
+            'files': file_progress
         })
         
     except Exception as e:
@@ -595,21 +799,80 @@ def chat():
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'An error occurred: {str(e)}'}), 500
+    finally:
+        if retrieval is not None:
+            # Requests rejected while collecting uploads must not leave speculative retrieval queued
+            retrieval.discard()
+
+@app.route('/upload', methods=['POST'])
+@rate_limited('chat')
+def upload_files():
+    """Queue uploads for background extraction and return a document ID for each file or archive"""
+    session_id = get_session_id()
+    uploads = [file for file in request.files.getlist('file') if file and file.filename]
+    if not uploads:
+        return jsonify({'error': 'No file provided'}), 400
+    for file in uploads:
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'File type not allowed. Please upload: txt, pdf, png, jpg, jpeg, gif, bmp, docx, zip'}), 400
+    
+    documents = []
+    for file in uploads:
+        # The request's file streams are closed once it returns, so the job gets the bytes
+        data = open_upload(file).read()
+        job = upload_jobs.submit(session_id, file.filename, run_upload_job, session_id, file.filename, data)
+        if job is None:
+            # Drop the files already queued: the client retries the whole batch
+            upload_jobs.discard([document['doc_id'] for document in documents])
+            response = jsonify({'error': 'Too many uploads are being processed. Please try again shortly.', 'documents': []})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+        documents.append(job.as_dict())
+    return jsonify({'success': True, 'documents': documents}), 202
+
+@app.route('/upload/<doc_id>', methods=['GET'])
+def upload_status(doc_id):
+    job = upload_jobs.get(doc_id, get_session_id())
+    if job is None:
+        return jsonify({'error': 'Unknown document ID'}), 404
+    return jsonify(job.as_dict())
+
+@app.route('/upload/<doc_id>/events', methods=['GET'])
+def upload_events(doc_id):
+    """Server-sent events with the upload's status, until it is ready or failed"""
+    job = upload_jobs.get(doc_id, get_session_id())
+    if job is None:
+        return jsonify({'error': 'Unknown document ID'}), 404
+    
+    def stream():
+        deadline = time.time() + UPLOAD_EVENTS_TIMEOUT
+        status = None
+        while True:
+            status = upload_jobs.wait_for_change(job, status, timeout=15)
+            yield f"event: status\ndata: {json.dumps(job.as_dict())}\n\n"
+            if job.finished or time.time() > deadline:
+                break
+    
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/clear', methods=['POST'])
 def clear_chat():
     try:
-        session['messages'] = []
-        session_id = session.get('session_id')
+        session_id = get_session_id()
+        clear_session(session_id)
+        clear_session_documents(session_id)
+        upload_jobs.clear_session(session_id)
+        router.forget(session_id)
         if session_id in chat_sessions:
             del chat_sessions[session_id]
-        session.modified = True
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error clearing chat: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/refresh', methods=['POST'])
+@rate_limited('expensive')
 def refresh_knowledge():
     global knowledge_ready, company_context, scraped_content
     try:
@@ -620,6 +883,13 @@ def refresh_knowledge():
         
         # Clear any existing chat sessions to start fresh
         chat_sessions.clear()
+        faq_table.clear()
+        entity_index.clear()
+        
+        # In multi-worker mode, the next initialize rebuilds and republishes the index;
+        # other workers keep serving the mapped version until the new one appears
+        if RAG_SHARED_INDEX_DIR:
+            unpublish_shared_index()
         
         return jsonify({'success': True, 'message': 'Knowledge base refreshed. Please initialize again.'})
     except Exception as e:
@@ -630,12 +900,11 @@ def refresh_knowledge():
 def debug_status():
     """Debug endpoint to check system status"""
     try:
-        # Import chunks safely
+        # The retrieval service may be down; the rest of the status is still useful
         chunks_count = 0
         try:
-            from rag_pipeline import chunks
-            chunks_count = len(chunks) if chunks else 0
-        except:
+            chunks_count = rag_pipeline.indexed_chunk_count()
+        except Exception:
             chunks_count = 0
         
         return jsonify({
@@ -644,7 +913,16 @@ def debug_status():
             'scraped_content_length': len(scraped_content) if scraped_content else 0,
             'active_sessions': len(chat_sessions),
             'chunks_available': chunks_count,
-            'upload_folder': UPLOAD_FOLDER,
+            'index_version': rag_pipeline.index_version,
+            'admission': {name: lane.stats() for name, lane in lanes.items()},
+            'upload_caches': {cache.name: cache.stats() for cache in (extraction_cache, embedding_cache, ocr_cache)},
+            'answer_cache': answer_cache.stats(),
+            'upload_spool_threshold': UPLOAD_SPOOL_THRESHOLD,
+            'upload_jobs': upload_jobs.stats(),
+            'llm': llm.stats(),
+            'models': models.health(),
+            'faq': faq_table.stats(),
+            'entities': entity_index.stats(),
             'allowed_extensions': list(ALLOWED_EXTENSIONS)
         })
     except Exception as e:
@@ -700,6 +978,14 @@ def handle_exception(e):
     traceback.print_exc()
     return jsonify({'error': 'An unexpected error occurred. Please try again.'}), 500
 
+# The extraction and OCR pools spawn their workers, and spawn re-runs the started script in each
+# worker as __mp_main__ to unpickle tasks. Workers need none of this setup (and must not exit over
+# a missing API key), so it runs only in the web process, whether started directly or imported.
+if __name__ != '__mp_main__':
+    init_models()
+    if RAG_SHARED_INDEX_DIR:
+        install_reload_signal()
+
 if __name__ == '__main__':
     print("Starting MoreYeahs AI Assistant...")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
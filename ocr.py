@@ -0,0 +1,116 @@
+# ocr.py
+
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from upload_cache import content_hash, ocr_cache
+
+try:
+    import pytesseract
+    OCR_AVAILABLE = True
+except ImportError:
+    print("Warning: pytesseract not available. OCR features will be disabled.")
+    OCR_AVAILABLE = False
+
+# Images are downscaled so their longest side is at most this many pixels
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "2000"))
+# Images smaller than this (icons, spacers) are not worth OCRing
+OCR_MIN_DIMENSION = int(os.getenv("OCR_MIN_DIMENSION", "64"))
+# Number of pages/images OCRed at the same time
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(2, os.cpu_count() or 1))))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "60"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """
+    Process pool for OCR; its size is the page/image concurrency limit.
+    Workers are spawned rather than forked, like the extraction pool's.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def preprocess_for_ocr(image):
+    """Grayscale, downscale and stretch contrast before handing an image to Tesseract."""
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.LANCZOS)
+    return ImageOps.autocontrast(image)
+
+def _ocr_bytes(data):
+    """Run Tesseract on encoded image bytes (runs in a pool worker)."""
+    image = Image.open(io.BytesIO(data))
+    if max(image.size) < OCR_MIN_DIMENSION:
+        return ""
+    if image.format == "JPEG":
+        # Let the JPEG decoder skip detail we'd throw away when downscaling
+        image.draft("L", (OCR_MAX_DIMENSION, OCR_MAX_DIMENSION))
+    return pytesseract.image_to_string(preprocess_for_ocr(image)).strip()
+
+def _cache_when_done(key, future):
+    def store(done):
+        if not done.cancelled() and done.exception() is None:
+            ocr_cache.put(key, done.result())
+    future.add_done_callback(store)
+
+def _ocr_inline(keys, images, results):
+    computed = {}
+    for key, data, result in zip(keys, images, results):
+        if result is None and key not in computed:
+            try:
+                computed[key] = _ocr_bytes(data)
+                ocr_cache.put(key, computed[key])
+            except Exception as e:
+                print(f" OCR failed for image {key[:12]}: {e!r}")
+                computed[key] = ""
+    return [result if result is not None else computed[key] for key, result in zip(keys, results)]
+
+def ocr_images(images, timeout=OCR_TIMEOUT, inline=False):
+    """
+    OCR a batch of encoded images (bytes), returning one string per image.
+
+    Results are cached by content hash (see upload_cache), so repeated images
+    (logos, re-uploads) are only processed once. Failed images yield an empty
+    string, as do images not done within `timeout` seconds; those keep running
+    in the pool and are cached when they finish.
+
+    With `inline`, images are OCRed one by one in the calling process and
+    `timeout` does not apply. Extraction pool workers use this rather than
+    starting an OCR pool of their own.
+    """
+    if not OCR_AVAILABLE:
+        return ["" for _ in images]
+
+    keys = [content_hash(data) for data in images]
+    results = [ocr_cache.get(key) for key in keys]
+    if inline:
+        return _ocr_inline(keys, images, results)
+    pending = {}
+    for key, data, result in zip(keys, images, results):
+        if result is None and key not in pending:
+            pending[key] = get_ocr_pool().submit(_ocr_bytes, data)
+            _cache_when_done(key, pending[key])
+
+    deadline = time.monotonic() + timeout
+    computed = {}
+    for key, future in pending.items():
+        try:
+            computed[key] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            print(f" OCR failed for image {key[:12]}: {e!r}")
+            computed[key] = ""
+
+    return [result if result is not None else computed[key] for key, result in zip(keys, results)]
+
+def ocr_image(data, timeout=OCR_TIMEOUT):
+    """OCR a single encoded image."""
+    return ocr_images([data], timeout)[0]
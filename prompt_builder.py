@@ -0,0 +1,180 @@
+# prompt_builder.py
+
+import os
+import re
+from functools import lru_cache
+
+# Token budget for a single prompt (history is budgeted separately, see history_manager)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Passages whose word shingles are at least this much covered by text already kept are dropped
+PASSAGE_OVERLAP_THRESHOLD = float(os.getenv("PASSAGE_OVERLAP_THRESHOLD", "0.6"))
+SHINGLE_SIZE = 5
+
+# Headers of the context blocks injected into prompts (retrieved chunks, file dumps)
+COMPANY_INFO_HEADER = "MOREYEAHS COMPANY INFORMATION (Use this to answer questions about MoreYeahs):"
+FILE_CONTENT_HEADER = "File Content:"
+FILE_PASSAGES_HEADER = "Relevant passages from the file (retrieved for this question):"
+UPLOADED_DOCUMENTS_HEADER = "FROM DOCUMENTS THE USER UPLOADED EARLIER:"
+OCR_TEXT_HEADER = "Text detected in the image by OCR (use it to read names, titles and other text accurately):"
+CONTEXT_BLOCK_MARKERS = (
+    COMPANY_INFO_HEADER, FILE_CONTENT_HEADER, FILE_PASSAGES_HEADER, UPLOADED_DOCUMENTS_HEADER, OCR_TEXT_HEADER,
+)
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token)."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def _shingles(text):
+    words = _normalize(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+@lru_cache(maxsize=4)
+def _instruction_shingles(system_instruction):
+    # The system instruction only changes with the index, so its shingles are computed once
+    return frozenset(_shingles(system_instruction))
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, on a word boundary."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip() + "..."
+
+class PromptSection:
+    """A block of the prompt: fixed text, or a header plus ranked passages."""
+
+    def __init__(self, name, text="", priority=0.0, required=False, truncate=False, header=None, passages=None):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.required = required
+        self.truncate = truncate
+        self.header = header
+        self.passages = passages  # [(text, priority)] or None
+        self.selected = []
+        self.included = False
+
+    def render(self):
+        if self.passages is not None:
+            if not self.selected:
+                return ""
+            return f"{self.header}\n" + "\n---\n".join(self.selected)
+        return self.text if self.included else ""
+
+class PromptBuilder:
+    """
+    Assembles a prompt from sections within a token budget.
+
+    Required sections (question, instructions) are always kept, cut down
+    (longest first) if they alone exceed the budget. Optional sections and
+    individual passages are added in priority order until the budget is
+    spent, skipping passages that repeat text already included or the
+    `system_instruction` the model already has.
+    Sections keep the order they were added in, whatever their priority.
+    """
+
+    def __init__(self, name="prompt", budget=PROMPT_TOKEN_BUDGET, system_instruction=None):
+        self.name = name
+        self.budget = budget
+        self.system_instruction = system_instruction
+        self.sections = []
+
+    def add(self, name, text, priority=0.0, required=False, truncate=False):
+        """Add a text section. With `truncate`, it is cut to fit rather than dropped."""
+        if text:
+            self.sections.append(PromptSection(name, text, priority, required, truncate))
+        return self
+
+    def add_passages(self, name, header, passages, priority=0.0):
+        """
+        Add ranked passages (best first) under one header. Each passage
+        competes for the budget on its own; rank lowers its priority slightly.
+        """
+        ranked = [(text, priority - rank * 0.01) for rank, text in enumerate(passages) if text and text.strip()]
+        if ranked:
+            self.sections.append(PromptSection(name, priority=priority, header=header, passages=ranked))
+        return self
+
+    def _fit_required(self):
+        """Include the required sections, truncating the longest while together they exceed the budget."""
+        required = [section for section in self.sections if section.required]
+        for section in required:
+            section.included = True
+        used = sum(estimate_tokens(section.text) for section in required)
+        for section in sorted(required, key=lambda s: -estimate_tokens(s.text)):
+            if used <= self.budget:
+                break
+            tokens = estimate_tokens(section.text)
+            section.text = truncate_to_tokens(section.text, max(tokens - (used - self.budget), 1))
+            used += estimate_tokens(section.text) - tokens
+            print(f" Prompt [{self.name}]: required section {section.name} cut from ~{tokens} tokens to fit the budget")
+        return used
+
+    def build(self):
+        used = self._fit_required()
+        kept_shingles = set(_instruction_shingles(self.system_instruction)) if self.system_instruction else set()
+
+        candidates = []
+        for order, section in enumerate(self.sections):
+            if section.required:
+                continue
+            if section.passages is not None:
+                candidates.extend((p, order, section, text) for text, p in section.passages)
+            else:
+                candidates.append((section.priority, order, section, section.text))
+        candidates.sort(key=lambda c: (-c[0], c[1]))
+
+        dropped = {}
+        for _, _, section, text in candidates:
+            shingles = _shingles(text)
+            if len(shingles & kept_shingles) >= PASSAGE_OVERLAP_THRESHOLD * len(shingles):
+                dropped[section.name] = dropped.get(section.name, 0) + 1
+                continue
+            cost = estimate_tokens(text)
+            if section.passages is not None and not section.selected:
+                cost += estimate_tokens(section.header)
+            remaining = self.budget - used
+            if cost > remaining:
+                if section.truncate and section.passages is None and remaining > 50:
+                    section.text = truncate_to_tokens(text, remaining)
+                    cost = estimate_tokens(section.text)
+                else:
+                    dropped[section.name] = dropped.get(section.name, 0) + 1
+                    continue
+            if section.passages is not None:
+                section.selected.append(text)
+            else:
+                section.included = True
+            kept_shingles |= shingles
+            used += cost
+
+        # Selected passages go back into ranked order within their section
+        for section in self.sections:
+            if section.passages is not None and section.selected:
+                order = {text: i for i, (text, _) in enumerate(section.passages)}
+                section.selected.sort(key=order.get)
+
+        rendered = [(section, section.render()) for section in self.sections]
+        prompt = "\n\n".join(text for _, text in rendered if text)
+        self._log(rendered, estimate_tokens(prompt), dropped)
+        return prompt
+
+    def _log(self, rendered, total, dropped):
+        parts = []
+        for section, text in rendered:
+            if section.passages is not None:
+                parts.append(f"{section.name}={estimate_tokens(text)} ({len(section.selected)}/{len(section.passages)} passages)")
+            elif text:
+                parts.append(f"{section.name}={estimate_tokens(text)}")
+        line = f" Prompt [{self.name}]: ~{total}/{self.budget} tokens; " + ", ".join(parts)
+        if dropped:
+            line += "; dropped " + ", ".join(f"{name}={count}" for name, count in dropped.items())
+        print(line)
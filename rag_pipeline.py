@@ -4,45 +4,458 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
+import os
+import mmap
+import time
+import signal
+import shutil
+import fcntl
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from sel import scrape_website  # Import the Selenium scraper from sel.py
+from upload_cache import content_hash, embedding_cache
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Multi-worker mode: one builder publishes the index to this directory and
+# every worker maps it read-only instead of building its own copy.
+RAG_SHARED_INDEX_DIR = os.getenv("RAG_SHARED_INDEX_DIR")
+SHARED_INDEX_CHECK_INTERVAL = float(os.getenv("SHARED_INDEX_CHECK_INTERVAL", "2"))
+SHARED_INDEX_KEEP_VERSIONS = 2
+CURRENT_FILE = "CURRENT"
 
 # Global objects shared across functions
 chunks = []
 embedder = None
 index = None
+index_version = None
+shared_context = ""
+_last_version_check = 0.0
+_reload_requested = False
+# Held while chunks and index are swapped, so a search never pairs one version's index with another's chunks
+_index_lock = threading.Lock()
+
+# Per-session indexes over uploaded documents
+DOCUMENT_CHUNK_SIZE = int(os.getenv("DOCUMENT_CHUNK_SIZE", "800"))
+DOCUMENT_CHUNK_OVERLAP = int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "100"))
+MAX_DOCUMENT_SESSIONS = int(os.getenv("MAX_DOCUMENT_SESSIONS", "200"))
+# Passages further than this (squared L2 on normalized embeddings) are not relevant
+DOCUMENT_MAX_DISTANCE = float(os.getenv("DOCUMENT_MAX_DISTANCE", "1.4"))
+session_documents = OrderedDict()
+_session_documents_lock = threading.Lock()
+
+# Optional sidecar retrieval service (see retrieval_service.py)
+RETRIEVAL_SERVICE_URL = os.getenv("RETRIEVAL_SERVICE_URL")
+retrieval_backend = None
+
+def get_embedder():
+    """Load the embedding model once per process."""
+    global embedder
+    if embedder is None:
+        embedder = SentenceTransformer(EMBEDDING_MODEL)
+    return embedder
+
+def set_retrieval_backend(backend):
+    """Route prepare/retrieve calls through a retrieval client (None = in-process)."""
+    global retrieval_backend
+    retrieval_backend = backend
+
+def get_retrieval_backend():
+    """Return the configured retrieval client, connecting to the sidecar on first use."""
+    global retrieval_backend
+    if retrieval_backend is None and RETRIEVAL_SERVICE_URL:
+        from retrieval_service import RetrievalClient
+        retrieval_backend = RetrievalClient(RETRIEVAL_SERVICE_URL)
+    return retrieval_backend
+
+def text_version(raw_text):
+    """Index version for a text: the same scraped content always gets the same version."""
+    return content_hash(f"{EMBEDDING_MODEL}\n{raw_text}")[:16]
 
 def prepare_rag_pipeline(raw_text):
     """
     Prepares the FAISS index and embeddings from the input raw text.
-    
+
+    When a retrieval service is configured, the index is built there instead.
+
     Args:
         raw_text (str): The full raw input text (scraped HTML, etc.)
-    
+
     Sets:
         chunks (list): The split text chunks.
         embedder (SentenceTransformer): The embedding model.
         index (faiss.IndexFlatL2): The FAISS vector index.
     """
-    global chunks, embedder, index
+    global index_version
+    backend = get_retrieval_backend()
+    if backend is not None:
+        # The service owns the index; keep its version here for the FAQ table, entities and answer cache
+        index_version = backend.prepare(raw_text)["index_version"]
+        return None
+    if index is not None and index_version == text_version(raw_text):
+        print(f" Index {index_version} is already built from this content")
+        return None
+    return build_local_index(raw_text)
+
+def build_local_index(raw_text):
+    """Chunk, embed and index raw_text in this process. Returns the embeddings."""
+    global chunks, index, index_version
 
     # Step 1: Chunk the text
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_text(raw_text)
+    new_chunks = splitter.split_text(raw_text)
 
     # Step 2: Generate embeddings
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = embedder.encode(chunks, show_progress_bar=True)
+    embeddings = get_embedder().encode(new_chunks, show_progress_bar=True)
 
     # Step 3: Create FAISS index
     dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(embeddings))
+    new_index = faiss.IndexFlatL2(dim)
+    new_index.add(np.array(embeddings))
+
+    # Searches may be running (e.g. the retrieval service's batcher): swap both at once
+    with _index_lock:
+        chunks, index = new_chunks, new_index
+        index_version = text_version(raw_text)
+    return embeddings
+
+def embed_query(text):
+    """
+    Normalized float32 embedding(s) for a query string or list of strings.
+
+    all-MiniLM-L6-v2 already outputs unit vectors, so these match both the
+    company index and the session document indexes. With a retrieval service,
+    its embedder does the encoding.
+    """
+    texts = [text] if isinstance(text, str) else list(text)
+    backend = get_retrieval_backend()
+    if backend is not None:
+        return backend.embed(texts)
+    return np.asarray(get_embedder().encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+def retrieve_relevant_chunks(query, top_k=5, query_embedding=None):
+    """
+    Returns top-k most relevant chunks for the given query.
+
+    Pass `query_embedding` (from embed_query, e.g. the router's) to skip
+    embedding the query again, here or in the retrieval service.
+    """
+    backend = get_retrieval_backend()
+    if backend is not None:
+        if query_embedding is not None:
+            return backend.search(query_embedding, top_k)[0]
+        return backend.retrieve(query, top_k)
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+    return search_embeddings(query_embedding, top_k)[0]
 
-def retrieve_relevant_chunks(query, top_k=5):
-    """Returns top-k most relevant chunks for the given query."""
-    if index is None or embedder is None or not chunks:
+def indexed_chunk_count():
+    """Chunks in the company index, here or in the retrieval service."""
+    backend = get_retrieval_backend()
+    if backend is not None:
+        return backend.health().get("chunks", 0)
+    return len(chunks)
+
+def search_embeddings(query_embeddings, top_k=5):
+    """Search the in-process index with a batch of query embeddings; one chunk list per query."""
+    if RAG_SHARED_INDEX_DIR:
+        refresh_shared_index()
+    with _index_lock:
+        current_index, current_chunks = index, chunks
+    if current_index is None or not current_chunks:
         raise ValueError("RAG pipeline is not initialized. Call prepare_rag_pipeline() first.")
 
-    q_emb = embedder.encode([query])
-    scores, idxs = index.search(np.array(q_emb), top_k)
-    return [chunks[i] for i in idxs[0]]
\ No newline at end of file
+    scores, idxs = current_index.search(
+        np.array(query_embeddings, dtype=np.float32), min(top_k, len(current_chunks))
+    )
+    return [[current_chunks[i] for i in row if i >= 0] for row in idxs]
+
+# ---------------------------------------------------------------------------
+# Ephemeral per-session document indexes (uploaded PDF/DOCX/TXT files)
+# ---------------------------------------------------------------------------
+
+def document_key(text):
+    return content_hash(text)
+
+def split_document(text):
+    """Split an uploaded document into retrieval passages."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=DOCUMENT_CHUNK_SIZE, chunk_overlap=DOCUMENT_CHUNK_OVERLAP)
+    return splitter.split_text(text)
+
+def embed_passages(passages):
+    """Normalized embeddings for document passages (float32), from the retrieval service if configured."""
+    backend = get_retrieval_backend()
+    if backend is not None:
+        return backend.embed(passages)
+    return np.asarray(
+        get_embedder().encode(passages, normalize_embeddings=True), dtype=np.float32
+    )
+
+def index_session_document(session_id, doc_name, text):
+    """
+    Chunk and embed an uploaded document into the session's ephemeral index.
+
+    Re-uploading the same content in a session reuses the existing passages,
+    and passages/embeddings are cached across sessions by content hash.
+
+    Returns:
+        str: The document key.
+    """
+    key = document_key(text)
+    with _session_documents_lock:
+        store = session_documents.get(session_id)
+        if store is not None and key in store["documents"]:
+            session_documents.move_to_end(session_id)
+            return key
+
+    cached = embedding_cache.get(key)
+    if cached is not None:
+        passages, embeddings = cached
+    else:
+        passages = split_document(text)
+        embeddings = embed_passages(passages) if passages else None
+        embedding_cache.put(key, (passages, embeddings))
+
+    with _session_documents_lock:
+        store = session_documents.get(session_id)
+        if store is None:
+            store = {"index": None, "passages": [], "names": [], "keys": [], "documents": {}}
+            session_documents[session_id] = store
+        if key not in store["documents"] and passages:
+            if store["index"] is None:
+                store["index"] = faiss.IndexFlatL2(embeddings.shape[1])
+            store["index"].add(embeddings)
+            store["passages"].extend(passages)
+            store["names"].extend([doc_name] * len(passages))
+            store["keys"].extend([key] * len(passages))
+            store["documents"][key] = doc_name
+        session_documents.move_to_end(session_id)
+        while len(session_documents) > MAX_DOCUMENT_SESSIONS:
+            session_documents.popitem(last=False)
+    print(f" Indexed {len(passages)} passages from {doc_name} for session {session_id}")
+    return key
+
+def session_has_documents(session_id):
+    store = session_documents.get(session_id)
+    return bool(store and store["passages"])
+
+def retrieve_document_chunks(session_id, query, top_k=5, max_distance=None, query_embedding=None, doc_keys=None):
+    """
+    Returns up to top_k (doc_name, passage) pairs from the session's uploaded documents,
+    in document order, skipping passages further than max_distance from the query.
+    With doc_keys, only passages from those documents (see document_key) are returned.
+    """
+    store = session_documents.get(session_id)
+    if not store or not store["passages"]:
+        return []
+
+    q_emb = query_embedding if query_embedding is not None else embed_query(query)
+    with _session_documents_lock:
+        # Session indexes are small and flat, so a filtered search ranks every passage
+        k = len(store["passages"]) if doc_keys is not None else min(top_k, len(store["passages"]))
+        dists, idxs = store["index"].search(q_emb, k)
+        hits = [
+            i for dist, i in zip(dists[0], idxs[0])
+            if i >= 0 and (max_distance is None or dist <= max_distance)
+            and (doc_keys is None or store["keys"][i] in doc_keys)
+        ][:top_k]
+        # Keep passages in reading order so the model sees a coherent excerpt
+        return [(store["names"][i], store["passages"][i]) for i in sorted(hits)]
+
+def clear_session_documents(session_id):
+    with _session_documents_lock:
+        session_documents.pop(session_id, None)
+
+# ---------------------------------------------------------------------------
+# Shared read-only index (multi-worker deployments)
+# ---------------------------------------------------------------------------
+
+class MappedChunks:
+    """Read-only sequence of chunk strings backed by a memory-mapped file."""
+
+    def __init__(self, version_dir):
+        self._file = open(os.path.join(version_dir, "chunks.bin"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = np.load(os.path.join(version_dir, "offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class MappedFlatIndex:
+    """
+    Exact L2 search over a memory-mapped embedding matrix.
+
+    Mirrors `faiss.IndexFlatL2.search` so it can stand in for `index`, while
+    the vectors live in page cache shared by every worker process.
+    """
+
+    def __init__(self, version_dir):
+        self.embeddings = np.load(os.path.join(version_dir, "embeddings.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(version_dir, "norms.npy"), mmap_mode="r")
+        self.ntotal = self.embeddings.shape[0]
+        self.d = self.embeddings.shape[1]
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, self.ntotal)
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+        dists = self.norms[None, :] - 2.0 * (queries @ self.embeddings.T) + (queries ** 2).sum(axis=1)[:, None]
+        idxs = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(dists, idxs, axis=1).argsort(axis=1)
+        idxs = np.take_along_axis(idxs, order, axis=1)
+        return np.take_along_axis(dists, idxs, axis=1), idxs
+
+def _read_current_version(base_dir):
+    try:
+        with open(os.path.join(base_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def shared_index_available(base_dir=None):
+    """True if a builder has published an index to the shared directory."""
+    base_dir = base_dir or RAG_SHARED_INDEX_DIR
+    return bool(base_dir) and _read_current_version(base_dir) is not None
+
+def publish_shared_index(raw_text, base_dir=None):
+    """
+    Build the index from raw_text and publish it for workers to map.
+
+    Each build goes to a fresh `v<version>` directory; the CURRENT file is
+    swapped atomically at the end, so workers never see a partial version.
+    """
+    base_dir = base_dir or RAG_SHARED_INDEX_DIR
+    os.makedirs(base_dir, exist_ok=True)
+
+    version_dir = os.path.join(base_dir, f"v{text_version(raw_text)}")
+    if os.path.isdir(version_dir):
+        # Same content as a version still on disk (e.g. after /refresh): republish it
+        os.utime(version_dir)
+        _publish_current(base_dir, version_dir)
+        print(f" Republished shared index {os.path.basename(version_dir)}")
+        return load_shared_index(base_dir)
+
+    embeddings = np.ascontiguousarray(build_local_index(raw_text), dtype=np.float32)
+    tmp_dir = version_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    encoded = [chunk.encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(os.path.join(tmp_dir, "chunks.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "embeddings.npy"), embeddings)
+    np.save(os.path.join(tmp_dir, "norms.npy"), (embeddings ** 2).sum(axis=1))
+    with open(os.path.join(tmp_dir, "context.txt"), "w", encoding="utf-8") as f:
+        f.write(raw_text)
+    os.rename(tmp_dir, version_dir)
+
+    _publish_current(base_dir, version_dir)
+    print(f" Published shared index {os.path.basename(version_dir)} ({len(chunks)} chunks)")
+
+    _prune_old_versions(base_dir)
+    return load_shared_index(base_dir)
+
+def _publish_current(base_dir, version_dir):
+    current_tmp = os.path.join(base_dir, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(current_tmp, os.path.join(base_dir, CURRENT_FILE))
+
+@contextmanager
+def shared_build_lock(base_dir=None):
+    """Serialize builders across processes so only one scrapes and publishes at a time."""
+    base_dir = base_dir or RAG_SHARED_INDEX_DIR
+    os.makedirs(base_dir, exist_ok=True)
+    with open(os.path.join(base_dir, ".build.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def unpublish_shared_index(base_dir=None):
+    """Remove the CURRENT pointer so the next initialize rebuilds the index."""
+    base_dir = base_dir or RAG_SHARED_INDEX_DIR
+    try:
+        os.remove(os.path.join(base_dir, CURRENT_FILE))
+    except FileNotFoundError:
+        pass
+
+def _prune_old_versions(base_dir):
+    # Workers that still map an old version keep working: unlinked files stay
+    # readable until their mappings are closed.
+    # Versions are content hashes, so age comes from the directory's mtime
+    versions = sorted(
+        (d for d in os.listdir(base_dir)
+         if d.startswith("v") and not d.endswith(".tmp") and os.path.isdir(os.path.join(base_dir, d))),
+        key=lambda d: os.path.getmtime(os.path.join(base_dir, d))
+    )
+    for old in versions[:-SHARED_INDEX_KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(base_dir, old), ignore_errors=True)
+
+def load_shared_index(base_dir=None):
+    """Map the currently published index read-only. Returns True if one is loaded."""
+    global chunks, index, index_version, shared_context
+    base_dir = base_dir or RAG_SHARED_INDEX_DIR
+    version = _read_current_version(base_dir)
+    if version is None:
+        return index is not None
+    if version == f"v{index_version}" and isinstance(index, MappedFlatIndex):
+        return True
+
+    version_dir = os.path.join(base_dir, version)
+    new_chunks = MappedChunks(version_dir)
+    new_index = MappedFlatIndex(version_dir)
+    with open(os.path.join(version_dir, "context.txt"), "r", encoding="utf-8") as f:
+        new_context = f.read()
+
+    with _index_lock:
+        chunks, index, shared_context = new_chunks, new_index, new_context
+        index_version = version[1:]
+    print(f" Mapped shared index {version} ({len(chunks)} chunks)")
+    return True
+
+def refresh_shared_index(force=False):
+    """Pick up a newly published version; cheap enough to call per request."""
+    global _last_version_check, _reload_requested
+    now = time.time()
+    if not force and not _reload_requested and now - _last_version_check < SHARED_INDEX_CHECK_INTERVAL:
+        return index is not None
+    _last_version_check = now
+    _reload_requested = False
+    try:
+        return load_shared_index()
+    except Exception as e:
+        print(f" Error loading shared index: {e}")
+        return index is not None
+
+def install_reload_signal(signum=signal.SIGHUP):
+    """Make the given signal trigger a shared-index reload on the next request."""
+    def _request_reload(_signum, _frame):
+        global _reload_requested
+        _reload_requested = True
+    signal.signal(signum, _request_reload)
+
+if __name__ == "__main__":
+    # Builder process: scrape the site and publish a new shared index version
+    if not RAG_SHARED_INDEX_DIR:
+        raise SystemExit("Set RAG_SHARED_INDEX_DIR to the directory workers read the index from.")
+    with shared_build_lock():
+        publish_shared_index(scrape_website())
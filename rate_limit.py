@@ -0,0 +1,192 @@
+# rate_limit.py
+
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import request, session, jsonify
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+# Per-key token buckets: sustained requests per minute and burst size
+SESSION_RATE_PER_MINUTE = _env_float("SESSION_RATE_PER_MINUTE", "20")
+SESSION_BURST = _env_float("SESSION_BURST", "5")
+IP_RATE_PER_MINUTE = _env_float("IP_RATE_PER_MINUTE", "60")
+IP_BURST = _env_float("IP_BURST", "15")
+EXPENSIVE_RATE_PER_MINUTE = _env_float("EXPENSIVE_RATE_PER_MINUTE", "2")
+EXPENSIVE_BURST = _env_float("EXPENSIVE_BURST", "3")
+
+# Global admission control: in-flight caps and how long a request may queue
+CHAT_MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", "16"))
+CHAT_MAX_QUEUED = int(os.getenv("CHAT_MAX_QUEUED", "32"))
+CHAT_QUEUE_TIMEOUT = _env_float("CHAT_QUEUE_TIMEOUT", "5")
+EXPENSIVE_MAX_IN_FLIGHT = int(os.getenv("EXPENSIVE_MAX_IN_FLIGHT", "1"))
+EXPENSIVE_MAX_QUEUED = int(os.getenv("EXPENSIVE_MAX_QUEUED", "4"))
+EXPENSIVE_QUEUE_TIMEOUT = _env_float("EXPENSIVE_QUEUE_TIMEOUT", "60")
+
+class TokenBucket:
+    """Classic token bucket; refills continuously at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def wait_time(self, now=None):
+        """Refill, then return the seconds until a token is available (0 if one is)."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def try_acquire(self, now=None):
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        wait = self.wait_time(now)
+        if wait == 0:
+            self.tokens -= 1
+            return True, 0.0
+        return False, wait
+
+class KeyedRateLimiter:
+    """One token bucket per key (session ID, client IP, ...)."""
+
+    def __init__(self, rate_per_minute, burst, max_keys=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        with self._lock:
+            now = time.monotonic()
+            return self._bucket(key, now).try_acquire(now)
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full_after = self.burst / self.rate
+        for key in [k for k, b in self._buckets.items() if now - b.updated >= full_after]:
+            del self._buckets[key]
+
+class AdmissionLane:
+    """Caps concurrent requests; extra requests queue briefly, then get rejected."""
+
+    def __init__(self, name, max_in_flight, max_queued, queue_timeout):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                return True
+            if self.queued >= self.max_queued:
+                return False
+            self.queued += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'queued': self.queued, 'max_in_flight': self.max_in_flight}
+
+session_limiter = KeyedRateLimiter(SESSION_RATE_PER_MINUTE, SESSION_BURST)
+ip_limiter = KeyedRateLimiter(IP_RATE_PER_MINUTE, IP_BURST)
+expensive_limiter = KeyedRateLimiter(EXPENSIVE_RATE_PER_MINUTE, EXPENSIVE_BURST)
+
+# Serializes check_all, so buckets checked together are charged together
+_check_all_lock = threading.Lock()
+
+def check_all(checks):
+    """
+    Take one token from each (limiter, key) bucket, or from none of them when
+    any is empty. Returns (allowed, seconds until all have a token, blocking key).
+    """
+    with _check_all_lock:
+        now = time.monotonic()
+        buckets = []
+        for limiter, key in checks:
+            with limiter._lock:
+                buckets.append((limiter._bucket(key, now), key))
+        waits = [(bucket.wait_time(now), key) for bucket, key in buckets]
+        retry_after, blocking = max(waits, key=lambda w: w[0], default=(0.0, None))
+        if retry_after > 0:
+            return False, retry_after, blocking
+        for bucket, _ in buckets:
+            bucket.tokens -= 1
+        return True, 0.0, None
+
+lanes = {
+    'chat': AdmissionLane('chat', CHAT_MAX_IN_FLIGHT, CHAT_MAX_QUEUED, CHAT_QUEUE_TIMEOUT),
+    'expensive': AdmissionLane('expensive', EXPENSIVE_MAX_IN_FLIGHT, EXPENSIVE_MAX_QUEUED, EXPENSIVE_QUEUE_TIMEOUT),
+}
+
+def _too_many_requests(message, retry_after):
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def rate_limited(lane='chat', free_when=None):
+    """
+    Flask route decorator applying per-session/per-IP token buckets and the
+    lane's global in-flight cap. Rejected requests get 429 with Retry-After.
+    A request is only charged when every bucket has a token. While
+    `free_when()` is true, the view is cheap and runs without either.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if free_when is not None and free_when():
+                return view(*args, **kwargs)
+            client_ip = request.remote_addr or 'unknown'
+            checks = [(ip_limiter, f"ip:{client_ip}")]
+            if session.get('session_id'):
+                checks.append((session_limiter, f"session:{session['session_id']}"))
+            if lane == 'expensive':
+                checks.append((expensive_limiter, f"ip:{client_ip}"))
+            allowed, retry_after, key = check_all(checks)
+            if not allowed:
+                print(f" Rate limited {key} on {request.path} (retry after {retry_after:.1f}s)")
+                return _too_many_requests('Too many requests. Please slow down.', retry_after)
+
+            admission = lanes[lane]
+            if not admission.acquire():
+                print(f" Rejected {request.path}: {lane} lane overloaded {admission.stats()}")
+                return _too_many_requests('Server is busy. Please try again shortly.', admission.queue_timeout or 1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission.release()
+        return wrapper
+    return decorator
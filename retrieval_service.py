@@ -0,0 +1,262 @@
+# retrieval_service.py
+#
+# Optional sidecar process that owns the SentenceTransformer and the index so
+# CPU-heavy encodes don't run inside the web workers. Start it with:
+#
+#     python retrieval_service.py
+#
+# and point the web app at it with RETRIEVAL_SERVICE_URL, either
+# "http://127.0.0.1:8765" or "unix:///tmp/moreyeahs-retrieval.sock".
+
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+RETRIEVAL_SERVICE_HOST = os.getenv("RETRIEVAL_SERVICE_HOST", "127.0.0.1")
+RETRIEVAL_SERVICE_PORT = int(os.getenv("RETRIEVAL_SERVICE_PORT", "8765"))
+RETRIEVAL_SERVICE_SOCKET = os.getenv("RETRIEVAL_SERVICE_SOCKET")
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "10"))
+# Queries arriving within this window are encoded and searched together
+BATCH_WINDOW_SECONDS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5")) / 1000
+MAX_BATCH_SIZE = int(os.getenv("RETRIEVAL_MAX_BATCH_SIZE", "32"))
+
+class RetrievalServiceError(Exception):
+    """Raised when the retrieval service can't answer a request."""
+
+# ---------------------------------------------------------------------------
+# Clients
+# ---------------------------------------------------------------------------
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class RetrievalClient:
+    """Talks to a retrieval service over local HTTP or a Unix socket."""
+
+    def __init__(self, url, timeout=RETRIEVAL_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            self._connect = lambda: _UnixHTTPConnection(parsed.path, self.timeout)
+        else:
+            self._connect = lambda: http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _post(self, path, payload):
+        return self._request("POST", path, payload)
+
+    def _request(self, method, path, payload=None):
+        conn = self._connect()
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+        except (OSError, ValueError) as e:
+            raise RetrievalServiceError(f"Retrieval service unavailable at {self.url}: {e}")
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise RetrievalServiceError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    def prepare(self, raw_text):
+        """Build the service's index; returns {"chunks": count, "index_version": version}."""
+        return self._post("/prepare", {"raw_text": raw_text})
+
+    def retrieve(self, query, top_k=5):
+        return self._post("/retrieve", {"query": query, "top_k": top_k})["chunks"]
+
+    def search(self, embeddings, top_k=5):
+        """Search with query embeddings already computed (see embed); one chunk list per embedding."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        return self._post("/search", {"embeddings": embeddings, "top_k": top_k})["chunks"]
+
+    def embed(self, texts):
+        """Normalized float32 embeddings for a list of texts, from the service's embedder."""
+        return np.asarray(self._post("/embed", {"texts": list(texts)})["embeddings"], dtype=np.float32)
+
+    def health(self):
+        return self._request("GET", "/health")
+
+def _prepare_index(raw_text):
+    import rag_pipeline
+    if rag_pipeline.index is None or rag_pipeline.index_version != rag_pipeline.text_version(raw_text):
+        rag_pipeline.build_local_index(raw_text)
+    return {"chunks": len(rag_pipeline.chunks), "index_version": rag_pipeline.index_version}
+
+def _embed_texts(texts):
+    import rag_pipeline
+    return np.asarray(rag_pipeline.get_embedder().encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+def _health():
+    import rag_pipeline
+    return {"ready": rag_pipeline.index is not None, "chunks": len(rag_pipeline.chunks),
+            "index_version": rag_pipeline.index_version}
+
+class InProcessRetrievalClient:
+    """Same interface as RetrievalClient, served by rag_pipeline in this process (for tests)."""
+
+    def prepare(self, raw_text):
+        return _prepare_index(raw_text)
+
+    def retrieve(self, query, top_k=5):
+        import rag_pipeline
+        return rag_pipeline.search_embeddings(_embed_texts([query]), top_k)[0]
+
+    def search(self, embeddings, top_k=5):
+        import rag_pipeline
+        return rag_pipeline.search_embeddings(embeddings, top_k)
+
+    def embed(self, texts):
+        return _embed_texts(list(texts))
+
+    def health(self):
+        return _health()
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class QueryBatcher:
+    """
+    Collects concurrent queries and answers them with one encode and one
+    search. A query submitted with its embedding skips the encode.
+    """
+
+    def __init__(self, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, query, top_k, embedding=None):
+        future = Future()
+        self._queue.put((query, embedding, top_k, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._answer(batch)
+
+    def _answer(self, batch):
+        import rag_pipeline
+        try:
+            embeddings = [embedding for _, embedding, _, _ in batch]
+            to_encode = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if to_encode:
+                encoded = rag_pipeline.get_embedder().encode([batch[i][0] for i in to_encode])
+                for i, embedding in zip(to_encode, encoded):
+                    embeddings[i] = embedding
+            max_k = max(top_k for _, _, top_k, _ in batch)
+            results = rag_pipeline.search_embeddings(np.asarray(embeddings, dtype=np.float32), max_k)
+            for (_, _, top_k, future), result in zip(batch, results):
+                future.set_result(result[:top_k])
+            print(f" Answered batch of {len(batch)} queries ({len(to_encode)} encoded)")
+        except Exception as e:
+            for _, _, _, future in batch:
+                future.set_exception(e)
+
+class RetrievalRequestHandler(BaseHTTPRequestHandler):
+    batcher = None
+    prepare_lock = threading.Lock()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": "Not found"})
+        self._send_json(200, _health())
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/retrieve":
+                future = self.batcher.submit(data["query"], int(data.get("top_k", 5)))
+                self._send_json(200, {"chunks": future.result(timeout=RETRIEVAL_TIMEOUT)})
+            elif self.path == "/search":
+                top_k = int(data.get("top_k", 5))
+                futures = [self.batcher.submit(None, top_k, np.asarray(embedding, dtype=np.float32))
+                           for embedding in data["embeddings"]]
+                self._send_json(200, {"chunks": [future.result(timeout=RETRIEVAL_TIMEOUT) for future in futures]})
+            elif self.path == "/prepare":
+                with self.prepare_lock:
+                    result = _prepare_index(data["raw_text"])
+                self._send_json(200, result)
+            elif self.path == "/embed":
+                self._send_json(200, {"embeddings": _embed_texts(data["texts"]).tolist()})
+            else:
+                self._send_json(404, {"error": "Not found"})
+        except ValueError as e:
+            self._send_json(409, {"error": str(e)})
+        except Exception as e:
+            print(f" Error in retrieval service: {e}")
+            self._send_json(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+def run_service():
+    """Load the embedder (and shared index, if configured) and serve requests."""
+    import rag_pipeline
+    rag_pipeline.get_embedder()
+    if rag_pipeline.RAG_SHARED_INDEX_DIR:
+        rag_pipeline.refresh_shared_index(force=True)
+        rag_pipeline.install_reload_signal()
+
+    RetrievalRequestHandler.batcher = QueryBatcher()
+    if RETRIEVAL_SERVICE_SOCKET:
+        if os.path.exists(RETRIEVAL_SERVICE_SOCKET):
+            os.remove(RETRIEVAL_SERVICE_SOCKET)
+        server = ThreadingUnixHTTPServer(RETRIEVAL_SERVICE_SOCKET, RetrievalRequestHandler)
+        print(f" Retrieval service listening on unix://{RETRIEVAL_SERVICE_SOCKET}")
+    else:
+        server = ThreadingHTTPServer((RETRIEVAL_SERVICE_HOST, RETRIEVAL_SERVICE_PORT), RetrievalRequestHandler)
+        print(f" Retrieval service listening on http://{RETRIEVAL_SERVICE_HOST}:{RETRIEVAL_SERVICE_PORT}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    run_service()
@@ -6,6 +6,11 @@ from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, WebDriverException
 import time
 import os
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from ocr import OCR_AVAILABLE, OCR_MIN_DIMENSION, ocr_images
+from entity_index import ROLE_WORDS, ENTITY_SECTION, IMAGE_SECTION, format_entity_lines
 
 BASE_URL = "https://www.moreyeahs.com"
 PAGES = [
@@ -18,6 +23,15 @@ PAGES = [
     "/Contact Us"     # Contact Us
 ]
 
+# OCR text embedded in page images (team photos, banners) into the scraped content
+SCRAPE_IMAGE_OCR = os.getenv("SCRAPE_IMAGE_OCR", "1") == "1"
+MAX_IMAGES_PER_PAGE = int(os.getenv("MAX_IMAGES_PER_PAGE", "25"))
+IMAGE_DOWNLOAD_TIMEOUT = 10
+# Pick out team and service cards from the page structure for the entity table (see entity_index.py)
+SCRAPE_ENTITIES = os.getenv("SCRAPE_ENTITIES", "1") == "1"
+# Only headed cards on these pages are taken as services
+SERVICE_PAGES = ("/Services", "/Product")
+
 def setup_driver():
     """Setup Chrome driver with appropriate options"""
     chrome_options = Options()
@@ -41,6 +55,104 @@ def setup_driver():
         print(" You can download it from: https://chromedriver.chromium.org/")
         return None
 
+def collect_page_images(driver):
+    """Return src/alt of the page's content-sized images in a single browser round trip"""
+    return driver.execute_script("""
+        var minSize = arguments[0];
+        var seen = {};
+        var images = [];
+        document.querySelectorAll('img').forEach(function(img) {
+            var src = img.currentSrc || img.src;
+            if (!src || seen[src] || /\\.svg(\\?|$)/i.test(src)) return;
+            if (img.naturalWidth < minSize || img.naturalHeight < minSize) return;
+            seen[src] = true;
+            images.push({src: src, alt: (img.alt || '').trim()});
+        });
+        return images;
+    """, OCR_MIN_DIMENSION)[:MAX_IMAGES_PER_PAGE]
+
+def download_image(src):
+    """Fetch image bytes for OCR; returns None on failure"""
+    try:
+        if src.startswith("data:"):
+            header, _, payload = src.partition(",")
+            return base64.b64decode(payload) if ";base64" in header else None
+        response = requests.get(src, timeout=IMAGE_DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        print(f" Could not download image {src[:80]}: {e}")
+        return None
+
+def extract_page_entities(driver, url):
+    """People (name, title, bio, link) and services (name, description, link) from the page's cards"""
+    return driver.execute_script("""
+        var roleWords = new RegExp('\\\\b(' + arguments[0] + ')\\\\b', 'i');
+        var withServices = arguments[1];
+        var namePattern = /^[A-Z][a-zA-Z.'-]+( [A-Z][a-zA-Z.'-]+){1,3}$/;
+        var seen = {};
+        var people = [];
+        var services = [];
+        function text(el) { return (el.innerText || '').replace(/\\s+/g, ' ').trim(); }
+        // The smallest ancestor that still reads like one card (heading plus a few lines)
+        function card(el) {
+            var node = el;
+            for (var i = 0; i < 4 && node.parentElement; i++) {
+                if (text(node.parentElement).length > 800) break;
+                node = node.parentElement;
+            }
+            return node;
+        }
+        document.querySelectorAll('h1, h2, h3, h4, h5, h6, strong, b').forEach(function(heading) {
+            var name = text(heading);
+            if (!name || name.length > 80 || seen[name]) return;
+            var box = card(heading);
+            var lines = (box.innerText || '').split('\\n').map(function(line) { return line.trim(); })
+                .filter(function(line) { return line && line !== name; });
+            var link = box.querySelector('a[href*="linkedin"]') || box.querySelector('a[href]');
+            var href = link ? link.href : '';
+            if (namePattern.test(name) && !roleWords.test(name)) {
+                var title = lines.filter(function(line) { return line.length <= 80 && roleWords.test(line); })[0];
+                if (title) {
+                    seen[name] = true;
+                    var bio = lines.filter(function(line) { return line !== title && line.length > 40; }).join(' ');
+                    people.push({name: name, title: title, bio: bio, link: href});
+                    return;
+                }
+            }
+            if (withServices && /^H[2-4]$/.test(heading.tagName) && name.length <= 60) {
+                var description = lines.filter(function(line) { return line.length > 40; })[0];
+                if (description) {
+                    seen[name] = true;
+                    services.push({name: name, description: description.slice(0, 400), link: href});
+                }
+            }
+        });
+        return {people: people, services: services};
+    """, ROLE_WORDS, any(page in url for page in SERVICE_PAGES))
+
+def extract_image_text(driver):
+    """OCR the images on the current page and return their text (plus alt text)"""
+    images = collect_page_images(driver)
+    if not OCR_AVAILABLE:
+        return "\n".join(image["alt"] for image in images if image["alt"])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        downloads = list(executor.map(download_image, [image["src"] for image in images]))
+
+    found = [(image, data) for image, data in zip(images, downloads) if data]
+    texts = ocr_images([data for _, data in found])
+
+    lines = []
+    for (image, _), text in zip(found, texts):
+        text = " ".join(text.split())
+        if image["alt"] and text:
+            lines.append(f"{image['alt']}: {text}")
+        elif text or image["alt"]:
+            lines.append(text or image["alt"])
+    print(f" OCR processed {len(found)} images")
+    return "\n".join(lines)
+
 def scrape_page_content(driver, url):
     """Scrape content from a single page"""
     try:
@@ -79,11 +191,31 @@ def scrape_page_content(driver, url):
                 continue
         
         if text_content:
-            return " ".join(text_content)
+            page_text = " ".join(text_content)
         else:
             # Fallback: get all text from body
             body = driver.find_element(By.TAG_NAME, "body")
-            return body.text.strip()
+            page_text = body.text.strip()
+        
+        if SCRAPE_ENTITIES:
+            try:
+                entities = extract_page_entities(driver, url)
+                entity_lines = format_entity_lines(entities["people"], entities["services"])
+                if entity_lines:
+                    page_text += f"\n\n{ENTITY_SECTION}\n{entity_lines}"
+                    print(f" Found {len(entities['people'])} people and {len(entities['services'])} services")
+            except Exception as e:
+                print(f" Error extracting entities from {url}: {e}")
+        
+        if SCRAPE_IMAGE_OCR:
+            try:
+                image_text = extract_image_text(driver)
+                if image_text:
+                    page_text += f"\n\n{IMAGE_SECTION}\n{image_text}"
+            except Exception as e:
+                print(f" Error extracting image text from {url}: {e}")
+        
+        return page_text
             
     except TimeoutException:
         print(f" Timeout loading {url}")
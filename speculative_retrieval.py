@@ -0,0 +1,146 @@
+# speculative_retrieval.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_pipeline import (
+    embed_query, retrieve_relevant_chunks, retrieve_document_chunks, session_has_documents, get_retrieval_backend
+)
+
+# Start retrieval when the question arrives instead of after routing; 0 retrieves on demand
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+# Threads running speculative retrievals (embedding and FAISS search release the GIL)
+SPECULATIVE_RETRIEVAL_WORKERS = int(os.getenv("SPECULATIVE_RETRIEVAL_WORKERS", "4"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_speculation_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=SPECULATIVE_RETRIEVAL_WORKERS, thread_name_prefix="speculate")
+        return _pool
+
+class SpeculativeRetrieval:
+    """
+    Embeds a question and runs company and session-document retrieval in
+    the background while the caller routes the message and sets up the
+    chat. Results are collected on demand; a part that has not started yet
+    is computed inline, so nothing runs twice. discard() drops work the
+    router decided is not needed.
+    """
+
+    PARTS = ('embedding', 'company', 'documents')
+
+    def __init__(self, question, session_id=None, company=True, documents=True,
+                 company_top_k=5, document_top_k=4, max_distance=None):
+        self.question = question
+        self.session_id = session_id
+        self.company = company
+        self.documents = documents
+        self.company_top_k = company_top_k
+        self.document_top_k = document_top_k
+        self.max_distance = max_distance
+        self.discarded = False
+        self.dropped = []
+        self.started = False
+        self.work_ms = {}
+        self.wait_ms = 0.0
+        self._results = {}
+        self._locks = {part: threading.Lock() for part in self.PARTS}
+
+    def start(self):
+        if SPECULATIVE_RETRIEVAL:
+            self.started = True
+            get_speculation_pool().submit(self._run)
+        return self
+
+    def _run(self):
+        for part in self.PARTS:
+            if self.discarded:
+                return
+            if part == 'company' and not self.company:
+                continue
+            if part == 'documents' and not self.documents:
+                continue
+            self._compute(part)
+
+    def _compute(self, part):
+        if part != 'embedding':
+            # Dependency first, so each part's time is its own
+            self._compute('embedding')
+        with self._locks[part]:
+            if part in self._results:
+                return
+            start = time.perf_counter()
+            try:
+                value, error = getattr(self, f"_{part}")(), None
+            except Exception as e:
+                value, error = None, e
+            self.work_ms[part] = (time.perf_counter() - start) * 1000
+            self._results[part] = (value, error)
+
+    def _embedding(self):
+        return embed_query(self.question)
+
+    def _company(self):
+        # A retrieval service embeds the text itself
+        embedding = None if get_retrieval_backend() is not None else self._value('embedding')
+        return retrieve_relevant_chunks(self.question, top_k=self.company_top_k, query_embedding=embedding)
+
+    def _documents(self):
+        if self.session_id is None or not session_has_documents(self.session_id):
+            return []
+        return retrieve_document_chunks(
+            self.session_id, self.question, top_k=self.document_top_k, max_distance=self.max_distance,
+            query_embedding=self._value('embedding')
+        )
+
+    def _value(self, part):
+        value, error = self._results[part]
+        if error is not None:
+            raise error
+        return value
+
+    def _get(self, part):
+        start = time.perf_counter()
+        self._compute(part)
+        self.wait_ms += (time.perf_counter() - start) * 1000
+        return self._value(part)
+
+    def embedding(self):
+        """Normalized question embedding (1 x dim float32), for the router and other retrievals."""
+        return self._get('embedding')
+
+    def company_chunks(self):
+        return self._get('company')
+
+    def document_passages(self):
+        return self._get('documents')
+
+    def discard(self, *parts):
+        """Skip background work that has not started: the given parts ('company', 'documents'), or all of it."""
+        if not parts:
+            self.discarded = True
+        for part in parts or ('company', 'documents'):
+            if getattr(self, part) and part not in self._results and part not in self.dropped:
+                self.dropped.append(part)
+        if 'company' in parts:
+            self.company = False
+        if 'documents' in parts:
+            self.documents = False
+
+    def saved_ms(self):
+        """Retrieval work that ran off the critical path."""
+        if not self.started:
+            return 0.0
+        return max(0.0, sum(self.work_ms.values()) - self.wait_ms)
+
+    def log(self):
+        work = ", ".join(f"{part}={ms:.1f}ms" for part, ms in self.work_ms.items()) or "none"
+        mode = "speculative" if self.started else "on demand"
+        state = f", dropped {'/'.join(self.dropped)}" if self.dropped else ""
+        print(f" Retrieval ({mode}{state}): {work}; waited {self.wait_ms:.1f}ms, saved ~{self.saved_ms():.1f}ms")
@@ -0,0 +1,19 @@
+import io
+import zipfile
+
+from file_processing import process_uploaded_files
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+def test_skipped_members_keep_their_place_in_the_archive():
+    archive = make_zip([("a.txt", "first"), ("b.exe", "binary"), ("c.txt", "third")])
+    results = process_uploaded_files([("docs.zip", archive)])
+    assert [result['name'] for result in results] == ["docs.zip/a.txt", "docs.zip/b.exe", "docs.zip/c.txt"]
+    assert [result['status'] for result in results] == ['ready', 'error', 'ready']
+    assert results[1]['error'] == "unsupported file type"
@@ -0,0 +1,57 @@
+import pytest
+
+from entity_index import EntityIndex, format_entity_lines
+
+SITE = """
+============================================================
+Content from https://www.moreyeahs.com/About Us
+============================================================
+MoreYeahs was founded in 2016 by Jane Doe.
+
+People and services on this page:
+{people}
+""".format(people=format_entity_lines(
+    [{'name': 'Jane Doe', 'title': 'CEO & Founder', 'link': 'https://linkedin.com/in/jane'}], []
+))
+
+@pytest.fixture
+def entities():
+    index = EntityIndex()
+    index.build(SITE, "v1")
+    return index
+
+def test_role_lookup(entities):
+    answer = entities.lookup("Who is the CEO of MoreYeahs?")
+    assert answer is not None and "Jane Doe" in answer.text
+
+@pytest.mark.parametrize("question", [
+    "Who founded Microsoft?",
+    "Who is Google's CEO?",
+    "Who is the CEO of Google?",
+    "Who is the CTO at Microsoft?",
+])
+def test_roles_at_other_organizations_are_not_answered(entities, question):
+    assert entities.lookup(question) is None
+
+def test_role_lookup_needs_company_routing(entities):
+    assert entities.lookup("Who is the CEO?", company=False) is None
+
+def test_named_person_answered_without_company_routing(entities):
+    answer = entities.lookup("Who is Jane Do?", company=False)
+    assert answer is not None and answer.method == 'name'
+
+@pytest.mark.parametrize("question", [
+    "What is a CEO?",
+    "what does the ceo do all day at moreyeahs?",
+])
+def test_questions_about_the_role_itself_are_not_answered(entities, question):
+    assert entities.lookup(question) is None
+
+@pytest.mark.parametrize("question", [
+    "Hi, who is the CEO?",
+    "Hello! Who is the CEO of MoreYeahs?",
+    "What is the name of the CEO?",
+])
+def test_greetings_and_name_of_questions_get_the_role_lookup(entities, question):
+    answer = entities.lookup(question)
+    assert answer is not None and "Jane Doe" in answer.text
@@ -0,0 +1,39 @@
+from extractive_qa import extract_answer
+
+SITE_CHUNKS = [
+    "Our CEO believes innovation drives everything we do.\n"
+    "Since 2015 we served 150 000 users.\n"
+    "We build web and mobile applications for clients worldwide.",
+]
+
+def test_single_term_match_without_answer_is_not_served():
+    assert extract_answer("Who is the CEO?", SITE_CHUNKS) is None
+
+def test_six_digit_number_is_not_an_address():
+    assert extract_answer("Where is the company located?", SITE_CHUNKS) is None
+
+def test_who_question_answered_by_sentence_with_a_name():
+    chunks = SITE_CHUNKS + ["MoreYeahs was founded in 2016 by Deepak Rathore, who serves as CEO."]
+    answer = extract_answer("Who is the CEO?", chunks)
+    assert answer is not None
+    assert "Deepak Rathore" in answer.text
+
+def test_address_needs_an_address_word():
+    chunks = ["Address: 3rd Floor, Sai Square, Vijay Nagar, Indore, MP 452010"]
+    answer = extract_answer("Where is the office?", chunks)
+    assert answer is not None
+    assert answer.text.endswith("3rd Floor, Sai Square, Vijay Nagar, Indore, MP 452010")
+
+def test_email_extracted():
+    answer = extract_answer("What is the contact email?", ["Email: info@moreyeahs.com"])
+    assert answer is not None and "info@moreyeahs.com" in answer.text
+
+def test_labelled_sentence_answers_a_single_term_question():
+    chunks = SITE_CHUNKS + ["Openings: Python Developer, QA Engineer and Business Analyst."]
+    answer = extract_answer("what are the openings?", chunks)
+    assert answer is not None
+    assert answer.text.startswith("Openings: Python Developer")
+
+def test_sentence_mentioning_the_term_mid_sentence_still_needs_two_terms():
+    chunks = ["We announce new openings on LinkedIn every month."]
+    assert extract_answer("what are the openings?", chunks) is None
@@ -0,0 +1,30 @@
+from history_manager import ConversationHistory
+from prompt_builder import COMPANY_INFO_HEADER, estimate_tokens
+
+def test_answers_are_stored_as_written():
+    history = ConversationHistory()
+    history.add_turn("Tell me about MoreYeahs", "Company Information: MoreYeahs builds software.")
+    assert history.turns[-1][1] == "Company Information: MoreYeahs builds software."
+
+def test_context_blocks_are_stripped_from_user_text():
+    history = ConversationHistory()
+    history.add_turn(f"Who is the CEO?\n\n{COMPANY_INFO_HEADER}\nchunk text", "The CEO is Jane Doe.")
+    assert history.turns[-1][0] == "Who is the CEO?"
+
+def test_oversized_last_turn_is_cut_to_the_budget():
+    history = ConversationHistory(token_budget=100)
+    history.add_turn("word " * 400, "answer " * 400)
+    assert len(history.turns) == 1
+    assert history.history_tokens() <= 100 + 2
+    assert history.turns[0][0] and history.turns[0][1]
+
+def test_last_turn_is_dropped_when_the_summary_fills_the_budget():
+    history = ConversationHistory(token_budget=100)
+    history.summary = "summary " * 100
+    history.add_turn("word " * 400, "answer " * 400)
+    assert history.turns == []
+
+def test_tiny_budget_never_grows_the_turn():
+    history = ConversationHistory(token_budget=3)
+    history.add_turn("word " * 40, "answer " * 40)
+    assert history.history_tokens() <= 3 + 2
@@ -0,0 +1,58 @@
+import numpy as np
+
+from intent_router import IntentRouter
+
+def _vector(company, general):
+    vector = np.array([[company, general]], dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def make_router():
+    router = IntentRouter(use_embeddings=True)
+    # Two orthogonal prototypes stand in for the embedded route examples
+    router._prototypes = {
+        'company': np.array([[1.0, 0.0]], dtype=np.float32),
+        'general': np.array([[0.0, 1.0]], dtype=np.float32),
+    }
+    return router
+
+def test_confident_general_wins_over_company_keywords():
+    router = make_router()
+    for message in ["What is the address of the Eiffel Tower?", "Who is the founder of Google?",
+                    "What services does AWS offer?", "How do I contact my landlord?"]:
+        decision = router.route(None, message, embed=lambda: _vector(0.1, 0.9))
+        assert decision.intent == 'general', message
+
+def test_keywords_decide_in_the_uncertain_band():
+    router = make_router()
+    decision = router.route(None, "Who is the founder?", embed=lambda: _vector(0.5, 0.5))
+    assert decision.intent == 'company' and decision.method == 'keywords'
+
+def test_confident_company():
+    decision = make_router().route(None, "Tell me about MoreYeahs", embed=lambda: _vector(0.9, 0.1))
+    assert decision.intent == 'company' and decision.method == 'semantic'
+
+def test_embedding_failure_falls_back_for_that_message_only():
+    router = make_router()
+
+    def failing():
+        raise RuntimeError("embedder down")
+
+    decision = router.route(None, "Who is the founder?", embed=failing)
+    assert decision.method == 'keywords'
+    assert router.use_embeddings
+    decision = router.route(None, "What is machine learning?", embed=lambda: _vector(0.1, 0.9))
+    assert decision.method == 'semantic'
+
+def test_follow_up_in_a_session_stays_on_the_company_topic():
+    router = make_router()
+    first = router.route("session", "Tell me about MoreYeahs", embed=lambda: _vector(0.9, 0.1))
+    assert first.intent == 'company'
+    for message in ["who else?", "what about their email?"]:
+        decision = router.route("session", message, embed=lambda: _vector(0.1, 0.9))
+        assert decision.intent == 'company' and decision.method == 'follow-up', message
+
+def test_clearly_general_question_after_a_company_turn():
+    router = make_router()
+    router.route("session", "Tell me about MoreYeahs", embed=lambda: _vector(0.9, 0.1))
+    decision = router.route("session", "Who is the founder of Google?", embed=lambda: _vector(0.1, 0.9))
+    assert decision.intent == 'general'
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+import llm_client
+from llm_client import CircuitBreaker, FakeResponse, LLMUnavailableError, ModelClient, call_with_retry
+
+def test_non_retryable_errors_leave_the_breaker_alone():
+    breaker = CircuitBreaker("test", failures=3)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    def call(timeout):
+        raise ValueError("400 invalid argument")
+
+    with pytest.raises(ValueError):
+        call_with_retry(call, breaker=breaker)
+    assert breaker.as_dict() == {'state': 'closed', 'consecutive_failures': 2}
+
+def test_non_retryable_error_frees_the_half_open_trial():
+    breaker = CircuitBreaker("test", failures=1, reset_after=0)
+    breaker.record_failure()
+    with pytest.raises(ValueError):
+        call_with_retry(lambda timeout: (_ for _ in ()).throw(ValueError("blocked")), breaker=breaker)
+    assert breaker.state == 'half-open'
+    assert call_with_retry(lambda timeout: FakeResponse("ok"), breaker=breaker).text == "ok"
+    assert breaker.state == 'closed'
+
+def test_concurrent_requests_build_a_model_once():
+    client = ModelClient(backend="fake")
+    builds = []
+    build = client._build
+
+    def slow_build(*args):
+        builds.append(args[1])
+        time.sleep(0.05)
+        return build(*args)
+
+    client._build = slow_build
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(client.model("m", "instructions", "v1"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == ["m"] and len({id(model) for model in models}) == 1
+
+class UpstreamError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} service unavailable")
+        self.code = code
+
+def test_transient_errors_on_every_attempt_make_the_model_unavailable(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.001)
+    attempts = []
+
+    def call(timeout):
+        attempts.append(timeout)
+        raise UpstreamError(503)
+
+    with pytest.raises(LLMUnavailableError) as raised:
+        call_with_retry(call, breaker=CircuitBreaker("test", failures=10))
+    assert len(attempts) == llm_client.LLM_MAX_ATTEMPTS
+    assert isinstance(raised.value.__cause__, UpstreamError)
@@ -0,0 +1,48 @@
+import pytest
+
+import llm_client
+from llm_client import ModelClient
+from model_router import ModelRouter
+
+TIERS = {'fast': ["model-a"], 'strong': ["model-a", "model-b"], 'vision': ["model-a"]}
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_ATTEMPTS", 1)
+    return ModelRouter(ModelClient(backend="fake"), tiers=TIERS)
+
+def failing_on(name, error, called):
+    def call(model, timeout):
+        called.append(model.model_name)
+        if model.model_name == name:
+            raise error
+        return model.generate_content("hello")
+    return call
+
+def test_non_retryable_errors_are_raised_without_failover(router):
+    called = []
+    with pytest.raises(ValueError):
+        router.generate('strong', failing_on("model-a", ValueError("400 invalid argument"), called))
+    assert called == ["model-a"]
+
+def test_retryable_errors_fail_over_to_the_next_model(router):
+    called = []
+    response, name = router.generate('strong', failing_on("model-a", ConnectionError("reset"), called))
+    assert name == "model-b" and called == ["model-a", "model-b"]
+
+def test_an_open_circuit_only_skips_its_own_model(router):
+    breaker = router._breaker("model-a")
+    for _ in range(breaker.failures):
+        breaker.record_failure()
+    called = []
+    response, name = router.generate('strong', failing_on(None, None, called))
+    assert name == "model-b" and called == ["model-b"]
+    assert router._breaker("model-b").state == 'closed'
+
+def test_bad_requests_do_not_count_against_the_model(router):
+    for _ in range(10):
+        with pytest.raises(ValueError):
+            router.generate('strong', failing_on("model-a", ValueError("400 invalid argument"), []))
+    stats = router._stats("model-a")
+    assert stats.error_rate() == 0.0 and not stats.failing()
+    assert router.candidates('strong')[0] == "model-a"
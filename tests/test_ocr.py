@@ -0,0 +1,38 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ocr
+from upload_cache import content_hash, ocr_cache
+
+@pytest.fixture
+def slow_ocr(monkeypatch):
+    release = threading.Event()
+
+    def fake_ocr(data):
+        release.wait(5)
+        return f"text of {data.decode()}"
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(ocr, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(ocr, "_ocr_bytes", fake_ocr)
+    monkeypatch.setattr(ocr, "get_ocr_pool", lambda: pool)
+    yield release
+    release.set()
+    pool.shutdown()
+
+def test_ocr_past_the_wait_is_cached_when_it_finishes(slow_ocr):
+    data = b"slow-image-for-ocr-test"
+    assert ocr.ocr_image(data, timeout=0.05) == ""
+    slow_ocr.set()
+    ocr.get_ocr_pool().shutdown(wait=True)
+    assert ocr_cache.get(content_hash(data)) == "text of slow-image-for-ocr-test"
+
+def test_inline_ocr_runs_without_the_pool(monkeypatch):
+    monkeypatch.setattr(ocr, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(ocr, "_ocr_bytes", lambda data: f"text of {data.decode()}")
+    monkeypatch.setattr(ocr, "get_ocr_pool", lambda: pytest.fail("inline OCR must not start a pool"))
+    data = b"inline-image-for-ocr-test"
+    assert ocr.ocr_images([data, data], inline=True) == ["text of inline-image-for-ocr-test"] * 2
+    assert ocr_cache.get(content_hash(data)) == "text of inline-image-for-ocr-test"
@@ -0,0 +1,28 @@
+import glob
+import io
+import os
+import tempfile
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import file_processing
+
+def make_pdf(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page number {i} text")
+    return doc.tobytes()
+
+def test_large_pdfs_are_split_across_the_pool(monkeypatch):
+    monkeypatch.setattr(file_processing, "PDF_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(file_processing, "PDF_PAGES_PER_TASK", 2)
+    before = set(glob.glob(os.path.join(tempfile.gettempdir(), "*.pdf")))
+
+    text = file_processing.extract_text_from_pdf(io.BytesIO(make_pdf(11)))
+    assert [line for line in text.splitlines() if line] == [f"Page number {i} text" for i in range(11)]
+
+    limited = file_processing.extract_text_from_pdf(io.BytesIO(make_pdf(11)), max_chars=40)
+    assert limited.count("Page number") < 11
+    assert set(glob.glob(os.path.join(tempfile.gettempdir(), "*.pdf"))) == before
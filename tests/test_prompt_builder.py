@@ -0,0 +1,38 @@
+from llm_client import ModelClient
+from prompt_builder import PromptBuilder, estimate_tokens
+
+SUMMARY = "MoreYeahs is a software company in Indore that builds web apps, mobile apps and AI solutions for clients."
+
+def test_required_sections_are_cut_to_the_budget():
+    prompt = PromptBuilder("test", budget=100)
+    prompt.add("request", "User Question: " + "please read this " * 200, required=True)
+    prompt.add("instructions", "Answer briefly.", required=True)
+    text = prompt.build()
+    assert estimate_tokens(text) <= 100 + 2
+    assert text.endswith("Answer briefly.")
+
+def test_passages_already_in_the_system_instruction_are_dropped():
+    prompt = PromptBuilder("test", system_instruction=f"Instructions.\n\n{SUMMARY}")
+    prompt.add("request", "User Question: What does MoreYeahs do?", required=True)
+    prompt.add_passages("company_info", "Company information:", [SUMMARY, "The office is open Monday to Friday."])
+    text = prompt.build()
+    assert SUMMARY not in text
+    assert "Monday to Friday" in text
+
+def test_fake_backend_sends_the_instruction_once_and_only_the_turn_in_prompts():
+    client = ModelClient(backend="fake")
+    instruction = f"Instructions.\n\n{SUMMARY}"
+    model = client.model("gemini-test", instruction, version="v1")
+    assert client.model("gemini-test", instruction, version="v1") is model
+
+    prompt = PromptBuilder("chat", system_instruction=instruction)
+    prompt.add("request", "User Question: What does MoreYeahs do?", required=True)
+    prompt.add_passages("company_info", "Company information:", [SUMMARY])
+    model.generate_content(prompt.build())
+
+    call = model.calls[-1]
+    assert call['system_instruction'] == instruction
+    assert SUMMARY not in call['prompt']
+
+    rebuilt = client.model("gemini-test", instruction + "\nNew index.", version="v2")
+    assert rebuilt is not model and rebuilt.system_instruction.endswith("New index.")
@@ -0,0 +1,16 @@
+from rate_limit import KeyedRateLimiter, check_all
+
+def test_no_bucket_is_charged_when_one_is_empty():
+    roomy = KeyedRateLimiter(rate_per_minute=1, burst=5)
+    empty = KeyedRateLimiter(rate_per_minute=1, burst=1)
+    assert empty.check("ip")[0]
+
+    allowed, retry_after, key = check_all([(roomy, "session"), (empty, "ip")])
+    assert not allowed and key == "ip" and retry_after > 0
+    assert roomy._buckets["session"].tokens == 5
+
+def test_every_bucket_is_charged_when_all_have_tokens():
+    first = KeyedRateLimiter(rate_per_minute=1, burst=2)
+    second = KeyedRateLimiter(rate_per_minute=1, burst=2)
+    assert check_all([(first, "a"), (second, "b")])[0]
+    assert round(first._buckets["a"].tokens) == 1 and round(second._buckets["b"].tokens) == 1
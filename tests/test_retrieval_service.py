@@ -0,0 +1,65 @@
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("faiss")
+
+import rag_pipeline
+from retrieval_service import InProcessRetrievalClient
+
+class HashingEmbedder:
+    """Hashed bag of words, so the tests do not load the embedding model."""
+
+    def encode(self, texts, show_progress_bar=False, normalize_embeddings=False):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[i, zlib.crc32(word.encode()) % 64] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "embedder", HashingEmbedder())
+    monkeypatch.setattr(rag_pipeline, "index", None)
+    monkeypatch.setattr(rag_pipeline, "index_version", None)
+    monkeypatch.setattr(rag_pipeline, "chunks", [])
+    client = InProcessRetrievalClient()
+    rag_pipeline.set_retrieval_backend(client)
+    yield client
+    rag_pipeline.set_retrieval_backend(None)
+
+SITE_TEXT = "MoreYeahs builds web and mobile apps.\n\nThe office is in Indore.\n\nContact us by email."
+
+def test_prepare_records_the_service_index_version(backend):
+    rag_pipeline.prepare_rag_pipeline(SITE_TEXT)
+    assert rag_pipeline.index_version == rag_pipeline.text_version(SITE_TEXT)
+    assert rag_pipeline.indexed_chunk_count() == backend.health()["chunks"] > 0
+
+def test_queries_are_embedded_by_the_service(backend):
+    embedding = rag_pipeline.embed_query("Where is the office?")
+    assert embedding.shape == (1, 64) and embedding.dtype == np.float32
+    assert np.isclose(np.linalg.norm(embedding), 1.0)
+
+def test_retrieve_through_the_service(backend):
+    rag_pipeline.prepare_rag_pipeline(SITE_TEXT)
+    assert "Indore" in rag_pipeline.retrieve_relevant_chunks("office Indore", top_k=1)[0]
+
+def test_a_precomputed_query_embedding_is_searched_without_embedding_again(backend, monkeypatch):
+    rag_pipeline.prepare_rag_pipeline(SITE_TEXT)
+    embedding = rag_pipeline.embed_query("office Indore")
+    monkeypatch.setattr(backend, "retrieve", lambda *args: pytest.fail("the query was embedded again"))
+    assert "Indore" in rag_pipeline.retrieve_relevant_chunks("office Indore", top_k=1, query_embedding=embedding)[0]
+
+def test_session_documents_are_embedded_by_the_service(backend, monkeypatch):
+    calls = []
+    embed = backend.embed
+    monkeypatch.setattr(backend, "embed", lambda texts: calls.append(list(texts)) or embed(texts))
+    text = "Bananas are yellow fruit grown in the tropics. " * 40
+    rag_pipeline.index_session_document("service-session", "bananas.txt", text)
+    try:
+        assert calls and rag_pipeline.session_has_documents("service-session")
+    finally:
+        rag_pipeline.clear_session_documents("service-session")
@@ -0,0 +1,37 @@
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("faiss")
+
+import rag_pipeline
+
+def _embed(texts):
+    # Hashed bag of words, so the tests do not load the embedding model
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[i, zlib.crc32(word.encode()) % 64] += 1
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "embed_passages", _embed)
+    monkeypatch.setattr(rag_pipeline, "embed_query", lambda query: _embed([query]))
+    yield "test-session"
+    rag_pipeline.clear_session_documents("test-session")
+
+def test_retrieval_can_be_limited_to_one_document(session):
+    apples, bananas = "Apples are red fruit. " * 50, "Bananas are yellow fruit. " * 50
+    rag_pipeline.index_session_document(session, "apples.txt", apples)
+    rag_pipeline.index_session_document(session, "bananas.txt", bananas)
+
+    names = {name for name, _ in rag_pipeline.retrieve_document_chunks(session, "red apples", top_k=3)}
+    assert "apples.txt" in names
+
+    key = rag_pipeline.document_key(bananas)
+    passages = rag_pipeline.retrieve_document_chunks(session, "red apples", top_k=3, doc_keys={key})
+    assert passages and {name for name, _ in passages} == {"bananas.txt"}
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+from file_processing import detect_encoding, extract_text_from_txt
+
+@pytest.mark.parametrize("text", [
+    "Café crème brûlée",
+    "José Müller",
+    "Ünïcödé façade naïve résumé — “quoted” text, 5€ please.",
+])
+def test_western_european_cp1252_text(text):
+    encoding, confidence = detect_encoding(text.encode("cp1252"))
+    assert text.encode("cp1252").decode(encoding) == text
+    assert 0.0 <= confidence < 1.0
+
+def test_extracted_text_and_metadata():
+    metadata = {}
+    text = extract_text_from_txt(io.BytesIO("Crème brûlée à la carte".encode("cp1252")), metadata=metadata)
+    assert text == "Crème brûlée à la carte"
+    assert metadata['encoding'] in ("cp1252", "latin_1")
+
+def test_utf8_and_bom():
+    assert detect_encoding("José Müller".encode("utf-8"))[0] == "utf-8"
+    assert detect_encoding("José".encode("utf-8-sig"))[0] == "utf-8-sig"
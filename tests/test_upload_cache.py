@@ -0,0 +1,15 @@
+import os
+
+from upload_cache import ContentCache
+
+def test_spilled_entries_use_portable_file_names(tmp_path):
+    cache = ContentCache("test", max_memory_bytes=1, max_disk_bytes=1024 * 1024, disk_dir=str(tmp_path))
+    cache.put("abc123-pdf-0", "first")
+    cache.put("abc123:pdf/0", "second")
+    cache.put("last", "third")
+
+    names = os.listdir(tmp_path)
+    assert "abc123-pdf-0.pkl" in names
+    assert all(":" not in name and "/" not in name for name in names)
+    assert cache.get("abc123-pdf-0") == "first"
+    assert cache.get("abc123:pdf/0") == "second"
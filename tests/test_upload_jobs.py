@@ -0,0 +1,35 @@
+import time
+
+from upload_jobs import UploadJobQueue
+
+def wait_finished(queue, jobs):
+    deadline = time.time() + 5
+    while not all(job.finished for job in jobs) and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_oldest_finished_jobs_are_dropped_over_the_count_cap():
+    queue = UploadJobQueue(workers=1, max_pending=10, ttl=3600, max_retained=2)
+    jobs = [queue.submit("s", f"f{i}", lambda: {'file_content': "text"}) for i in range(4)]
+    wait_finished(queue, jobs)
+    queue.submit("s", "last", lambda: {'file_content': "text"})
+    assert queue.get(jobs[0].id, "s") is None
+    assert queue.get(jobs[1].id, "s") is None
+    assert queue.get(jobs[3].id, "s") is jobs[3]
+
+def test_oldest_finished_jobs_are_dropped_over_the_byte_cap():
+    queue = UploadJobQueue(workers=1, max_pending=10, ttl=3600, max_bytes=250)
+    jobs = [queue.submit("s", f"f{i}", lambda: {'file_content': "x" * 100}) for i in range(3)]
+    wait_finished(queue, jobs)
+    assert queue.get(jobs[0].id, "s") is None
+    assert queue.get(jobs[2].id, "s") is jobs[2]
+    assert queue.stats()['retained_bytes'] == 200
+
+def test_discard_and_worker_ids():
+    queue = UploadJobQueue(workers=1, max_pending=10, ttl=3600)
+    job = queue.submit("s", "f", lambda: {'file_content': "text"})
+    wait_finished(queue, [job])
+    assert queue.is_local(job.id)
+    assert not queue.is_local("0-" + job.id.split("-", 1)[1])
+    queue.discard([job.id])
+    assert queue.get(job.id, "s") is None
+    assert queue.stats()['retained_bytes'] == 0
@@ -0,0 +1,33 @@
+# timing.py
+
+import time
+from contextlib import contextmanager
+
+class StageTimer:
+    """Records wall-clock milliseconds for named stages of a request or pipeline."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, label):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(label, (time.perf_counter() - start) * 1000)
+
+    def record(self, label, elapsed_ms):
+        self.stages[label] = self.stages.get(label, 0.0) + elapsed_ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def as_dict(self):
+        return {label: round(ms, 2) for label, ms in self.stages.items()}
+
+    def log(self):
+        stages = ", ".join(f"{label}={ms:.1f}ms" for label, ms in self.stages.items())
+        print(f" Timings [{self.name}]: {stages} (total {self.total_ms():.1f}ms)")
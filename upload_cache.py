@@ -0,0 +1,152 @@
+# upload_cache.py
+
+import hashlib
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+# Root directory for entries that overflow the in-memory caches
+UPLOAD_CACHE_DIR = os.getenv("UPLOAD_CACHE_DIR", ".upload_cache")
+MB = 1024 * 1024
+# Keys made of these characters are used as file names as they are; others are hashed
+SAFE_KEY = re.compile(r"^[A-Za-z0-9_-]{1,200}$")
+
+def content_hash(data):
+    """SHA-256 hex digest of raw bytes (or text, encoded as UTF-8)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+class ContentCache:
+    """
+    Content-addressed cache with size-based eviction.
+
+    Entries live in an in-memory LRU bounded by `max_memory_bytes`. Entries
+    evicted from memory overflow to pickles under `disk_dir`, which is itself
+    bounded by `max_disk_bytes` (oldest files removed first). A disk hit is
+    promoted back into memory.
+    """
+
+    def __init__(self, name, max_memory_bytes, max_disk_bytes, disk_dir=None):
+        self.name = name
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = disk_dir or os.path.join(UPLOAD_CACHE_DIR, name)
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        # Keep disk names valid on every platform (no ':' or path separators on Windows)
+        name = key if SAFE_KEY.match(key) else content_hash(key)
+        return os.path.join(self.disk_dir, f"{name}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store_memory(key, value, len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        return value
+
+    def put(self, key, value):
+        self._store_memory(key, value, len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+
+    def _store_memory(self, key, value, size):
+        overflow = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+                old_key, (old_value, old_size) = self._entries.popitem(last=False)
+                self._memory_bytes -= old_size
+                overflow.append((old_key, old_value))
+        for old_key, old_value in overflow:
+            self._write_disk(old_key, old_value)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f" Dropping unreadable {self.name} cache entry {key[:12]}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _write_disk(self, key, value):
+        if self.max_disk_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._prune_disk()
+        except Exception as e:
+            print(f" Could not write {self.name} cache entry to disk: {e}")
+
+    def _prune_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'memory_bytes': self._memory_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+def _env_mb(name, default):
+    return int(float(os.getenv(name, default)) * MB)
+
+# Extracted text of uploaded files, keyed by file content hash
+extraction_cache = ContentCache(
+    "extraction", _env_mb("EXTRACTION_CACHE_MEMORY_MB", "64"), _env_mb("EXTRACTION_CACHE_DISK_MB", "512")
+)
+# Passages and embeddings of uploaded documents, keyed by text hash
+embedding_cache = ContentCache(
+    "embeddings", _env_mb("EMBEDDING_CACHE_MEMORY_MB", "128"), _env_mb("EMBEDDING_CACHE_DISK_MB", "1024")
+)
+# OCR output, keyed by image content hash
+ocr_cache = ContentCache(
+    "ocr", _env_mb("OCR_CACHE_MEMORY_MB", "16"), _env_mb("OCR_CACHE_DISK_MB", "128")
+)
\ No newline at end of file
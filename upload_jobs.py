@@ -0,0 +1,177 @@
+# upload_jobs.py
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Uploads extracted at the same time; CPU-heavy parsing is further bounded by the extraction pool
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "4"))
+# Jobs waiting or running before new uploads are refused
+UPLOAD_JOB_MAX_PENDING = int(os.getenv("UPLOAD_JOB_MAX_PENDING", "32"))
+# Finished jobs (and their extracted content) are kept this long, in seconds
+UPLOAD_JOB_TTL = float(os.getenv("UPLOAD_JOB_TTL", "3600"))
+# At most this many finished jobs are kept; the oldest are dropped first
+UPLOAD_JOB_MAX_RETAINED = int(os.getenv("UPLOAD_JOB_MAX_RETAINED", "200"))
+# Approximate bytes of extracted content kept across finished jobs
+UPLOAD_JOB_MAX_BYTES = int(os.getenv("UPLOAD_JOB_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Jobs live in this process's memory, so document IDs carry the process that
+# holds them. With several workers, /upload and the /chat that references its
+# document IDs must reach the same worker (sticky sessions on the session cookie).
+WORKER_ID = f"{os.getpid():x}"
+
+FINISHED_STATUSES = ('ready', 'error')
+
+class UploadJob:
+    """One uploaded file (or batch) being extracted in the background."""
+
+    def __init__(self, session_id, name):
+        self.id = f"{WORKER_ID}-{uuid.uuid4().hex}"
+        self.session_id = session_id
+        self.name = name
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.size = 0
+        self.created = time.time()
+        self.updated = self.created
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def as_dict(self):
+        info = {'doc_id': self.id, 'name': self.name, 'status': self.status, 'error': self.error}
+        if self.result is not None:
+            info['file_type'] = self.result.get('file_type')
+            info['files'] = self.result.get('files')
+        return info
+
+def estimate_size(value):
+    """Rough bytes held by a job result: strings, bytes and images, through dicts and lists."""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    if hasattr(value, "getbands") and hasattr(value, "size"):
+        width, height = value.size
+        return width * height * len(value.getbands())
+    return 0
+
+class UploadJobQueue:
+    """
+    Runs extraction jobs on a bounded thread pool and tracks their status so
+    request handlers can return immediately and clients can poll or stream
+    readiness. Finished jobs expire after `ttl` seconds, and the oldest are
+    dropped early once more than `max_retained` jobs or `max_bytes` of
+    extracted content are held.
+    """
+
+    def __init__(self, workers, max_pending, ttl, max_retained=UPLOAD_JOB_MAX_RETAINED, max_bytes=UPLOAD_JOB_MAX_BYTES):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_retained = max_retained
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload-job")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._retained_bytes = 0
+        self._cond = threading.Condition()
+
+    def submit(self, session_id, name, func, *args):
+        """
+        Queue func(*args) for an upload. func returns the job result (a dict)
+        or raises. Returns the job, or None when the queue is full.
+        """
+        with self._cond:
+            self._expire()
+            if self._pending >= self.max_pending:
+                return None
+            job = UploadJob(session_id, name)
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        self._set_status(job, 'processing')
+        try:
+            result = func(*args)
+            size = estimate_size(result)
+            with self._cond:
+                job.result = result
+                job.size = size
+                if job.id in self._jobs:
+                    self._retained_bytes += size
+            self._set_status(job, 'ready')
+        except Exception as e:
+            print(f" Upload job {job.id[:8]} ({job.name}) failed: {e}")
+            self._set_status(job, 'error', str(e))
+        finally:
+            with self._cond:
+                self._pending -= 1
+                self._expire()
+
+    def _set_status(self, job, status, error=None):
+        with self._cond:
+            job.status = status
+            job.error = error
+            job.updated = time.time()
+            self._cond.notify_all()
+        print(f" Upload job {job.id[:8]} ({job.name}): {status}")
+
+    def get(self, doc_id, session_id):
+        """The job, if it exists and belongs to the session."""
+        with self._cond:
+            job = self._jobs.get(doc_id)
+        return job if job is not None and job.session_id == session_id else None
+
+    def is_local(self, doc_id):
+        """Whether the document ID was issued by this worker (an unknown local ID has expired)."""
+        return doc_id.split("-", 1)[0] == WORKER_ID
+
+    def wait_for_change(self, job, last_status, timeout):
+        """Block until the job's status differs from `last_status` (or timeout); return the status."""
+        with self._cond:
+            self._cond.wait_for(lambda: job.status != last_status, timeout)
+            return job.status
+
+    def discard(self, doc_ids):
+        """Forget jobs, e.g. the rest of a batch that could not be queued in full."""
+        with self._cond:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def clear_session(self, session_id):
+        with self._cond:
+            for doc_id in [doc_id for doc_id, job in self._jobs.items() if job.session_id == session_id]:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        job = self._jobs.pop(doc_id, None)
+        if job is not None:
+            self._retained_bytes -= job.size
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for doc_id in [doc_id for doc_id, job in self._jobs.items() if job.finished and job.updated < cutoff]:
+            self._remove(doc_id)
+        finished = [doc_id for doc_id, job in self._jobs.items() if job.finished]
+        # Jobs are kept in submission order, so the oldest finished ones go first
+        while finished and (len(finished) > self.max_retained or self._retained_bytes > self.max_bytes):
+            self._remove(finished.pop(0))
+
+    def stats(self):
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'pending': self._pending, 'max_pending': self.max_pending, 'jobs': counts,
+                    'retained_bytes': self._retained_bytes, 'max_bytes': self.max_bytes}
+
+upload_jobs = UploadJobQueue(UPLOAD_JOB_WORKERS, UPLOAD_JOB_MAX_PENDING, UPLOAD_JOB_TTL)